@@ -5,6 +5,8 @@ import csv
 import numpy as np
 import os
 import re
+from nest_elephant_tvb.translation.spike_codec import load_populations, load_spikes, save_spikes
+from nest_elephant_tvb.translation.spike_store import read_spikes
 
 # import data generate by Nest
 def import_data_file(path):
@@ -60,6 +62,10 @@ def get_data(label,path):
     :param path: the folder of recorded file
     :return: data of the recorder
     """
+    if os.path.exists(path+label+'.spk'):
+        # spike recorder encoded by compress_data_spike
+        detectors, neurons, times = load_spikes(path+label+'.spk')
+        return ('senders','times'),np.array([neurons,times])
     regex = re.compile(label+'\-\w*\-\w*\.dat')
     data_list = []
     for root, dirs, files in os.walk(path):
@@ -78,6 +84,34 @@ def get_data(label,path):
                data_concatenate[i] = np.concatenate((data_concatenate[i], data[name]))
     return field,np.array(data_concatenate)
 
+def compress_data_spike(label,path,resolution,level=1):
+    """
+    encode the files of one spike recorder of Nest in one file label.spk (see spike_codec)
+    the neurons are encoded by their position in the populations of population_GIDs.dat if the file exists
+    :param label: the label of the recorder
+    :param path: the folder of recorded file
+    :param resolution: the resolution of the simulation in ms
+    :param level: the level of compression of zlib
+    :return: the size of the ascii files and the size of the encoded file in bytes
+    """
+    regex = re.compile(label+'\-\w*\-\w*\.dat')
+    size = sum([os.path.getsize(path+file) for file in os.listdir(path) if regex.match(file)])
+    field, data = get_data(label,path)
+    populations = load_populations(path+'population_GIDs.dat') if os.path.exists(path+'population_GIDs.dat') else None
+    save_spikes(path+label+'.spk',np.zeros(data[0].shape[0]),data[0],data[1],resolution,populations,level)
+    return size, os.path.getsize(path+label+'.spk')
+
+def get_data_store(path,t_start=None,t_stop=None):
+    """
+    get the spikes of a store of the translator for recording (nest_save_hist) and reorder them
+    :param path: the folder of the store
+    :param t_start: (optional) the beginning of the time in ms
+    :param t_stop: (optional) the end of the time in ms
+    :return: the ids of the neurons and their spikes
+    """
+    detectors, neurons, times = read_spikes(path,t_start,t_stop)
+    return reorder_data_spike_detector([neurons,times])
+
 def reorder_data_multimeter(data):
     """
     Order the data of multimeter
@@ -24,7 +24,8 @@ param_co_simulation={
     # level of log : debug 0, info 1, warning 2, error 3, critical 4
     'level_log':1,
     # if running in cluster:
-    'cluster':False
+    'cluster':False,
+    # 'translation_current': param_TR_tvb_to_nest['function_select'] == 3 # step current generators in place of spike generators
 }
 
 #parameter simulators
@@ -201,6 +202,20 @@ param_tvb_integrator = {
 param_tvb_model={
     #order of the model
     'order':2,
+    # (optional) derivatives of the transfer function for the order 2 : 'numerical' (default) or 'analytic'
+    # 'derivative_TF':'numerical',
+    # (optional) number of nodes from which the order 1 is computed in parallel (threads of numba, default 512)
+    # 'nb_node_parallel':512,
+    # (optional) transfer function precomputed in a table for the order 1 (default False)
+    # 'TF_table':False,
+    # (optional) range of the table : maximal firing rate in KHz and range of the adaptation in pA
+    # 'TF_table_rate':0.2,
+    # 'TF_table_W':[0.0,500.0],
+    # (optional) maximal error of the table in KHz and maximal number of points by dimension
+    # 'TF_table_tolerance':1e-3,
+    # 'TF_table_max_points':257,
+    # (optional) folder for reusing the tables between simulations
+    # 'TF_table_path':path+'/TF_table/',
     # 'g_L':param_nest_topology['param_neuron_excitatory']['g_L']
     # 'E_L_e':param_nest_topology['param_neuron_excitatory']['E_L']
     # 'E_L_i':param_nest_topology['param_neuron_inhibitory']['E_L']
@@ -262,6 +277,14 @@ param_TR_nest_to_tvb={
     # 'width': param_zerlaut['T']
     # 'nb_neurons' : param_nest_topology['nb_neuron_by_region'] * (1-param_nest_topology['percentage_inhibitory']) # number of excitatory neurons
     # 'level_log': param_co_simulation['level_log']
+    # 'hist_ids': (optional) first id of each group for computing one histogram by spike detector or by population
+    # 'hist_column': (optional) column of the event use for the group : 0 id of spike detector (default), 1 id of neurons
+    # 'nb_slot': (optional) number of simulation steps of Nest which can be buffered by the translator (default 2)
+    # 'multiplex': (optional) one translator for all the spike detectors, the rates of all the regions are sent together to TVB (default False)
+    # 'nb_receiver': (optional) number of MPI ranks of the translator receiving from Nest (default 1)
+    #                more than 1 only with 'modulo_routing' : the MPI recording backend of NEST sends all its ranks to the rank 0
+    # 'modulo_routing': (optional) the sender sends from its rank s to the rank s % nb_receiver, not the case of the MPI recording backend of NEST (default False)
+    # 'nb_MPI': (optional) number of MPI ranks of the translator : nb_receiver receiving + the ranks for the analysis (default nb_receiver+1)
 }
 
 # Parameters for the translator TVB to Nest
@@ -272,13 +295,26 @@ param_TR_tvb_to_nest={
     # 'nb_synapses' : param_nest_connection['nb_external_synapse'] # number of external synapses
     # 'init': path of the initialisation of the translation if not the run exploration will create it
     # 'level_log': param_co_simulation['level_log']
+    # 'resolution': param_nest['sim_resolution'] # the spike times are rounded to the resolution
+    # 'multiplex': (optional) one translator for all the proxy regions, TVB sends the rates of all the regions together (default False)
+    # 'nb_slot': (optional) depth of the queue of the translator : number of steps of TVB in advance of Nest (default 2)
+    # 'nb_worker': (optional) number of threads for the generation of the spike trains (default 1)
+    # 'block_size': (optional) number of spike generators by random stream, the spike trains don't depend on nb_worker (default 64)
+    # 'weight', 'tau_syn', 'E_rev', 'E_L': param_nest_connection['weight_global'] and param_neuron_excitatory (only for the current)
+    # function of translation : 1 Single Interaction Process, 2 Multiple Interaction Process, 3 mean current (step current generators)
     'function_select':2
 }
 
 # Parameters for the module of saving by MPI
 param_record_MPI={
-    # save step
+    # number of steps of synchronization between two writings of the store of spikes on the disk (0 : only by chunk)
     'save_step': 0,
+    # 'chunk_size': (optional) number of spike events by file of the store (default 1048576)
+    # 'queue_size': (optional) number of steps waiting for the writer thread (default 8)
+    # 'policy': (optional) when the queue is full : 'block' wait the writer (and Nest), 'drop' lose the step (default 'block')
+    # 'codec_level': (optional) the full chunks are delta encoded and compressed with this level of zlib, 0 without compression (default None : no encoding)
+    # 'mode': (optional) 'spikes' record all the spikes, 'statistics' only the rates, cv of ISI, Fano factor and synchrony of each population (default 'spikes')
+    # 'stat_bin': (optional) width of the bins for the rates and the synchrony in ms (default param_nest['sim_resolution'])
     # 'init': path of the initialisation of the translation if not the run exploration will create it
     # 'resolution': param_nest['sim_resolution']
     # 'synch': param_co_simulation['synchronization']
@@ -434,7 +434,24 @@ def network_device(results_path,dic_layer,min_time,time_simulation,param_backgro
 
     #Connection proxy to each neurons
     spike_generator=[]
-    if cosimulation is not None and cosimulation['co-simulation']:
+    translation_current = cosimulation['translation_current'] if cosimulation is not None and 'translation_current' in cosimulation.keys() else False
+    if cosimulation is not None and cosimulation['co-simulation'] and translation_current:
+        # one step current generator by population : the translator sends the mean current of the external input
+        param_current_gen= {'stimulus_source': 'mpi',
+                            'label': '../translation/spike_generator'
+                            }
+        nest.CopyModel('step_current_generator', 'step_current_generator_mpi')
+        nest.SetDefaults("step_current_generator_mpi", param_current_gen)
+        for i in range(len(cosimulation['id_region_nest'])):
+            step_current_generator_mpi = nest.Create('step_current_generator_mpi',len(dic_layer))
+            spike_generator.append(step_current_generator_mpi)
+            for index,name in enumerate(dic_layer.keys()):
+                nest.Connect(step_current_generator_mpi[index:index+1],dic_layer[name]['list'][i]['region'],syn_spec={
+                                               "weight":1.0,
+                                               "delay":nest.GetKernelStatus("min_delay"),
+                                               },
+                             )
+    elif cosimulation is not None and cosimulation['co-simulation']:
         param_spike_gen= {"start": 0.0,
                       "stop": time_simulation,
                       'stimulus_source': 'mpi',
@@ -8,7 +8,9 @@ Mean field model based on Master equation about adaptative exponential leacky in
 from tvb.simulator.models.base import Model,numpy
 import scipy.special as sp_spec
 from tvb.basic.neotraits.api import NArray, Range, Final, List
-from numba import jit
+from numba import jit, prange
+import math
+from nest_elephant_tvb.Tvb.modify_tvb.Zerlaut_table import TransferFunctionTable, _lookup_point
 
 class ZerlautAdaptationFirstOrder(Model):
     r"""
@@ -323,6 +325,27 @@ class ZerlautAdaptationFirstOrder(Model):
         doc="""external drive""",
         )
 
+    # Options of the computation, not parameters of the model
+    # (not traits : the simulator of TVB reshapes all the traits of the model by node)
+    # from this number of nodes, the compiled dfun of the first order is computed in parallel over the nodes
+    # (the number of threads is the number of threads of numba, see NUMBA_NUM_THREADS)
+    nb_node_parallel = 512
+    # the transfer function is precomputed on a grid when the model is configured and evaluated with
+    # multilinear interpolation (only for the first order and the same parameters of the transfer function
+    # for all the nodes, ex : the realizations of an ensemble which differ by the adaptation)
+    TF_table = False
+    # maximal firing rate of the populations and of the external inputs in the table in KHz
+    # (outside the table the transfer function is computed)
+    TF_table_rate = 0.2
+    # minimum and maximum of the adaptation in the table in pA
+    TF_table_W = numpy.array([0.0, 500.0])
+    # maximal error of the interpolation of the transfer function in KHz
+    TF_table_tolerance = 1e-3
+    # maximal number of points by dimension of the table
+    TF_table_max_points = 257
+    # folder where the tables are saved and reused by the simulations with the same parameters
+    TF_table_path = None
+
     # Used for phase-plane axis ranges and to bound random initial() conditions.
     state_variable_range = Final(
         label="State Variable ranges [lo, hi]",
@@ -362,6 +385,8 @@ class ZerlautAdaptationFirstOrder(Model):
     state_variables = 'E I W_e W_i'.split()
     _nvar = 4
     cvar = numpy.array([0], dtype=numpy.int32)
+    _TF_table_e = None
+    _TF_table_i = None
 
     def dfun(self, state_variables, coupling, local_coupling=0.00):
         r"""
@@ -369,6 +394,43 @@ class ZerlautAdaptationFirstOrder(Model):
             T \dot{\nu_\mu} &= -F_\mu(\nu_e,\nu_i) + \nu_\mu ,\all\mu\in\{e,i\}\\
             dot{W}_k &= W_k/tau_w-b*E_k  \\
 
+        """
+        parameters = self._kernel_parameters(state_variables, local_coupling)
+        if parameters is None:
+            return self._numpy_dfun(state_variables, coupling, local_coupling)
+        if self._TF_table_e is not None:
+            tables = (True, self._TF_table_e.table, self._TF_table_e.ranges, self._TF_table_e.scales,
+                      self._TF_table_i.table, self._TF_table_i.ranges, self._TF_table_i.scales)
+        else:
+            tables = (False,) + _NO_TABLE + _NO_TABLE
+        derivative = numpy.empty_like(state_variables)
+        if state_variables.shape[1] >= self.nb_node_parallel:
+            kernel = _numba_dfun_first_order_parallel
+        else:
+            kernel = _numba_dfun_first_order
+        kernel(state_variables, coupling, float(local_coupling), numpy.ravel(self.P_e), numpy.ravel(self.P_i),
+               *tables, derivative, *parameters)
+        return derivative
+
+    def _kernel_parameters(self, state_variables, local_coupling):
+        """
+        the parameters of the model for the compiled kernels of dfun
+        :param state_variables: state variables (nvar, nodes, modes)
+        :param local_coupling: local coupling
+        :return: the parameters of _PARAMETERS (one value or one value by node)
+                 or None if the kernel can't be used (local coupling not scalar or parameters not by node)
+        """
+        if not numpy.isscalar(local_coupling) or state_variables.ndim != 3:
+            return None
+        parameters = [numpy.ravel(getattr(self, name)) for name in _PARAMETERS]
+        if any(parameter.shape[0] != 1 and parameter.shape[0] != state_variables.shape[1] for parameter in parameters):
+            return None
+        return parameters
+
+    def _numpy_dfun(self, state_variables, coupling, local_coupling=0.00):
+        """
+        reference implementation of dfun with numpy
+        (use when the local coupling is not a scalar or the parameters are not by node)
         """
         E = state_variables[0, :]
         I = state_variables[1, :]
@@ -404,7 +466,7 @@ class ZerlautAdaptationFirstOrder(Model):
                 W_e, self.Q_e, self.tau_e, self.E_e,
                 self.Q_i, self.tau_i, self.E_i,
                 self.g_L, self.C_m, self.E_L_e, self.N_tot,
-                self.p_connect, self.g,self.K_ext_e,self.K_ext_i)
+                self.p_connect_e, self.p_connect_i, self.g,self.K_ext_e,self.K_ext_i)
         derivative[2] = -W_e/self.tau_w_e+self.b_e*E+self.a_e*(mu_V-self.E_L_e)/self.tau_w_e
         # Adaptation inhibitory
         mu_V, sigma_V, T_V = self.get_fluct_regime_vars(
@@ -413,7 +475,7 @@ class ZerlautAdaptationFirstOrder(Model):
                 W_i, self.Q_e, self.tau_e, self.E_e,
                 self.Q_i, self.tau_i, self.E_i,
                 self.g_L, self.C_m, self.E_L_i, self.N_tot,
-                self.p_connect, self.g,self.K_ext_e,self.K_ext_i)
+                self.p_connect_e, self.p_connect_i, self.g,self.K_ext_e,self.K_ext_i)
         derivative[3] = -W_i/self.tau_w_i+self.b_i*I+self.a_i*(mu_V-self.E_L_i)/self.tau_w_i
 
         return derivative
@@ -428,6 +490,8 @@ class ZerlautAdaptationFirstOrder(Model):
         :param W: level of adaptation
         :return: result of transfer function
         """
+        if self._TF_table_e is not None:
+            return self._TF_tabulated(self._TF_table_e, fe, fi, fe_ext, fi_ext, W)
         return self.TF(fe, fi, fe_ext, fi_ext, W, self.P_e, self.E_L_e)
 
     def TF_inhibitory(self, fe, fi, fe_ext, fi_ext, W):
@@ -440,8 +504,81 @@ class ZerlautAdaptationFirstOrder(Model):
         :param W: level of adaptation
         :return: result of transfer function
         """
+        if self._TF_table_i is not None:
+            return self._TF_tabulated(self._TF_table_i, fe, fi, fe_ext, fi_ext, W)
         return self.TF(fe, fi, fe_ext, fi_ext, W, self.P_i, self.E_L_i)
 
+    def update_derived_parameters(self):
+        """
+        precompute the tables of the transfer functions
+        """
+        super(ZerlautAdaptationFirstOrder, self).update_derived_parameters()
+        self._TF_table_e = None
+        self._TF_table_i = None
+        if self.TF_table:
+            self._TF_table_e = self._build_TF_table(self.P_e, self.E_L_e)
+            self._TF_table_i = self._build_TF_table(self.P_i, self.E_L_i)
+
+    def _build_TF_table(self, P, E_L):
+        """
+        table of a transfer function
+        :param P: Polynome of neurons phenomenological threshold (order 9)
+        :param E_L: leak reversal potential
+        :return: the table
+        """
+        names = ['Q_e', 'tau_e', 'E_e', 'Q_i', 'tau_i', 'E_i', 'g_L', 'C_m', 'N_tot', 'p_connect_e', 'p_connect_i',
+                 'g', 'K_ext_e', 'K_ext_i']
+        # the parameters can be given by node but need to be equal
+        parameters = {name: numpy.unique(getattr(self, name)).tolist() for name in names}
+        if any(len(value) != 1 for value in parameters.values()) or numpy.unique(E_L).size != 1:
+            raise Exception('the table of the transfer function needs the same parameters for all the nodes')
+        parameters['P'] = numpy.ravel(P).tolist()
+        parameters['E_L'] = numpy.unique(E_L).tolist()
+        g = parameters['g'][0]
+        N_e = (1.-g)*parameters['p_connect_e'][0]*parameters['N_tot'][0]
+        N_i = g*parameters['p_connect_i'][0]*parameters['N_tot'][0]
+        rate = self.TF_table_rate
+        # range of the total input (see get_fluct_regime_vars)
+        range_fe = [1.0e-6*N_e, (rate+1.0e-6)*N_e + rate*parameters['K_ext_e'][0]]
+        range_fi = [1.0e-6*N_i, (rate+1.0e-6)*N_i + rate*parameters['K_ext_i'][0]]
+
+        def function(fe, fi, W):
+            return self.TF_input(fe, fi, W, P, E_L)
+        return TransferFunctionTable(function, range_fe, range_fi, self.TF_table_W, self.TF_table_tolerance,
+                                     self.TF_table_max_points, self.TF_table_path, parameters)
+
+    def _TF_tabulated(self, table, fe, fi, fe_ext, fi_ext, W):
+        """
+        transfer function from a table
+        :param table: the table of the transfer function
+        other parameters : see TF_excitatory
+        :return: result of transfer function
+        """
+        # total input (see get_fluct_regime_vars)
+        fe_total = (fe+1.0e-6)*(1.-self.g)*self.p_connect_e*self.N_tot + fe_ext*self.K_ext_e
+        fi_total = (fi+1.0e-6)*self.g*self.p_connect_i*self.N_tot + fi_ext*self.K_ext_i
+        return table(fe_total, fi_total, W)
+
+    def TF_input(self, fe_total, fi_total, W, P, E_L):
+        """
+        transfer function of the total excitatory and inhibitory inputs
+        :param fe_total: total excitatory input
+        :param fi_total: total inhibitory input
+        :param W: level of adaptation
+        :param P: Polynome of neurons phenomenological threshold (order 9)
+        :param E_L: leak reversal potential
+        :return: result of transfer function
+        """
+        # the firing rates of the populations are null and the inputs are external with one synapse
+        mu_V, sigma_V, T_V = self.get_fluct_regime_vars(-1.0e-6, -1.0e-6, fe_total, fi_total, W, self.Q_e, self.tau_e,
+                                                        self.E_e, self.Q_i, self.tau_i, self.E_i,
+                                                        self.g_L, self.C_m, E_L, self.N_tot,
+                                                        self.p_connect_e, self.p_connect_i, self.g, 1.0, 1.0)
+        V_thre = self.threshold_func(mu_V, sigma_V, T_V*self.g_L/self.C_m,
+                                     P[0], P[1], P[2], P[3], P[4], P[5], P[6], P[7], P[8], P[9])
+        V_thre *= 1e3  # the threshold need to be in mv and not in Volt
+        return self.estimate_firing_rate(mu_V, sigma_V, T_V, V_thre)
+
     def TF(self, fe, fi, fe_ext, fi_ext, W, P, E_L):
         """
         transfer function for inhibitory population
@@ -644,6 +781,24 @@ class ZerlautAdaptationSecondOrder(ZerlautAdaptationFirstOrder):
     state_variables = 'E I C_ee C_ei C_ii W_e W_i'.split()
     _nvar = 7
 
+    def update_derived_parameters(self):
+        """
+        check the options : the transfer function is not tabulated because the derivatives need the exact
+        transfer function
+        """
+        if self.derivative_TF != 'numerical' and self.derivative_TF != 'analytic':
+            raise Exception('unknown derivatives of the transfer function : '+str(self.derivative_TF))
+        if self.TF_table:
+            raise Exception('the table of the transfer function is only for the first order model')
+        super(ZerlautAdaptationSecondOrder, self).update_derived_parameters()
+
+    # Option of the computation : derivatives of the transfer function
+    # (not a trait : the simulator of TVB reshapes all the traits of the model by node)
+    # 'numerical' : central differences of the transfer function,
+    # 'analytic' : exact derivatives of the transfer function by the chain rule
+    # (only for the compiled dfun, the reference _numpy_dfun uses always the central differences)
+    derivative_TF = 'numerical'
+
     def dfun(self, state_variables, coupling, local_coupling=0.00):
         r"""
         .. math::
@@ -672,6 +827,19 @@ class ZerlautAdaptationSecondOrder(ZerlautAdaptationFirstOrder):
             \end{split}
             \right.
 
+        """
+        parameters = self._kernel_parameters(state_variables, local_coupling)
+        if parameters is None:
+            return self._numpy_dfun(state_variables, coupling, local_coupling)
+        derivative = numpy.empty_like(state_variables)
+        _numba_dfun_second_order(state_variables, coupling, float(local_coupling), numpy.ravel(self.P_e),
+                                 numpy.ravel(self.P_i), self.derivative_TF == 'analytic', derivative, *parameters)
+        return derivative
+
+    def _numpy_dfun(self, state_variables, coupling, local_coupling=0.00):
+        """
+        reference implementation of dfun with numpy
+        (use when the local coupling is not a scalar or the parameters are not by node)
         """
         #number of neurons
         N_e = self.N_tot * (1-self.g)
@@ -801,3 +969,386 @@ class ZerlautAdaptationSecondOrder(ZerlautAdaptationFirstOrder):
 
         return derivative
 
+
+
+# ########################################### Fused kernels ########################################################
+# All the derivatives of the models computed node by node in one compiled kernel
+
+# parameters of the model given to the kernel : one value or one value by node
+_PARAMETERS = ['g_L', 'E_L_e', 'E_L_i', 'C_m', 'b_e', 'a_e', 'b_i', 'a_i', 'tau_w_e', 'tau_w_i', 'E_e', 'E_i',
+               'Q_e', 'Q_i', 'tau_e', 'tau_i', 'N_tot', 'p_connect_e', 'p_connect_i', 'g', 'K_ext_e', 'K_ext_i', 'T',
+               'external_input_ex_ex', 'external_input_ex_in', 'external_input_in_ex', 'external_input_in_in']
+
+_get_fluct_regime_vars = ZerlautAdaptationFirstOrder.get_fluct_regime_vars
+_threshold_func = ZerlautAdaptationFirstOrder.threshold_func
+# table, ranges and scales given to the kernel of the first order without table of the transfer function
+_NO_TABLE = (numpy.zeros((1, 1, 1)), numpy.zeros((3, 2)), numpy.zeros(3))
+
+
+@jit(nopython=True, cache=True)
+def _value(parameter, node):
+    """
+    value of a parameter for a node
+    :param parameter: array of one value or of one value by node
+    :param node: index of the node
+    :return: the value of the parameter
+    """
+    return parameter[0] if parameter.shape[0] == 1 else parameter[node]
+
+
+@jit(nopython=True, cache=True)
+def _TF_node(fe, fi, fe_ext, fi_ext, W, Q_e, tau_e, E_e, Q_i, tau_i, E_i, g_L, C_m, E_L, N_tot,
+             p_connect_e, p_connect_i, g, K_ext_e, K_ext_i, P):
+    """
+    transfer function for one node (same as ZerlautAdaptationFirstOrder.TF)
+    :param P: Polynome of neurons phenomenological threshold (order 9)
+    other parameters : see ZerlautAdaptationFirstOrder.get_fluct_regime_vars
+    :return: result of transfer function
+    """
+    mu_V, sigma_V, T_V = _get_fluct_regime_vars(fe, fi, fe_ext, fi_ext, W, Q_e, tau_e, E_e, Q_i, tau_i, E_i,
+                                                g_L, C_m, E_L, N_tot, p_connect_e, p_connect_i, g, K_ext_e, K_ext_i)
+    return _TF_fluct(mu_V, sigma_V, T_V, g_L, C_m, P)
+
+
+@jit(nopython=True, cache=True)
+def _TF_fluct(mu_V, sigma_V, T_V, g_L, C_m, P):
+    """
+    transfer function for one node from the mean characteristic of neurons
+    :param mu_V: mean of membrane voltage
+    :param sigma_V: variance of membrane voltage
+    :param T_V: autocorrelation time constant
+    :param g_L: leak conductance
+    :param C_m: membrane capacitance
+    :param P: Polynome of neurons phenomenological threshold (order 9)
+    :return: result of transfer function
+    """
+    V_thre = _threshold_func(mu_V, sigma_V, T_V*g_L/C_m, P[0], P[1], P[2], P[3], P[4], P[5], P[6], P[7], P[8], P[9])
+    V_thre *= 1e3  # the threshold need to be in mv and not in Volt
+    return math.erfc((V_thre-mu_V) / (numpy.sqrt(2)*sigma_V)) / (2*T_V)
+
+
+def _dfun_first_order(state_variables, coupling, local_coupling, P_e, P_i,
+                      tabulated, table_e, ranges_e, scales_e, table_i, ranges_i, scales_i, derivative,
+                      g_L, E_L_e, E_L_i, C_m, b_e, a_e, b_i, a_i, tau_w_e, tau_w_i, E_e, E_i,
+                      Q_e, Q_i, tau_e, tau_i, N_tot, p_connect_e, p_connect_i, g, K_ext_e, K_ext_i, T,
+                      external_input_ex_ex, external_input_ex_in, external_input_in_ex, external_input_in_in):
+    """
+    derivatives of ZerlautAdaptationFirstOrder in one pass over the nodes, without temporary arrays
+    The mean characteristic of the neurons of each population are computed once for the transfer function
+    and the adaptation.
+    :param tabulated: the transfer functions are interpolated in the tables
+    :param table_e: table of the excitatory transfer function (see TransferFunctionTable)
+    :param ranges_e: ranges of the axes of table_e
+    :param scales_e: inverse of the width of the axes of table_e
+    :param table_i: table of the inhibitory transfer function
+    :param ranges_i: ranges of the axes of table_i
+    :param scales_i: inverse of the width of the axes of table_i
+    other parameters : see _numba_dfun_second_order
+    """
+    for node in prange(state_variables.shape[1]):
+        # parameters of the node
+        _g_L, _C_m, _E_e, _E_i = _value(g_L, node), _value(C_m, node), _value(E_e, node), _value(E_i, node)
+        _E_L_e, _E_L_i = _value(E_L_e, node), _value(E_L_i, node)
+        _Q_e, _Q_i, _tau_e, _tau_i = _value(Q_e, node), _value(Q_i, node), _value(tau_e, node), _value(tau_i, node)
+        _N_tot, _g = _value(N_tot, node), _value(g, node)
+        _p_connect_e, _p_connect_i = _value(p_connect_e, node), _value(p_connect_i, node)
+        _K_ext_e, _K_ext_i = _value(K_ext_e, node), _value(K_ext_i, node)
+        _T = _value(T, node)
+        for mode in range(state_variables.shape[2]):
+            E = state_variables[0, node, mode]
+            I = state_variables[1, node, mode]
+            W_e = state_variables[2, node, mode]
+            W_i = state_variables[3, node, mode]
+
+            # long-range coupling and short-range (local) coupling
+            c_0 = coupling[0, node, mode]
+            lc_E = local_coupling * E
+            lc_I = local_coupling * I
+
+            # external firing rate
+            Fe_ext = c_0 + lc_E
+            Fi_ext = lc_I
+
+            # Excitatory firing rate derivation and adaptation excitatory
+            mu_V, sigma_V, T_V = _get_fluct_regime_vars(
+                E, I, Fe_ext+_value(external_input_ex_ex, node), Fi_ext+_value(external_input_ex_in, node),
+                W_e, _Q_e, _tau_e, _E_e, _Q_i, _tau_i, _E_i, _g_L, _C_m, _E_L_e, _N_tot,
+                _p_connect_e, _p_connect_i, _g, _K_ext_e, _K_ext_i)
+            TF = numpy.nan
+            if tabulated:
+                # total input (see get_fluct_regime_vars)
+                TF = _lookup_point(table_e, ranges_e, scales_e,
+                                   (E+1.0e-6)*(1.-_g)*_p_connect_e*_N_tot
+                                   + (Fe_ext+_value(external_input_ex_ex, node))*_K_ext_e,
+                                   (I+1.0e-6)*_g*_p_connect_i*_N_tot
+                                   + (Fi_ext+_value(external_input_ex_in, node))*_K_ext_i, W_e)
+            if numpy.isnan(TF):
+                TF = _TF_fluct(mu_V, sigma_V, T_V, _g_L, _C_m, P_e)
+            derivative[0, node, mode] = (TF-E)/_T
+            derivative[2, node, mode] = (-W_e/_value(tau_w_e, node)+_value(b_e, node)*E
+                                         + _value(a_e, node)*(mu_V-_E_L_e)/_value(tau_w_e, node))
+            # Inhibitory firing rate derivation and adaptation inhibitory
+            mu_V, sigma_V, T_V = _get_fluct_regime_vars(
+                E, I, Fe_ext+_value(external_input_in_ex, node), Fi_ext+_value(external_input_in_in, node),
+                W_i, _Q_e, _tau_e, _E_e, _Q_i, _tau_i, _E_i, _g_L, _C_m, _E_L_i, _N_tot,
+                _p_connect_e, _p_connect_i, _g, _K_ext_e, _K_ext_i)
+            TF = numpy.nan
+            if tabulated:
+                TF = _lookup_point(table_i, ranges_i, scales_i,
+                                   (E+1.0e-6)*(1.-_g)*_p_connect_e*_N_tot
+                                   + (Fe_ext+_value(external_input_in_ex, node))*_K_ext_e,
+                                   (I+1.0e-6)*_g*_p_connect_i*_N_tot
+                                   + (Fi_ext+_value(external_input_in_in, node))*_K_ext_i, W_i)
+            if numpy.isnan(TF):
+                TF = _TF_fluct(mu_V, sigma_V, T_V, _g_L, _C_m, P_i)
+            derivative[1, node, mode] = (TF-I)/_T
+            derivative[3, node, mode] = (-W_i/_value(tau_w_i, node)+_value(b_i, node)*I
+                                         + _value(a_i, node)*(mu_V-_E_L_i)/_value(tau_w_i, node))
+
+
+# sequential kernel for the small networks and parallel kernel over the nodes for the large networks
+_numba_dfun_first_order = jit(nopython=True, cache=True)(_dfun_first_order)
+_numba_dfun_first_order_parallel = jit(nopython=True, cache=True, parallel=True)(_dfun_first_order)
+
+
+@jit(nopython=True, cache=True)
+def _TF_derivatives(fe, fi, fe_ext, fi_ext, W, Q_e, tau_e, E_e, Q_i, tau_i, E_i, g_L, C_m, E_L, N_tot,
+                    p_connect_e, p_connect_i, g, K_ext_e, K_ext_i, P, analytic, df=1e-7):
+    """
+    transfer function and its derivatives for one node : central differences
+    (same as ZerlautAdaptationSecondOrder._numpy_dfun : 9 evaluations of the transfer function),
+    or the exact derivatives of _TF_derivatives_analytic when analytic is set
+    :param analytic: use the exact derivatives instead of the central differences
+    :param df: step of the central differences (not used with the exact derivatives)
+    other parameters : see _TF_node
+    :return: transfer function, first derivatives by fe and fi,
+             second derivatives by fe fe, by fi fi and the sum of the two cross derivatives
+    """
+    if analytic:
+        return _TF_derivatives_analytic(fe, fi, fe_ext, fi_ext, W, Q_e, tau_e, E_e, Q_i, tau_i, E_i, g_L, C_m, E_L,
+                                        N_tot, p_connect_e, p_connect_i, g, K_ext_e, K_ext_i, P)
+    TF_0 = _TF_node(fe, fi, fe_ext, fi_ext, W, Q_e, tau_e, E_e, Q_i, tau_i, E_i, g_L, C_m, E_L, N_tot,
+                    p_connect_e, p_connect_i, g, K_ext_e, K_ext_i, P)
+    TF_p0 = _TF_node(fe+df, fi, fe_ext, fi_ext, W, Q_e, tau_e, E_e, Q_i, tau_i, E_i, g_L, C_m, E_L, N_tot,
+                     p_connect_e, p_connect_i, g, K_ext_e, K_ext_i, P)
+    TF_m0 = _TF_node(fe-df, fi, fe_ext, fi_ext, W, Q_e, tau_e, E_e, Q_i, tau_i, E_i, g_L, C_m, E_L, N_tot,
+                     p_connect_e, p_connect_i, g, K_ext_e, K_ext_i, P)
+    TF_0p = _TF_node(fe, fi+df, fe_ext, fi_ext, W, Q_e, tau_e, E_e, Q_i, tau_i, E_i, g_L, C_m, E_L, N_tot,
+                     p_connect_e, p_connect_i, g, K_ext_e, K_ext_i, P)
+    TF_0m = _TF_node(fe, fi-df, fe_ext, fi_ext, W, Q_e, tau_e, E_e, Q_i, tau_i, E_i, g_L, C_m, E_L, N_tot,
+                     p_connect_e, p_connect_i, g, K_ext_e, K_ext_i, P)
+    TF_pp = _TF_node(fe+df, fi+df, fe_ext, fi_ext, W, Q_e, tau_e, E_e, Q_i, tau_i, E_i, g_L, C_m, E_L, N_tot,
+                     p_connect_e, p_connect_i, g, K_ext_e, K_ext_i, P)
+    TF_pm = _TF_node(fe+df, fi-df, fe_ext, fi_ext, W, Q_e, tau_e, E_e, Q_i, tau_i, E_i, g_L, C_m, E_L, N_tot,
+                     p_connect_e, p_connect_i, g, K_ext_e, K_ext_i, P)
+    TF_mp = _TF_node(fe-df, fi+df, fe_ext, fi_ext, W, Q_e, tau_e, E_e, Q_i, tau_i, E_i, g_L, C_m, E_L, N_tot,
+                     p_connect_e, p_connect_i, g, K_ext_e, K_ext_i, P)
+    TF_mm = _TF_node(fe-df, fi-df, fe_ext, fi_ext, W, Q_e, tau_e, E_e, Q_i, tau_i, E_i, g_L, C_m, E_L, N_tot,
+                     p_connect_e, p_connect_i, g, K_ext_e, K_ext_i, P)
+    h = 2*df*1e3
+    diff_fe = (TF_p0-TF_m0)/h
+    diff_fi = (TF_0p-TF_0m)/h
+    diff2_fe_fe = (TF_p0-2*TF_0+TF_m0)/((df*1e3)**2)
+    diff2_fi_fi = (TF_0p-2*TF_0+TF_0m)/((df*1e3)**2)
+    diff2_fe_fi = ((TF_pp-TF_mp)/h-(TF_pm-TF_mm)/h)/h
+    diff2_fi_fe = ((TF_pp-TF_pm)/h-(TF_mp-TF_mm)/h)/h
+    return TF_0, diff_fe, diff_fi, diff2_fe_fe, diff2_fi_fi, diff2_fe_fi+diff2_fi_fe
+
+
+# Analytic derivatives : the transfer function is computed with numbers which carry their first and second
+# derivatives by fe and fi : (value, d/dfe, d/dfi, d2/dfe2, d2/dfedfi, d2/dfi2)
+
+@jit(nopython=True, cache=True)
+def _hd_add(a, b):
+    """ sum of two numbers with derivatives """
+    return (a[0]+b[0], a[1]+b[1], a[2]+b[2], a[3]+b[3], a[4]+b[4], a[5]+b[5])
+
+
+@jit(nopython=True, cache=True)
+def _hd_affine(a, scale, constant):
+    """ scale*a+constant for a number with derivatives """
+    return (scale*a[0]+constant, scale*a[1], scale*a[2], scale*a[3], scale*a[4], scale*a[5])
+
+
+@jit(nopython=True, cache=True)
+def _hd_mul(a, b):
+    """ product of two numbers with derivatives """
+    return (a[0]*b[0],
+            a[1]*b[0]+a[0]*b[1],
+            a[2]*b[0]+a[0]*b[2],
+            a[3]*b[0]+2.*a[1]*b[1]+a[0]*b[3],
+            a[4]*b[0]+a[1]*b[2]+a[2]*b[1]+a[0]*b[4],
+            a[5]*b[0]+2.*a[2]*b[2]+a[0]*b[5])
+
+
+@jit(nopython=True, cache=True)
+def _hd_function(a, f, f_1, f_2):
+    """
+    chain rule for a function of one number with derivatives
+    :param a: the number with derivatives
+    :param f: the value of the function in a
+    :param f_1: the first derivative of the function in a
+    :param f_2: the second derivative of the function in a
+    :return: the function of a with derivatives
+    """
+    return (f,
+            f_1*a[1],
+            f_1*a[2],
+            f_2*a[1]*a[1]+f_1*a[3],
+            f_2*a[1]*a[2]+f_1*a[4],
+            f_2*a[2]*a[2]+f_1*a[5])
+
+
+@jit(nopython=True, cache=True)
+def _hd_inv(a):
+    """ inverse of a number with derivatives """
+    return _hd_function(a, 1./a[0], -1./a[0]**2, 2./a[0]**3)
+
+
+@jit(nopython=True, cache=True)
+def _hd_sqrt(a):
+    """ square root of a number with derivatives """
+    s = numpy.sqrt(a[0])
+    return _hd_function(a, s, 0.5/s, -0.25/(s*a[0]))
+
+
+@jit(nopython=True, cache=True)
+def _hd_erfc(a):
+    """ complementary error function of a number with derivatives """
+    e = 2./numpy.sqrt(numpy.pi)*numpy.exp(-a[0]**2)
+    return _hd_function(a, math.erfc(a[0]), -e, 2.*a[0]*e)
+
+
+@jit(nopython=True, cache=True)
+def _TF_derivatives_analytic(fe, fi, fe_ext, fi_ext, W, Q_e, tau_e, E_e, Q_i, tau_i, E_i, g_L, C_m, E_L, N_tot,
+                             p_connect_e, p_connect_i, g, K_ext_e, K_ext_i, P):
+    """
+    transfer function and its exact derivatives for one node
+    (same equations as ZerlautAdaptationFirstOrder.get_fluct_regime_vars, threshold_func and estimate_firing_rate)
+    parameters : see _TF_node
+    :return: see _TF_derivatives
+    """
+    # firing rate : the derivatives are by firing rate in Hz (the firing rates are in KHz)
+    Fe = ((fe+1.0e-6)*(1.-g)*p_connect_e*N_tot + fe_ext*K_ext_e, (1.-g)*p_connect_e*N_tot*1e-3, 0., 0., 0., 0.)
+    Fi = ((fi+1.0e-6)*g*p_connect_i*N_tot + fi_ext*K_ext_i, 0., g*p_connect_i*N_tot*1e-3, 0., 0., 0.)
+
+    # conductance fluctuation and effective membrane time constant
+    mu_Ge, mu_Gi = _hd_affine(Fe, Q_e*tau_e, 0.), _hd_affine(Fi, Q_i*tau_i, 0.)  # Eqns 5 from [MV_2018]
+    inv_mu_G = _hd_inv(_hd_affine(_hd_add(mu_Ge, mu_Gi), 1., g_L))  # Eqns 6 from [MV_2018]
+    T_m = _hd_affine(inv_mu_G, C_m, 0.)  # Eqns 6 from [MV_2018]
+
+    # membrane potential Eqns 7 from [MV_2018]
+    mu_V = _hd_mul(_hd_affine(_hd_add(_hd_affine(mu_Ge, E_e, 0.), _hd_affine(mu_Gi, E_i, 0.)), 1., g_L*E_L-W),
+                   inv_mu_G)
+    # post-synaptic membrane potential event s around muV
+    U_e = _hd_mul(_hd_affine(mu_V, -Q_e*tau_e, Q_e*tau_e*E_e), inv_mu_G)  # U_e*tau_e
+    U_i = _hd_mul(_hd_affine(mu_V, -Q_i*tau_i, Q_i*tau_i*E_i), inv_mu_G)  # U_i*tau_i
+    A_e = _hd_mul(Fe, _hd_mul(U_e, U_e))
+    A_i = _hd_mul(Fi, _hd_mul(U_i, U_i))
+    B_e = _hd_mul(A_e, _hd_inv(_hd_affine(T_m, 1., tau_e)))
+    B_i = _hd_mul(A_i, _hd_inv(_hd_affine(T_m, 1., tau_i)))
+    # Standard deviation of the fluctuations Eqns 8 from [MV_2018]
+    sigma_V = _hd_sqrt(_hd_affine(_hd_add(B_e, B_i), 0.5, 0.))
+    # Autocorrelation-time of the fluctuations Eqns 9 from [MV_2018]
+    T_V = _hd_mul(_hd_add(A_e, A_i), _hd_inv(_hd_add(B_e, B_i)))
+
+    # threshold of neurons : normalization factors of threshold_func
+    V = _hd_affine(mu_V, 1./10.0, 60.0/10.0)
+    S = _hd_affine(sigma_V, 1./6.0, -4.0/6.0)
+    T = _hd_affine(T_V, g_L/C_m, -0.5)
+    # Eqns 11 from [MV_2018]
+    V_thre = _hd_add(_hd_add(_hd_add(_hd_affine(V, P[1], P[0]), _hd_affine(S, P[2], 0.)),
+                             _hd_add(_hd_affine(T, P[3], 0.), _hd_affine(_hd_mul(V, V), P[4], 0.))),
+                     _hd_add(_hd_add(_hd_affine(_hd_mul(S, S), P[5], 0.), _hd_affine(_hd_mul(T, T), P[6], 0.)),
+                             _hd_add(_hd_affine(_hd_mul(V, S), P[7], 0.),
+                                     _hd_add(_hd_affine(_hd_mul(V, T), P[8], 0.),
+                                             _hd_affine(_hd_mul(S, T), P[9], 0.)))))
+    V_thre = _hd_affine(V_thre, 1e3, 0.)  # the threshold need to be in mv and not in Volt
+
+    # Eqns 10 from [MV_2018]
+    x = _hd_mul(_hd_add(V_thre, _hd_affine(mu_V, -1., 0.)), _hd_inv(_hd_affine(sigma_V, numpy.sqrt(2), 0.)))
+    TF = _hd_mul(_hd_erfc(x), _hd_inv(_hd_affine(T_V, 2., 0.)))
+    return TF[0], TF[1], TF[2], TF[3], TF[5], 2.*TF[4]
+
+
+@jit(nopython=True, cache=True)
+def _numba_dfun_second_order(state_variables, coupling, local_coupling, P_e, P_i, analytic, derivative,
+                             g_L, E_L_e, E_L_i, C_m, b_e, a_e, b_i, a_i, tau_w_e, tau_w_i, E_e, E_i,
+                             Q_e, Q_i, tau_e, tau_i, N_tot, p_connect_e, p_connect_i, g, K_ext_e, K_ext_i, T,
+                             external_input_ex_ex, external_input_ex_in, external_input_in_ex, external_input_in_in):
+    """
+    derivatives of ZerlautAdaptationSecondOrder in one pass over the nodes, without temporary arrays
+    :param state_variables: state variables (nvar, nodes, modes)
+    :param coupling: coupling (ncvar, nodes, modes)
+    :param local_coupling: local coupling (scalar)
+    :param P_e: Polynome of excitatory phenomenological threshold (order 9)
+    :param P_i: Polynome of inhibitory phenomenological threshold (order 9)
+    :param analytic: exact derivatives of the transfer functions or central differences
+    :param derivative: the result (nvar, nodes, modes)
+    other parameters : parameters of the model (see _PARAMETERS)
+    """
+    for node in range(state_variables.shape[1]):
+        # parameters of the node
+        _g_L, _C_m, _E_e, _E_i = _value(g_L, node), _value(C_m, node), _value(E_e, node), _value(E_i, node)
+        _E_L_e, _E_L_i = _value(E_L_e, node), _value(E_L_i, node)
+        _Q_e, _Q_i, _tau_e, _tau_i = _value(Q_e, node), _value(Q_i, node), _value(tau_e, node), _value(tau_i, node)
+        _N_tot, _g = _value(N_tot, node), _value(g, node)
+        _p_connect_e, _p_connect_i = _value(p_connect_e, node), _value(p_connect_i, node)
+        _K_ext_e, _K_ext_i = _value(K_ext_e, node), _value(K_ext_i, node)
+        _T = _value(T, node)
+        #number of neurons
+        N_e = _N_tot * (1-_g)
+        N_i = _N_tot * _g
+        for mode in range(state_variables.shape[2]):
+            #state variable
+            E = state_variables[0, node, mode]
+            I = state_variables[1, node, mode]
+            C_ee = state_variables[2, node, mode]
+            C_ei = state_variables[3, node, mode]
+            C_ii = state_variables[4, node, mode]
+            W_e = state_variables[5, node, mode]
+            W_i = state_variables[6, node, mode]
+
+            # long-range coupling and short-range (local) coupling
+            c_0 = coupling[0, node, mode]
+            lc_E = local_coupling * E
+            lc_I = local_coupling * I
+
+            # external firing rate for the different population
+            E_input_excitatory = c_0+lc_E+_value(external_input_ex_ex, node)
+            E_input_inhibitory = c_0+lc_E+_value(external_input_in_ex, node)
+            I_input_excitatory = lc_I+_value(external_input_ex_in, node)
+            I_input_inhibitory = lc_I+_value(external_input_in_in, node)
+
+            # Transfer function of excitatory and inhibitory neurons and their derivatives
+            _TF_e, _diff_fe_TF_e, _diff_fi_TF_e, _diff2_fe_fe_e, _diff2_fi_fi_e, _diff2_cross_e = _TF_derivatives(
+                E, I, E_input_excitatory, I_input_excitatory, W_e, _Q_e, _tau_e, _E_e, _Q_i, _tau_i, _E_i,
+                _g_L, _C_m, _E_L_e, _N_tot, _p_connect_e, _p_connect_i, _g, _K_ext_e, _K_ext_i, P_e, analytic)
+            _TF_i, _diff_fe_TF_i, _diff_fi_TF_i, _diff2_fe_fe_i, _diff2_fi_fi_i, _diff2_cross_i = _TF_derivatives(
+                E, I, E_input_inhibitory, I_input_inhibitory, W_i, _Q_e, _tau_e, _E_e, _Q_i, _tau_i, _E_i,
+                _g_L, _C_m, _E_L_i, _N_tot, _p_connect_e, _p_connect_i, _g, _K_ext_e, _K_ext_i, P_i, analytic)
+
+            # Excitatory and inhibitory firing rate derivation
+            derivative[0, node, mode] = (_TF_e - E + .5*C_ee*_diff2_fe_fe_e + .5*C_ei*_diff2_cross_e
+                                         + .5*C_ii*_diff2_fi_fi_e)/_T
+            derivative[1, node, mode] = (_TF_i - I + .5*C_ee*_diff2_fe_fe_i + .5*C_ei*_diff2_cross_i
+                                         + .5*C_ii*_diff2_fi_fi_i)/_T
+            # Covariance excitatory-excitatory, excitatory-inhibitory and inhibitory-inhibitory derivation
+            derivative[2, node, mode] = (_TF_e*(1./_T-_TF_e)/N_e + (_TF_e-E)**2 + 2.*C_ee*_diff_fe_TF_e
+                                         + 2.*C_ei*_diff_fi_TF_i - 2.*C_ee)/_T
+            derivative[3, node, mode] = ((_TF_e-E)*(_TF_i-I) + C_ee*_diff_fe_TF_e + C_ei*_diff_fe_TF_i
+                                         + C_ei*_diff_fi_TF_e + C_ii*_diff_fi_TF_i - 2.*C_ei)/_T
+            derivative[4, node, mode] = (_TF_i*(1./_T-_TF_i)/N_i + (_TF_i-I)**2 + 2.*C_ii*_diff_fi_TF_i
+                                         + 2.*C_ei*_diff_fe_TF_e - 2.*C_ii)/_T
+
+            # Adaptation excitatory and inhibitory (same inputs as ZerlautAdaptationSecondOrder._numpy_dfun)
+            mu_V, sigma_V, T_V = _get_fluct_regime_vars(
+                E, I, E_input_excitatory, E_input_inhibitory, W_e, _Q_e, _tau_e, _E_e, _Q_i, _tau_i, _E_i,
+                _g_L, _C_m, _E_L_e, _N_tot, _p_connect_e, _p_connect_i, _g, _K_ext_e, _K_ext_i)
+            derivative[5, node, mode] = (-W_e/_value(tau_w_e, node)+_value(b_e, node)*E
+                                         + _value(a_e, node)*(mu_V-_E_L_e)/_value(tau_w_e, node))
+            mu_V, sigma_V, T_V = _get_fluct_regime_vars(
+                E, I, I_input_excitatory, I_input_inhibitory, W_i, _Q_e, _tau_e, _E_e, _Q_i, _tau_i, _E_i,
+                _g_L, _C_m, _E_L_i, _N_tot, _p_connect_e, _p_connect_i, _g, _K_ext_e, _K_ext_i)
+            derivative[6, node, mode] = (-W_i/_value(tau_w_i, node)+_value(b_i, node)*I
+                                         + _value(a_i, node)*(mu_V-_E_L_i)/_value(tau_w_i, node))
@@ -0,0 +1,205 @@
+#  Copyright 2020 Forschungszentrum Jülich GmbH and Aix-Marseille Université
+# "Licensed to the Apache Software Foundation (ASF) under one or more contributor license agreements; and to You under the Apache License, Version 2.0. "
+
+"""
+Tabulated transfer function of the mean field model of Zerlaut
+"""
+
+import numpy
+import os
+import json
+import hashlib
+from numba import jit
+
+
+class TransferFunctionTable:
+    def __init__(self, function, range_fe, range_fi, range_W, tolerance, max_points, path=None, parameters=None):
+        """
+        transfer function precomputed on a grid and evaluated with multilinear interpolation
+        The transfer function depends on the firing rates only by the total excitatory and inhibitory inputs
+        (see ZerlautAdaptationFirstOrder.get_fluct_regime_vars) : the grid has 3 dimensions, fe, fi and W.
+        The axes of the inputs have a quadratic spacing because the transfer function is the steepest for low inputs.
+        The grid is refined (each cell cut in two) until the error of the interpolation is lower than the tolerance.
+        The error is estimated from the error of the previous grid on the new points.
+        :param function: the transfer function of the total inputs fe, fi and of the adaptation W (vectorized)
+        :param range_fe: minimum and maximum of the total excitatory input
+        :param range_fi: minimum and maximum of the total inhibitory input
+        :param range_W: minimum and maximum of the adaptation
+        :param tolerance: the maximal error of the interpolation
+        :param max_points: the maximal number of points by axis of the grid
+        :param path: (optional) the folder for saving the table on the disk, the table is reused for the same parameters
+        :param parameters: (optional) the parameters of the transfer function which define the table on the disk
+        """
+        self.function = function
+        self.ranges = numpy.array([range_fe, range_fi, range_W], dtype=float)
+        # an axis of zero width is collapsed : all its points have the same value (ex : no inhibitory input)
+        width = self.ranges[:, 1] - self.ranges[:, 0]
+        self.scales = numpy.divide(1.0, width, out=numpy.zeros(3), where=width > 0.0)
+        self.tolerance = tolerance
+        self.max_points = int(max_points)
+        self.table = None
+        self.error = None
+        description = {'ranges': self.ranges.tolist(), 'tolerance': float(tolerance), 'max_points': self.max_points,
+                       'parameters': parameters}
+        self.key = hashlib.sha1(json.dumps(description, sort_keys=True).encode()).hexdigest()
+        if path is not None and os.path.exists(table_file(path, self.key)):
+            with numpy.load(table_file(path, self.key)) as data:
+                self.table = data['table']
+                self.error = float(data['error'])
+        else:
+            self._build()
+            if path is not None:
+                os.makedirs(path, exist_ok=True)
+                # replace the file in one operation : never a partial table for another simulation
+                numpy.savez(table_file(path, self.key) + '.tmp.npz', table=self.table, error=self.error)
+                os.replace(table_file(path, self.key) + '.tmp.npz', table_file(path, self.key))
+
+    def _axes(self, nb_points):
+        """
+        the points of the axes of the grid
+        :param nb_points: number of points by axis
+        :return: the points of each axis
+        """
+        u = numpy.linspace(0.0, 1.0, nb_points)
+        return [self.ranges[0, 0] + (self.ranges[0, 1] - self.ranges[0, 0]) * u ** 2,
+                self.ranges[1, 0] + (self.ranges[1, 1] - self.ranges[1, 0]) * u ** 2,
+                self.ranges[2, 0] + (self.ranges[2, 1] - self.ranges[2, 0]) * u]
+
+    def _compute(self, nb_points):
+        """
+        compute the transfer function on the grid, one plane of adaptation at a time for limiting the memory
+        :param nb_points: number of points by axis
+        :return: the table of the transfer function
+        """
+        fe, fi, W = self._axes(nb_points)
+        fe, fi = numpy.meshgrid(fe, fi, indexing='ij')
+        table = numpy.empty((nb_points, nb_points, nb_points))
+        for index, w in enumerate(W):
+            table[:, :, index] = self.function(fe, fi, w)
+        return table
+
+    def _build(self):
+        """
+        refine the grid until the interpolation error is lower than the tolerance
+        """
+        nb_points = 17
+        table = self._compute(nb_points)
+        while True:
+            if 2 * nb_points - 1 > self.max_points:
+                raise Exception('the transfer function table needs more than ' + str(self.max_points) +
+                                ' points by axis for an error of ' + str(self.tolerance) +
+                                ' (error ' + str(self.error) + ')')
+            nb_points = 2 * nb_points - 1
+            refine = self._compute(nb_points)
+            # the coordinates of the new grid in the old grid are the half of their index
+            coordinates = numpy.meshgrid(numpy.arange(nb_points) / 2, numpy.arange(nb_points) / 2, indexing='ij')
+            error = 0.0
+            for index in range(nb_points):
+                interpolation = interpolate(table, coordinates[0], coordinates[1],
+                                            numpy.full(coordinates[0].shape, index / 2))
+                error = max(error, float(numpy.nanmax(numpy.abs(interpolation - refine[:, :, index]))))
+            # the error of the multilinear interpolation decreases with the square of the step
+            table = refine
+            self.error = error / 4.0
+            if self.error <= self.tolerance:
+                break
+        self.table = table
+
+    def __call__(self, fe, fi, W):
+        """
+        evaluate the transfer function, outside of the grid the transfer function is computed
+        :param fe: total excitatory input
+        :param fi: total inhibitory input
+        :param W: level of adaptation
+        :return: the transfer function
+        """
+        fe, fi, W = numpy.broadcast_arrays(fe, fi, W)
+        shape = fe.shape
+        fe, fi, W = numpy.ravel(fe), numpy.ravel(fi), numpy.ravel(W)
+        result = numpy.empty(fe.shape[0])
+        inside = numpy.empty(fe.shape[0], dtype=numpy.bool_)
+        _lookup(self.table, self.ranges, self.scales, fe, fi, W, result, inside)
+        if not numpy.all(inside):
+            outside = numpy.logical_not(inside)
+            result[outside] = self.function(fe[outside], fi[outside], W[outside])
+        return result.reshape(shape)
+
+
+@jit(nopython=True, cache=True)
+def _lookup(table, ranges, scales, fe, fi, W, result, inside):
+    """
+    multilinear interpolation of points in the table of TransferFunctionTable
+    :param table: the table
+    :param ranges: the ranges of the axes
+    :param scales: the inverse of the width of the axes (0 for a collapsed axis)
+    :param fe: total excitatory input of each point
+    :param fi: total inhibitory input of each point
+    :param W: level of adaptation of each point
+    :param result: the values of the interpolation
+    :param inside: the points inside the table
+    """
+    for point in range(fe.shape[0]):
+        result[point] = _lookup_point(table, ranges, scales, fe[point], fi[point], W[point])
+        inside[point] = not numpy.isnan(result[point])
+
+
+@jit(nopython=True, cache=True)
+def _lookup_point(table, ranges, scales, fe, fi, W):
+    """
+    multilinear interpolation of one point in the table of TransferFunctionTable
+    (also used by the compiled dfun of the first order model)
+    :param table: the table
+    :param ranges: the ranges of the axes
+    :param scales: the inverse of the width of the axes (0 for a collapsed axis)
+    :param fe: total excitatory input
+    :param fi: total inhibitory input
+    :param W: level of adaptation
+    :return: the value of the interpolation or nan if the point is outside of the table
+    """
+    if not (ranges[0, 0] <= fe <= ranges[0, 1] and ranges[1, 0] <= fi <= ranges[1, 1]
+            and ranges[2, 0] <= W <= ranges[2, 1]):
+        return numpy.nan
+    nb_cell = table.shape[0] - 1
+    x = min((fe - ranges[0, 0]) * scales[0], 1.0)
+    y = min((fi - ranges[1, 0]) * scales[1], 1.0)
+    z = min((W - ranges[2, 0]) * scales[2], 1.0)
+    # quadratic spacing of the inputs
+    x, y, z = numpy.sqrt(x) * nb_cell, numpy.sqrt(y) * nb_cell, z * nb_cell
+    i, j, k = min(int(x), nb_cell - 1), min(int(y), nb_cell - 1), min(int(z), nb_cell - 1)
+    x, y, z = x - i, y - j, z - k
+    return ((1.0 - x) * ((1.0 - y) * ((1.0 - z) * table[i, j, k] + z * table[i, j, k + 1])
+                         + y * ((1.0 - z) * table[i, j + 1, k] + z * table[i, j + 1, k + 1]))
+            + x * ((1.0 - y) * ((1.0 - z) * table[i + 1, j, k] + z * table[i + 1, j, k + 1])
+                   + y * ((1.0 - z) * table[i + 1, j + 1, k] + z * table[i + 1, j + 1, k + 1])))
+
+
+def interpolate(table, x, y, z):
+    """
+    multilinear interpolation in a table
+    :param table: the table (3 dimensions)
+    :param x: coordinates in the first dimension (in index of the table)
+    :param y: coordinates in the second dimension (in index of the table)
+    :param z: coordinates in the third dimension (in index of the table)
+    :return: the values of the interpolation
+    """
+    index = [numpy.minimum(numpy.floor(value).astype(int), table.shape[i] - 2) for i, value in enumerate([x, y, z])]
+    weight = [value - i for value, i in zip([x, y, z], index)]
+    result = numpy.zeros(numpy.shape(x))
+    for corner_x in (0, 1):
+        for corner_y in (0, 1):
+            for corner_z in (0, 1):
+                result += (table[index[0] + corner_x, index[1] + corner_y, index[2] + corner_z]
+                           * (weight[0] if corner_x else 1.0 - weight[0])
+                           * (weight[1] if corner_y else 1.0 - weight[1])
+                           * (weight[2] if corner_z else 1.0 - weight[2]))
+    return result
+
+
+def table_file(path, key):
+    """
+    the file of a table
+    :param path: the folder of the tables
+    :param key: the hash of the parameters of the table
+    :return: the path of the file
+    """
+    return os.path.join(path, 'TF_table_' + key + '.npz')
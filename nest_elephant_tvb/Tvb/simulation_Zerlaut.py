@@ -19,7 +19,14 @@ from nest_elephant_tvb.Tvb.modify_tvb.Interface_co_simulation_parallel import In
 from nest_elephant_tvb.Tvb.helper_function_zerlaut import findVec
 
 
-def init(param_tvb_connection,param_tvb_coupling,param_tvb_integrator,param_tvb_model,param_tvb_monitor,cosim=None):
+# parameters of the model which can change between the realizations of an ensemble
+ENSEMBLE_PARAMETERS = ['g_L','E_L_e','E_L_i','C_m','b_e','a_e','b_i','a_i','tau_w_e','tau_w_i','E_e','E_i',
+                       'Q_e','Q_i','tau_e','tau_i','N_tot','p_connect','g','T','K_ext_e']
+# parameters of the transfer function : the same for all the realizations with a table of the transfer function
+TF_PARAMETERS = ['g_L','E_L_e','E_L_i','C_m','E_e','E_i','Q_e','Q_i','tau_e','tau_i','N_tot','p_connect','g','K_ext_e']
+
+def init(param_tvb_connection,param_tvb_coupling,param_tvb_integrator,param_tvb_model,param_tvb_monitor,cosim=None,
+         ensemble=None):
     '''
     Initialise the simulator with parameter
     :param param_tvb_connection : parameters for the connection
@@ -28,6 +35,9 @@ def init(param_tvb_connection,param_tvb_coupling,param_tvb_integrator,param_tvb_
     :param param_tvb_model : parameters for the models of TVB
     :param param_tvb_monitor : parameters for TVB monitors
     :param cosim : if use or not mpi
+    :param ensemble : (optional) list of the realizations simulated together, dictionary with the parameters of the
+                      model 'param_tvb_model', of the coupling 'param_tvb_coupling' and the folder 'path_result'
+                      (see init_ensemble)
     :return: the simulator initialize
     '''
     ## initialise the random generator
@@ -38,6 +48,8 @@ def init(param_tvb_connection,param_tvb_coupling,param_tvb_integrator,param_tvb_
         model = Zerlaut.ZerlautAdaptationFirstOrder(variables_of_interest='E I W_e W_i'.split())
     elif param_tvb_model['order'] == 2:
         model = Zerlaut.ZerlautAdaptationSecondOrder(variables_of_interest='E I C_ee C_ei C_ii W_e W_i'.split())
+        if 'derivative_TF' in param_tvb_model.keys():
+            model.derivative_TF = param_tvb_model['derivative_TF']
     else:
         raise Exception('Bad order for the model')
     model.g_L=np.array(param_tvb_model['g_L'])
@@ -68,6 +80,12 @@ def init(param_tvb_connection,param_tvb_coupling,param_tvb_integrator,param_tvb_
     model.external_input_ex_in=np.array(0.)
     model.external_input_in_ex=np.array(0.0)
     model.external_input_in_in=np.array(0.0)
+    # (optional) tabulated transfer function and parallel dfun for the first order
+    for name in ['nb_node_parallel','TF_table','TF_table_rate','TF_table_tolerance','TF_table_max_points','TF_table_path']:
+        if name in param_tvb_model.keys():
+            setattr(model,name,param_tvb_model[name])
+    if 'TF_table_W' in param_tvb_model.keys():
+        model.TF_table_W=np.array(param_tvb_model['TF_table_W'])
     model.state_variable_range['E'] =np.array( param_tvb_model['initial_condition']['E'])
     model.state_variable_range['I'] =np.array( param_tvb_model['initial_condition']['I'])
     if param_tvb_model['order'] == 2:
@@ -76,6 +94,12 @@ def init(param_tvb_connection,param_tvb_coupling,param_tvb_integrator,param_tvb_
         model.state_variable_range['C_ii'] = np.array(param_tvb_model['initial_condition']['C_ii'])
     model.state_variable_range['W_e'] = np.array(param_tvb_model['initial_condition']['W_e'])
     model.state_variable_range['W_i'] = np.array(param_tvb_model['initial_condition']['W_i'])
+    if ensemble is not None:
+        # each realization has its block of nodes
+        init_ensemble(model,param_tvb_model,param_tvb_coupling,param_tvb_monitor,cosim,ensemble)
+        for name in ENSEMBLE_PARAMETERS:
+            setattr(model,name,stack_ensemble([realization['param_tvb_model'][name] for realization in ensemble],
+                                              int(param_tvb_connection['nb_region'])))
 
     ## Connection
     nb_region = int(param_tvb_connection['nb_region'])
@@ -100,9 +124,26 @@ def init(param_tvb_connection,param_tvb_coupling,param_tvb_integrator,param_tvb_
         cortical = np.load(param_tvb_connection['path_cortical'])
     else:
         cortical=None
+    tract_lengths = tract_lengths[:nb_region,:nb_region]
+    weights = weights[:nb_region,:nb_region]
+    if ensemble is not None:
+        # the blocks of nodes of the realizations are not connected
+        nb_ensemble = len(ensemble)
+        tract_lengths = np.kron(np.eye(nb_ensemble),tract_lengths)
+        weights = np.kron(np.eye(nb_ensemble),weights)
+        if region_labels.size > 0:
+            region_labels = np.array([label+'_'+str(index) for index in range(nb_ensemble)
+                                      for label in region_labels[:nb_region]])
+        if centers.size > 0:
+            centers = np.tile(centers[:,:nb_region],nb_ensemble)
+        if orientation is not None:
+            orientation = np.tile(orientation[:nb_region],(nb_ensemble,1))
+        if cortical is not None:
+            cortical = np.tile(cortical[:nb_region],nb_ensemble)
+        nb_region = nb_region*nb_ensemble
     connection = lab.connectivity.Connectivity(number_of_regions=nb_region,
-                                               tract_lengths=tract_lengths[:nb_region,:nb_region],
-                                               weights=weights[:nb_region,:nb_region],
+                                               tract_lengths=tract_lengths,
+                                               weights=weights,
                                                region_labels=region_labels,
                                                centres=centers.T,
                                                cortical=cortical,
@@ -112,7 +153,12 @@ def init(param_tvb_connection,param_tvb_coupling,param_tvb_integrator,param_tvb_
     connection.speed = np.array(param_tvb_connection['velocity'])
 
     ## Coupling
-    coupling = lab.coupling.Linear(a=np.array(param_tvb_coupling['a']),
+    if ensemble is not None:
+        coupling_a = stack_ensemble([realization['param_tvb_coupling']['a'] for realization in ensemble],
+                                    int(param_tvb_connection['nb_region']))[:,np.newaxis]
+    else:
+        coupling_a = np.array(param_tvb_coupling['a'])
+    coupling = lab.coupling.Linear(a=coupling_a,
                                        b=np.array(0.0))
 
     ## Integrator
@@ -163,17 +209,64 @@ def init(param_tvb_connection,param_tvb_coupling,param_tvb_integrator,param_tvb_
                                         )
     simulator.configure()
     # save the initial condition
-    np.save(param_tvb_monitor['path_result']+'/step_init.npy',simulator.history.buffer)
+    if ensemble is not None:
+        for realization,buffer in zip(ensemble,np.split(simulator.history.buffer,len(ensemble),axis=2)):
+            np.save(realization['path_result']+'/step_init.npy',buffer)
+    else:
+        np.save(param_tvb_monitor['path_result']+'/step_init.npy',simulator.history.buffer)
     # end edit
     return simulator
 
-def run_simulation(simulator, time, parameter_tvb):
+def init_ensemble(model,param_tvb_model,param_tvb_coupling,param_tvb_monitor,cosim,ensemble):
+    '''
+    check that the realizations of an ensemble can be simulated together
+    The realizations share the connectivity, the integrator, the noise and the monitors, only the parameters of
+    ENSEMBLE_PARAMETERS for the model and the scaling 'a' for the coupling can change between them.
+    With a table of the transfer function, the table is shared : the parameters of TF_PARAMETERS can't change.
+    :param model: the model of the simulator
+    :param param_tvb_model : parameters for the models of TVB (first realization)
+    :param param_tvb_coupling : parameters for the coupling between nodes (first realization)
+    :param param_tvb_monitor : parameters for TVB monitors
+    :param cosim : if use or not mpi
+    :param ensemble : the realizations (see init)
+    '''
+    if cosim is not None:
+        raise Exception('no co-simulation with an ensemble of simulations')
+    if param_tvb_monitor['SEEG']:
+        raise Exception('no SEEG monitor with an ensemble of simulations')
+    if model.TF_table:
+        for name in TF_PARAMETERS:
+            if any(np.any(np.array(realization['param_tvb_model'][name]) != np.array(ensemble[0]['param_tvb_model'][name]))
+                   for realization in ensemble):
+                raise Exception('the parameter '+name+' of the transfer function is different in the ensemble of '
+                                'simulations with a table of the transfer function')
+    for realization in ensemble:
+        for name,value in realization['param_tvb_model'].items():
+            if name not in ENSEMBLE_PARAMETERS and (name not in param_tvb_model.keys() or param_tvb_model[name] != value):
+                raise Exception('the parameter '+name+' of the model is different in the ensemble of simulations')
+        for name,value in realization['param_tvb_coupling'].items():
+            if name != 'a' and (name not in param_tvb_coupling.keys() or param_tvb_coupling[name] != value):
+                raise Exception('the parameter '+name+' of the coupling is different in the ensemble of simulations')
+
+def stack_ensemble(values,nb_region):
+    '''
+    the values of a parameter of each realization of an ensemble on its block of nodes
+    :param values: the value of the parameter for each realization (one value or one value by region)
+    :param nb_region: the number of regions of a realization
+    :return: the value of the parameter for each node of the simulator
+    '''
+    return np.concatenate([np.broadcast_to(np.ravel(np.array(value)),(nb_region,)) for value in values])
+
+def run_simulation(simulator, time, parameter_tvb, paths_ensemble=None):
     '''
     run a simulation
     :param simulator: the simulator already initialize
     :param time: the time of simulation
     :param parameter_tvb: the parameter for the simulator
+    :param paths_ensemble: (optional) the folder of the result of each realization of an ensemble of simulations
     '''
+    if paths_ensemble is None:
+        paths_ensemble = [parameter_tvb['path_result']]
     # check how many monitor it's used
     nb_monitor = parameter_tvb['Raw'] + parameter_tvb['TemporalAverage'] + parameter_tvb['Bold'] + parameter_tvb['SEEG']
     # initialise the variable for the saving the result
@@ -189,13 +282,31 @@ def run_simulation(simulator, time, parameter_tvb):
         #save the result in file
         if result[0][0] >= parameter_tvb['save_time']*(count+1): #check if the time for saving at some time step
             print('simulation time :'+str(result[0][0])+'\r')
-            np.save(parameter_tvb['path_result']+'/step_'+str(count)+'.npy',save_result)
+            save_ensemble(paths_ensemble,count,save_result)
             save_result =[]
             for i in range(nb_monitor):
                 save_result.append([])
             count +=1
     # save the last part
-    np.save(parameter_tvb['path_result']+'/step_'+str(count)+'.npy',save_result)
+    save_ensemble(paths_ensemble,count,save_result)
+
+def save_ensemble(paths,count,save_result):
+    '''
+    save the result of each realization of the simulator in its folder
+    :param paths: the folder of the result of each realization
+    :param count: the number of the file
+    :param save_result: the result of the monitors (the realizations are blocks of nodes)
+    '''
+    if len(paths) == 1:
+        np.save(paths[0]+'/step_'+str(count)+'.npy',save_result)
+        return
+    results = [[[] for monitor in save_result] for path in paths]
+    for i,monitor in enumerate(save_result):
+        for time_monitor,data in monitor:
+            for index,data_realization in enumerate(np.split(data,len(paths),axis=1)):
+                results[index][i].append((time_monitor,data_realization))
+    for path,result in zip(paths,results):
+        np.save(path+'/step_'+str(count)+'.npy',result)
 
 def simulate_tvb(results_path,begin,end,param_tvb_connection,param_tvb_coupling,
                  param_tvb_integrator,param_tvb_model,param_tvb_monitor):
@@ -231,6 +342,14 @@ def run_mpi(path):
     param_tvb_monitor= parameters['param_tvb_monitor']
     result_path= parameters['result_path']
     end = parameters['end']
+    param_TR_nest_to_tvb = parameters['param_TR_nest_to_tvb']
+    # one translator for all the proxy (rates of all the regions in one message)
+    multiplex_receive = param_TR_nest_to_tvb['multiplex'] if 'multiplex' in param_TR_nest_to_tvb.keys() else False
+    # the rank of the translator which sends the rates (first rank after the ranks receiving from Nest)
+    rank_receive = param_TR_nest_to_tvb['nb_receiver'] if 'nb_receiver' in param_TR_nest_to_tvb.keys() else 1
+    param_TR_tvb_to_nest = parameters['param_TR_tvb_to_nest']
+    # one translator for all the proxy (rates of all the regions in one message)
+    multiplex_send = param_TR_tvb_to_nest['multiplex'] if 'multiplex' in param_TR_tvb_to_nest.keys() else False
 
     # configuration of the logger
     logger = logging.getLogger('tvb')
@@ -277,11 +396,19 @@ def run_mpi(path):
     #init MPI :
     data = None #data for the proxy node (no initialisation in the parameter)
     comm_receive=[]
-    for i in id_proxy:
-        comm_receive.append(init_mpi(path_send+str(i)+".txt",logger))
+    if multiplex_receive:
+        comm_receive.append(init_mpi(path_send+"multiplex.txt",logger))
+        nb_region_receive = len(id_proxy) # number of regions by translator
+    else:
+        for i in id_proxy:
+            comm_receive.append(init_mpi(path_send+str(i)+".txt",logger))
+        nb_region_receive = 1
     comm_send=[]
-    for i in id_proxy :
-        comm_send.append(init_mpi(path_receive+str(i)+".txt",logger))
+    if multiplex_send:
+        comm_send.append(init_mpi(path_receive+"multiplex.txt",logger))
+    else:
+        for i in id_proxy :
+            comm_send.append(init_mpi(path_receive+str(i)+".txt",logger))
 
     # the loop of the simulation
     count = 0
@@ -291,14 +418,14 @@ def run_mpi(path):
         #receive MPI data
         data_value = []
         for comm in comm_receive:
-            receive = receive_mpi(comm)
+            receive = receive_mpi(comm,rank_receive)
             time_data = receive[0]
-            data_value.append(receive[1])
+            data_value.append(np.reshape(receive[1],(-1,nb_region_receive)))
         data=np.empty((2,),dtype=object)
         nb_step = np.rint((time_data[1]-time_data[0])/param_tvb_integrator['sim_resolution'])
         nb_step_0 = np.rint(time_data[0]/param_tvb_integrator['sim_resolution']) + 1 # start at the first time step not at 0.0
         time_data = np.arange(nb_step_0,nb_step_0+nb_step,1)*param_tvb_integrator['sim_resolution']
-        data_value = np.swapaxes(np.array(data_value),0,1)[:,:]
+        data_value = np.concatenate(data_value,axis=1)
         if data_value.shape[0] != time_data.shape[0]:
             raise(Exception('Bad shape of data'))
         data[:]=[time_data,data_value]
@@ -324,18 +451,27 @@ def run_mpi(path):
         nest_data = np.array(nest_data)
         time = [nest_data[0,0],nest_data[-1,0]]
         rate = np.concatenate(nest_data[:,1])
-        for index,comm in enumerate(comm_send):
-            send_mpi(comm,time,rate[:,index]*1e3)
+        if multiplex_send:
+            send_mpi(comm_send[0],time,rate*1e3) # (nb_step,nb_proxy)
+        else:
+            for index,comm in enumerate(comm_send):
+                send_mpi(comm,time,rate[:,index]*1e3)
 
         #increment of the loop
         count+=1
     # save the last part
     logger.info(" TVB finish")
     np.save(param_tvb_monitor['path_result']+'/step_'+str(count_save)+'.npy',save_result)
-    for index,comm in  enumerate(comm_send):
-        end_mpi(comm,result_path+"/translation/receive_from_tvb/"+str(id_proxy[index])+".txt",True,logger)
-    for index,comm in  enumerate(comm_receive):
-        end_mpi(comm,result_path+"/translation/send_to_tvb/"+str(id_proxy[index])+".txt",False,logger)
+    if multiplex_send:
+        end_mpi(comm_send[0],result_path+"/translation/receive_from_tvb/multiplex.txt",True,logger)
+    else:
+        for index,comm in  enumerate(comm_send):
+            end_mpi(comm,result_path+"/translation/receive_from_tvb/"+str(id_proxy[index])+".txt",True,logger)
+    if multiplex_receive:
+        end_mpi(comm_receive[0],result_path+"/translation/send_to_tvb/multiplex.txt",False,logger,rank_receive)
+    else:
+        for index,comm in  enumerate(comm_receive):
+            end_mpi(comm,result_path+"/translation/send_to_tvb/"+str(id_proxy[index])+".txt",False,logger,rank_receive)
     MPI.Finalize() # ending with MPI
     logger.info(" TVB exit")
     return
@@ -377,43 +513,45 @@ def send_mpi(comm,times,data):
         accept = req.wait(status_)
     source = status_.Get_source() # the id of the excepted source
     data = np.ascontiguousarray(data,dtype='d') # format the rate for sending
-    shape = np.array(data.shape[0],dtype='i') # size of data
+    shape = np.array(data.size,dtype='i') # size of data
     times = np.array(times,dtype='d') # time of starting and ending step
     comm.Send([times,MPI.DOUBLE],dest=source,tag=0)
     comm.Send([shape,MPI.INT],dest=source,tag=0)
     comm.Send([data, MPI.DOUBLE], dest=source, tag=0)
 
 
-def receive_mpi(comm):
+def receive_mpi(comm,rank=0):
     """
         receive proxy values the
     :param comm: MPI communicator
+    :param rank: the rank of the translator which sends the rates
     :return: rate of all proxy
     """
     status_ = MPI.Status()
     # send to the translator : I want the next part
-    req = comm.isend(True, dest=0, tag=0)
+    req = comm.isend(True, dest=rank, tag=0)
     req.wait()
     time_step = np.empty(2, dtype='d')
-    comm.Recv([time_step, 2, MPI.DOUBLE], source=0, tag=MPI.ANY_TAG, status=status_)
+    comm.Recv([time_step, 2, MPI.DOUBLE], source=rank, tag=MPI.ANY_TAG, status=status_)
     # get the size of the rate
     size=np.empty(1,dtype='i')
-    comm.Recv([size, MPI.INT], source=0, tag=0)
+    comm.Recv([size, MPI.INT], source=rank, tag=0)
     # get the rate
-    rates = np.empty(size, dtype='d')
-    comm.Recv([rates,size, MPI.DOUBLE],source=0,tag=MPI.ANY_TAG,status=status_)
+    rates = np.empty(size[0], dtype='d')
+    comm.Recv([rates,size[0], MPI.DOUBLE],source=rank,tag=MPI.ANY_TAG,status=status_)
     # print the summary of the data
     if status_.Get_tag() == 0:
         return time_step,rates
     else:
         return None # TODO take in count
 
-def end_mpi(comm,path,sending,logger):
+def end_mpi(comm,path,sending,logger,rank=0):
     """
     ending the communication
     :param comm: MPI communicator
     :param path: for the close the port
     :param sending: if the translator is for sending or receiving data
+    :param rank: the rank of the translator which sends the rates (receiving data)
     :return: nothing
     """
     # read the port before the deleted file
@@ -438,7 +576,7 @@ def end_mpi(comm,path,sending,logger):
     else:
         logger.info("TVB close connection receive " + port)
         # send to the translator : I want the next part
-        req = comm.isend(True, dest=0, tag=1)
+        req = comm.isend(True, dest=rank, tag=1)
         req.wait()
     # closing the connection at this end
     logger.info("TVB disconnect communication")
@@ -461,9 +599,38 @@ def run_normal(path_parameter):
                  param_tvb_model=parameters['param_tvb_model'],
                  param_tvb_monitor=parameters['param_tvb_monitor'])
 
+def run_ensemble(paths_parameter):
+    '''
+    run the simulations of several folders in one simulator (only tvb without mpi)
+    The simulations are integrated together : the random stream of the noise and of the initial condition is shared,
+    the result of each simulation is different from the result of run_normal but has the same statistics.
+    :param paths_parameter: the folders of the simulations
+    '''
+    parameters = []
+    for path_parameter in paths_parameter:
+        with open(path_parameter+'/parameter.json') as f:
+            parameters.append(json.load(f))
+    reference = parameters[0]
+    for parameter in parameters[1:]:
+        for name in ['param_tvb_connection','param_tvb_integrator','param_tvb_monitor','end']:
+            if parameter[name] != reference[name]:
+                raise Exception('the parameter '+name+' is different in the ensemble of simulations')
+    ensemble = [{'param_tvb_model':parameter['param_tvb_model'],
+                 'param_tvb_coupling':parameter['param_tvb_coupling'],
+                 'path_result':parameter['result_path']+'/tvb/'}
+                for parameter in parameters]
+    param_tvb_monitor = reference['param_tvb_monitor']
+    param_tvb_monitor['path_result']=ensemble[0]['path_result']
+    simulator = init(reference['param_tvb_connection'],reference['param_tvb_coupling'],
+                     reference['param_tvb_integrator'],reference['param_tvb_model'],param_tvb_monitor,
+                     ensemble=ensemble)
+    run_simulation(simulator,reference['end'],param_tvb_monitor,[realization['path_result'] for realization in ensemble])
+
 if __name__ == "__main__":
     import sys
-    if len(sys.argv)==3:
+    if len(sys.argv)>=3 and sys.argv[1] == '2': # run several simulations of only tvb in one simulator
+        run_ensemble(sys.argv[2:])
+    elif len(sys.argv)==3:
         if sys.argv[1] == '0': # run only tvb without mpi
             run_normal(sys.argv[2])
         elif sys.argv[1] == '1': # run tvb in co-simulation configuration
@@ -0,0 +1,120 @@
+#  Copyright 2020 Forschungszentrum Jülich GmbH and Aix-Marseille Université
+# "Licensed to the Apache Software Foundation (ASF) under one or more contributor license agreements; and to You under the Apache License, Version 2.0. "
+
+import numpy as np
+from nest_elephant_tvb.Tvb.modify_tvb import Zerlaut
+
+def random_state(model,nb_node):
+    '''
+    random state and coupling of the model in the range of the firing rates, covariances and adaptation
+    :param model: the model
+    :param nb_node: number of nodes
+    :return: state variables (nvar,nb_node,1) and coupling (1,nb_node,1)
+    '''
+    state = np.empty((model._nvar,nb_node,1))
+    state[0:2] = np.random.rand(2,nb_node,1)*0.02              # firing rates in KHz
+    if model._nvar == 7:
+        state[2:5] = np.random.rand(3,nb_node,1)*1e-6          # covariances
+    state[-2:] = np.random.rand(2,nb_node,1)*50.0              # adaptation in pA
+    coupling = np.random.rand(1,nb_node,1)*0.01
+    return state, coupling
+
+def relative_error(reference,result):
+    '''
+    error of a result relative to the maximum of each variable of the reference
+    :param reference: the reference (nvar,nodes,modes)
+    :param result: the result (nvar,nodes,modes)
+    :return: the maximal relative error of each variable
+    '''
+    return np.max(np.abs(reference-result),axis=(1,2))/np.max(np.abs(reference),axis=(1,2))
+
+def configure(model,nb_node,by_node):
+    '''
+    configure the model with external inputs and, optionally, parameters by node
+    :param model: the model
+    :param nb_node: number of nodes
+    :param by_node: if some parameters are different for each node
+    :return: the model
+    '''
+    model.configure()
+    model.external_input_ex_ex = np.array([0.001])
+    model.external_input_in_in = np.array([0.0005])
+    if by_node:
+        model.b_e = np.linspace(0.0,60.0,nb_node)[:,np.newaxis]
+        model.E_L_i = np.linspace(-67.0,-63.0,nb_node)[:,np.newaxis]
+    return model
+
+def check_second_order(nb_node,by_node,derivative_TF,tolerance):
+    '''
+    compare the compiled dfun of the second order model with the reference _numpy_dfun
+    :param nb_node: number of nodes
+    :param by_node: if some parameters are different for each node
+    :param derivative_TF: 'numerical' or 'analytic' derivatives of the transfer function
+    :param tolerance: maximal error relative to the reference
+    :return:
+    '''
+    model = Zerlaut.ZerlautAdaptationSecondOrder()
+    model.derivative_TF = derivative_TF
+    model = configure(model,nb_node,by_node)
+    state, coupling = random_state(model,nb_node)
+    reference = model._numpy_dfun(state,coupling,0.0)
+    error = relative_error(reference,model.dfun(state,coupling,0.0))
+    print("second order",derivative_TF,": nodes",nb_node,"parameters by node",by_node,": error",np.max(error))
+    assert np.all(error < tolerance)
+
+def check_derivative_TF(nb_point):
+    '''
+    compare the analytic and the numerical derivatives of the transfer function of the compiled kernel
+    :param nb_point: number of random points
+    :return:
+    '''
+    model = configure(Zerlaut.ZerlautAdaptationSecondOrder(),1,False)
+    parameters = [float(np.ravel(getattr(model,name))[0]) for name in
+                  ['Q_e','tau_e','E_e','Q_i','tau_i','E_i','g_L','C_m','E_L_e','N_tot',
+                   'p_connect_e','p_connect_i','g','K_ext_e','K_ext_i']]
+    P_e = np.ravel(model.P_e)
+    numerical = np.empty((nb_point,6))
+    analytic = np.empty((nb_point,6))
+    for i in range(nb_point):
+        fe, fi, fe_ext, fi_ext = np.random.rand(4)*0.02
+        W = np.random.rand()*50.0
+        numerical[i] = Zerlaut._TF_derivatives(fe,fi,fe_ext,fi_ext,W,*parameters,P_e,False)
+        analytic[i] = Zerlaut._TF_derivatives(fe,fi,fe_ext,fi_ext,W,*parameters,P_e,True)
+    error = np.max(np.abs(numerical-analytic),axis=0)/np.max(np.abs(analytic),axis=0)
+    print("derivatives of TF : points",nb_point,": error by derivative",error)
+    # the second derivatives by central differences are limited by the rounding errors
+    assert np.all(error[:3] < 1e-7) and np.all(error[3:] < 1e-3)
+
+def check_first_order(nb_node,by_node,nb_node_parallel):
+    '''
+    compare the compiled dfun of the first order model with the reference _numpy_dfun
+    :param nb_node: number of nodes
+    :param by_node: if some parameters are different for each node
+    :param nb_node_parallel: number of nodes from which the parallel kernel (prange) is used
+    :return:
+    '''
+    model = configure(Zerlaut.ZerlautAdaptationFirstOrder(),nb_node,by_node)
+    model.nb_node_parallel = nb_node_parallel
+    state, coupling = random_state(model,nb_node)
+    reference = model._numpy_dfun(state,coupling,0.0)
+    error = relative_error(reference,model.dfun(state,coupling,0.0))
+    print("first order : nodes",nb_node,"parameters by node",by_node,
+          "parallel",nb_node >= nb_node_parallel,": error",np.max(error))
+    assert np.all(error < 1e-10)
+
+if __name__ == "__main__":
+    np.random.seed(42)
+    for by_node in [False,True]:
+        check_second_order(1,by_node,'numerical',1e-10)
+        check_second_order(200,by_node,'numerical',1e-10)
+        # the reference uses central differences
+        check_second_order(200,by_node,'analytic',1e-5)
+    check_derivative_TF(1000)
+    for by_node in [False,True]:
+        # sequential kernel
+        check_first_order(1,by_node,10**9)
+        check_first_order(200,by_node,10**9)
+        # parallel kernel
+        check_first_order(1,by_node,1)
+        check_first_order(200,by_node,1)
+    print("test zerlaut kernel : OK")
@@ -0,0 +1,129 @@
+#  Copyright 2020 Forschungszentrum Jülich GmbH and Aix-Marseille Université
+# "Licensed to the Apache Software Foundation (ASF) under one or more contributor license agreements; and to You under the Apache License, Version 2.0. "
+
+import numpy as np
+import os
+import shutil
+import tempfile
+from nest_elephant_tvb.Tvb.modify_tvb import Zerlaut
+from nest_elephant_tvb.Tvb.modify_tvb.Zerlaut_table import table_file
+
+class CountModel(Zerlaut.ZerlautAdaptationFirstOrder):
+    '''
+    first order model which counts the evaluations of the transfer function of the total inputs
+    '''
+    nb_evaluation = 0
+
+    def TF_input(self, fe_total, fi_total, W, P, E_L):
+        self.nb_evaluation += np.size(fe_total)
+        return super(CountModel, self).TF_input(fe_total, fi_total, W, P, E_L)
+
+def create_model(path,g=0.2,K_ext_i=0):
+    '''
+    create a model with the tables of the transfer functions
+    :param path: folder of the tables
+    :param g: fraction of inhibitory neurons
+    :param K_ext_i: number of external inhibitory synapses
+    :return: the model
+    '''
+    model = CountModel()
+    model.TF_table = True
+    model.TF_table_path = path
+    model.g = np.array([g])
+    model.K_ext_i = np.array([K_ext_i])
+    model.configure()
+    return model
+
+def exact(model,fe,fi,W):
+    '''
+    the excitatory transfer function of the total inputs without table
+    :param model: the model
+    :param fe: total excitatory input
+    :param fi: total inhibitory input
+    :param W: level of adaptation
+    :return: the transfer function
+    '''
+    return model.TF_input(fe,fi,W,model.P_e,model.E_L_e)
+
+def random_points(table,nb_point,scale):
+    '''
+    random points in a box around the center of the table (the inputs and the adaptation are positives)
+    :param table: the table
+    :param nb_point: number of points
+    :param scale: size of the box relative to the table (lower than 1 : inside the table)
+    :return: the total inputs and the adaptation of the points
+    '''
+    center = np.mean(table.ranges,axis=1)
+    width = table.ranges[:,1]-table.ranges[:,0]
+    points = np.abs(center+(np.random.rand(nb_point,3)-0.5)*width*scale)
+    return points[:,0], points[:,1], points[:,2]
+
+def check_inside(model):
+    '''
+    check the error of the interpolation inside of the table
+    :param model: the model with the tables
+    :return:
+    '''
+    table = model._TF_table_e
+    fe, fi, W = random_points(table,10000,1.0)
+    error = np.max(np.abs(table(fe,fi,W)-exact(model,fe,fi,W)))
+    print("inside : error",error,"estimation",table.error,"tolerance",table.tolerance)
+    assert error <= table.tolerance
+
+def check_outside(model):
+    '''
+    check that the transfer function is computed outside of the table
+    :param model: the model with the tables
+    :return:
+    '''
+    table = model._TF_table_e
+    fe, fi, W = random_points(table,1000,3.0)
+    inside = np.logical_and.reduce([(value >= table.ranges[i,0]) & (value <= table.ranges[i,1])
+                                    for i,value in enumerate([fe,fi,W])])
+    outside = np.logical_not(inside)
+    print("outside : points",np.sum(outside))
+    assert np.sum(outside) > 0
+    assert np.all(table(fe,fi,W)[outside] == exact(model,fe[outside],fi[outside],W[outside]))
+
+def check_cache(path,model):
+    '''
+    check that the tables of a second model with the same parameters are loaded from the files without computing them
+    :param path: folder of the tables
+    :param model: the first model
+    :return:
+    '''
+    assert os.path.exists(table_file(path,model._TF_table_e.key))
+    assert os.path.exists(table_file(path,model._TF_table_i.key))
+    second = create_model(path)
+    print("cache : evaluations",second.nb_evaluation)
+    assert second.nb_evaluation == 0
+    for table,first in [(second._TF_table_e,model._TF_table_e),(second._TF_table_i,model._TF_table_i)]:
+        assert table.key == first.key and np.all(table.table == first.table) and table.error == first.error
+
+def check_collapsed_axis(path):
+    '''
+    check a table without inhibitory input : the axis of the inhibitory input has a zero width
+    :param path: folder of the tables
+    :return:
+    '''
+    model = create_model(path,g=0.0)
+    table = model._TF_table_e
+    assert table.ranges[1,0] == table.ranges[1,1]
+    fe, fi, W = random_points(table,1000,1.0)
+    error = np.max(np.abs(table(fe,fi,W)-exact(model,fe,fi,W)))
+    print("collapsed axis : error",error)
+    assert error <= table.tolerance
+    assert np.all(table(fe,fi+1.0,W) == exact(model,fe,fi+1.0,W))
+
+if __name__ == "__main__":
+    np.random.seed(42)
+    path = tempfile.mkdtemp()
+    try:
+        model = create_model(path)
+        check_inside(model)
+        check_outside(model)
+        check_cache(path,model)
+        check_collapsed_axis(path)
+    finally:
+        shutil.rmtree(path)
+    print("test zerlaut table : OK")
@@ -110,12 +110,28 @@ def create_linked_parameters(results_path,parameters):
             param_TR_tvb_to_nest = parameters['param_TR_tvb_to_nest']
         else:
             param_TR_tvb_to_nest = {}
+        # translation of the rate in current for step current generators (one by population) in place of spikes
+        translation_current = 'function_select' in param_TR_tvb_to_nest.keys() and param_TR_tvb_to_nest['function_select'] == 3
+        param_co_simulation['translation_current'] = translation_current
         if not 'init' in param_TR_tvb_to_nest.keys():
             path_rates = results_path+'/init_rates.npy'
-            init_rates = np.array([[] for i in range(param_nest_topology['nb_neuron_by_region'])])
+            if translation_current:
+                # no change of current for the first step for the excitatory and inhibitory populations
+                init_rates = np.array([[] for i in range(2)])
+            else:
+                init_rates = np.array([[] for i in range(param_nest_topology['nb_neuron_by_region'])])
             np.save(path_rates,init_rates)
             param_TR_tvb_to_nest['init']= path_rates
+        if translation_current:
+            param_TR_tvb_to_nest['weight'] = param_nest_connection['weight_global']
+            param_TR_tvb_to_nest['tau_syn'] = param_nest_topology['param_neuron_excitatory']['tau_syn_ex']
+            param_TR_tvb_to_nest['E_rev'] = param_nest_topology['param_neuron_excitatory']['E_ex']
+            param_TR_tvb_to_nest['E_L'] = param_nest_topology['param_neuron_excitatory']['E_L']
+        if not 'multiplex' in param_TR_tvb_to_nest.keys():
+            # one translator by proxy region
+            param_TR_tvb_to_nest['multiplex'] = False
         param_TR_tvb_to_nest['level_log']= param_co_simulation['level_log']
+        param_TR_tvb_to_nest['resolution']= param_nest['sim_resolution']
         param_TR_tvb_to_nest['seed'] = param_nest['master_seed']-3
         param_TR_tvb_to_nest['nb_synapses'] = param_nest_connection['nb_external_synapse']
         parameters['param_TR_tvb_to_nest'] = param_TR_tvb_to_nest
@@ -130,6 +146,20 @@ def create_linked_parameters(results_path,parameters):
             init_spikes = np.zeros((int(param_co_simulation['synchronization']/param_nest['sim_resolution']),1))
             np.save(path_spikes,init_spikes)
             param_TR_nest_to_tvb['init']= path_spikes
+        if not 'multiplex' in param_TR_nest_to_tvb.keys():
+            # one translator by spike detector
+            param_TR_nest_to_tvb['multiplex'] = False
+        if not 'nb_receiver' in param_TR_nest_to_tvb.keys():
+            # one rank receiving from Nest
+            param_TR_nest_to_tvb['nb_receiver'] = 1
+        if param_TR_nest_to_tvb['nb_receiver'] > 1 and not ('modulo_routing' in param_TR_nest_to_tvb.keys()
+                                                             and param_TR_nest_to_tvb['modulo_routing']):
+            # the MPI recording backend of NEST sends all its ranks to the rank 0 of the translator
+            raise Exception('nb_receiver > 1 needs a build of NEST which sends from its rank s to the rank '
+                            's % nb_receiver of the translator (parameter modulo_routing)')
+        if not 'nb_MPI' in param_TR_nest_to_tvb.keys():
+            # the ranks receiving from Nest and one rank for the analysis and the sending to TVB
+            param_TR_nest_to_tvb['nb_MPI'] = param_TR_nest_to_tvb['nb_receiver'] + 1
         param_TR_nest_to_tvb['resolution']=param_nest['sim_resolution']
         param_TR_nest_to_tvb['nb_neurons']=param_nest_topology['nb_neuron_by_region'] * (1-param_nest_topology['percentage_inhibitory'])
         param_TR_nest_to_tvb['synch']=param_co_simulation['synchronization']
@@ -136,37 +136,74 @@ def run(parameters_file):
                          ))
 
         # create translator between Nest to TVB :
-        # one by proxy/spikedetector
-        for index,id_spike_detector in enumerate(spike_detector):
+        if parameters['param_TR_nest_to_tvb']['multiplex']:
+            # one for all proxy/spikedetector
             dir_path = os.path.dirname(os.path.realpath(__file__))+"/../translation/run_mpi_nest_to_tvb.sh"
             argv=[ '/bin/sh',
                    dir_path,
                    mpirun,
+                   str(parameters['param_TR_nest_to_tvb']['nb_MPI']),
                    results_path,
-                   "/translation/spike_detector/"+str(id_spike_detector)+".txt",
-                   "/translation/send_to_tvb/"+str(id_proxy[index])+".txt",
+                   "/translation/spike_detector/"+str(spike_detector[0])+".txt",
+                   "/translation/send_to_tvb/multiplex.txt",
                    ]
+            for id_spike_detector in spike_detector[1:]:
+                argv.append("/translation/spike_detector/"+str(id_spike_detector)+".txt")
             processes.append(subprocess.Popen(argv,
                              #need to check if it's needed or not (doesn't work for me)
                              stdin=None,stdout=None,stderr=None,close_fds=True, #close the link with parent process
                              ))
+        else:
+            # one by proxy/spikedetector
+            for index,id_spike_detector in enumerate(spike_detector):
+                dir_path = os.path.dirname(os.path.realpath(__file__))+"/../translation/run_mpi_nest_to_tvb.sh"
+                argv=[ '/bin/sh',
+                       dir_path,
+                       mpirun,
+                       str(parameters['param_TR_nest_to_tvb']['nb_MPI']),
+                       results_path,
+                       "/translation/spike_detector/"+str(id_spike_detector)+".txt",
+                       "/translation/send_to_tvb/"+str(id_proxy[index])+".txt",
+                       ]
+                processes.append(subprocess.Popen(argv,
+                                 #need to check if it's needed or not (doesn't work for me)
+                                 stdin=None,stdout=None,stderr=None,close_fds=True, #close the link with parent process
+                                 ))
 
         # create translator between TVB to Nest:
-        # one by proxy/id_region
-        for index,ids_spike_generator in enumerate(spike_generator):
+        if parameters['param_TR_tvb_to_nest']['multiplex']:
+            # one for all proxy/id_region
             dir_path = os.path.dirname(os.path.realpath(__file__))+"/../translation/run_mpi_tvb_to_nest.sh"
             argv=[ '/bin/sh',
                    dir_path,
                    mpirun,
                    results_path+"/translation/spike_generator/",
-                   str(ids_spike_generator[0]),
-                   str(len(ids_spike_generator)),
-                   "/../receive_from_tvb/"+str(id_proxy[index])+".txt",
+                   str(spike_generator[0][0]),
+                   str(len(spike_generator[0])),
+                   "/../receive_from_tvb/multiplex.txt",
                    ]
+            for ids_spike_generator in spike_generator[1:]:
+                argv.append(str(ids_spike_generator[0]))
             processes.append(subprocess.Popen(argv,
                              #need to check if it's needed or not (doesn't work for me)
                              stdin=None,stdout=None,stderr=None,close_fds=True, #close the link with parent process
                              ))
+        else:
+            # one by proxy/id_region
+            for index,ids_spike_generator in enumerate(spike_generator):
+                dir_path = os.path.dirname(os.path.realpath(__file__))+"/../translation/run_mpi_tvb_to_nest.sh"
+                argv=[ '/bin/sh',
+                       dir_path,
+                       mpirun,
+                       results_path+"/translation/spike_generator/",
+                       str(ids_spike_generator[0]),
+                       str(len(ids_spike_generator)),
+                       "/../receive_from_tvb/"+str(id_proxy[index])+".txt",
+                       ]
+                processes.append(subprocess.Popen(argv,
+                                 #need to check if it's needed or not (doesn't work for me)
+                                 stdin=None,stdout=None,stderr=None,close_fds=True, #close the link with parent process
+                                 ))
     else:
         if param_co_simulation['nb_MPI_nest'] != 0:
             # Second case : Only nest simulation
@@ -250,15 +287,45 @@ def run(parameters_file):
         process.wait()
     logger.info('time: '+str(datetime.datetime.now())+' END SIMULATION \n')
 
-def run_exploration(results_path,parameter_default,dict_variable,begin,end):
+def run_ensemble(parameters_files):
     """
-    Run one simulation of the exploration
+    run several simulations of only TVB in one simulator (see simulation_Zerlaut.run_ensemble)
+    The simulations differ only by the parameters of the model and the coupling of TVB.
+    :param parameters_files: parameters of the simulations
+    :return:
+    """
+    results_paths = []
+    for parameters_file in parameters_files:
+        with open(parameters_file) as f:
+            parameters = json.load(f)
+        #create the folder for result is not exist
+        results_path = os.path.join(os.getcwd(),parameters['result_path'])
+        if not os.path.exists(results_path+"/log"):
+            os.makedirs(results_path+"/log")
+        if not os.path.exists(results_path + '/tvb'):
+            os.makedirs(results_path + '/tvb')
+        results_paths.append(results_path)
+    dir_path = os.path.dirname(os.path.realpath(__file__)) + "/../Tvb/simulation_Zerlaut.py"
+    argv = [
+        'python3',
+        dir_path,
+        str(2),
+    ] + results_paths
+    process = subprocess.Popen(argv,
+                     # need to check if it's needed or not (doesn't work for me)
+                     stdin=None, stdout=None, stderr=None, close_fds=True,  # close the link with parent process
+                     )
+    process.wait()
+
+def generate_exploration(results_path,parameter_default,dict_variable,begin,end):
+    """
+    Create the folder and the parameters of one simulation of the exploration
     :param results_path: the folder where to save spikes
     :param parameter_default: parameters by default of the exploration
     :param dict_variable : dictionary with the variable change
     :param begin:  when start the recording simulation ( not take in count for tvb (start always to zeros )
     :param end: when end the recording simulation and the simulation
-    :return: nothing
+    :return: the file of the parameters
     """
     #create the folder for result is not exist
     newpath = os.path.join(os.getcwd(),results_path)
@@ -276,10 +343,22 @@ def run_exploration(results_path,parameter_default,dict_variable,begin,end):
     # check if the file is available
     while not os.path.exists(results_path + '/parameter.json'):
         time.sleep(1)
-    run(results_path+'/parameter.json')
+    return results_path+'/parameter.json'
+
+def run_exploration(results_path,parameter_default,dict_variable,begin,end):
+    """
+    Run one simulation of the exploration
+    :param results_path: the folder where to save spikes
+    :param parameter_default: parameters by default of the exploration
+    :param dict_variable : dictionary with the variable change
+    :param begin:  when start the recording simulation ( not take in count for tvb (start always to zeros )
+    :param end: when end the recording simulation and the simulation
+    :return: nothing
+    """
+    run(generate_exploration(results_path,parameter_default,dict_variable,begin,end))
 
 
-def run_exploration_2D(path,parameter_default,dict_variables,begin,end):
+def run_exploration_2D(path,parameter_default,dict_variables,begin,end,ensemble=None):
     """
     Run exploration of parameter in 2 dimensions
     :param path: for the result of the simulations
@@ -287,18 +366,36 @@ def run_exploration_2D(path,parameter_default,dict_variables,begin,end):
     :param dict_variables: the variables and there range of value for the simulations
     :param begin: when start the recording simulation ( not take in count for tvb (start always to zeros )
     :param end: when end the recording simulation and the simulation
+    :param ensemble: (optional) the maximal number of simulations of only TVB in one simulator (see run_ensemble),
+                     the variables can only be parameters of the model and of the coupling of TVB
     :return:
     """
     name_variable_1,name_variable_2 = dict_variables.keys()
     print(path)
+    parameters_ensemble = [] # simulations of only TVB waiting for the simulator
     for variable_1 in  dict_variables[name_variable_1]:
         for variable_2 in  dict_variables[name_variable_2]:
             # try:
             print('SIMULATION : '+name_variable_1+': '+str(variable_1)+' '+name_variable_2+': '+str(variable_2))
             results_path=path+'_'+name_variable_1+'_'+str(variable_1)+'_'+name_variable_2+'_'+str(variable_2)
-            run_exploration(results_path,parameter_default,{name_variable_1:variable_1,name_variable_2:variable_2},begin,end)
+            dict_variable = {name_variable_1:variable_1,name_variable_2:variable_2}
+            if ensemble is None:
+                run_exploration(results_path,parameter_default,dict_variable,begin,end)
+                continue
+            parameters_file = generate_exploration(results_path,parameter_default,dict_variable,begin,end)
+            with open(parameters_file) as f:
+                param_co_simulation = json.load(f)['param_co_simulation']
+            if param_co_simulation['co-simulation'] or param_co_simulation['nb_MPI_nest'] != 0:
+                run(parameters_file)
+            else:
+                parameters_ensemble.append(parameters_file)
+                if len(parameters_ensemble) == ensemble:
+                    run_ensemble(parameters_ensemble)
+                    parameters_ensemble = []
             # except:
             #     sys.stderr.write('time: '+str(datetime.datetime.now())+' error: ERROR in simulation \n')
+    if len(parameters_ensemble) > 0:
+        run_ensemble(parameters_ensemble)
 
 if __name__ == "__main__":
     if len(sys.argv)==2:
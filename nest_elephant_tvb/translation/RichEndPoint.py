@@ -7,7 +7,8 @@ def make_connections(path_to_files_receive, path_to_files_send, logger_master):
     '''
     Rich End Point. Still a first draft, will be changed to a proper interface.
     This function establishes two MPI intercommunicators. One to NEST and one to TVB.
-    :param path_to_files_receive: path to file, store information about receiving MPI connection
+    :param path_to_files_receive: list of paths to files, store information about receiving MPI connection
+                                  (the same port for all the spike detectors of a multiplexed translator)
     :param path_to_files_send: path to file, store information about sending MPI connection
     :param logger_master: main logger for the connections
     '''
@@ -39,11 +40,12 @@ def nest_connection(comm, root, info, logger_master, path_to_files_receive):
         port_receive = MPI.Open_port(info)
         logger_master.info('Translate Receive: after open_port: '+port_receive)
         # Write file configuration of the port
-        fport = open(path_to_files_receive, "w+")
-        fport.write(port_receive)
-        fport.close()
-        pathlib.Path(path_to_files_receive+'.unlock').touch()
-        logger_master.info('Translate Receive: path_file: ' + path_to_files_receive)
+        for path_file in path_to_files_receive:
+            fport = open(path_file, "w+")
+            fport.write(port_receive)
+            fport.close()
+            pathlib.Path(path_file+'.unlock').touch()
+            logger_master.info('Translate Receive: path_file: ' + path_file)
     else:
         port_receive = None
     
@@ -1,6 +1,5 @@
 # Copyright 2020 Forschungszentrum Jülich GmbH and Aix-Marseille Université
 # "Licensed to the Apache Software Foundation (ASF) under one or more contributor license agreements; and to You under the Apache License, Version 2.0. "
-import time
 import numpy as np
 from mpi4py import MPI
 from nest_elephant_tvb.translation.science_nest_to_tvb import store_data,analyse_data
@@ -12,20 +11,29 @@ def init(path, param, comm, comm_receiver, comm_sender, loggers):
     
     TODO: IMPORTANT!!! MPI communication on NEST and TVB side is somewhat hardcoded.
         --> NEST sends to and receives from rank 0 on transformer side. This works here, since rank 0 is the receiving rank
+            --> with param['nb_receiver'] > 1, NEST rank s needs to send to rank s % nb_receiver
             --> https://github.com/sdiazpier/nest-simulator/blob/nest-i/nestkernel/recording_backend_mpi.cpp
             --> line 396 ff (as of Feb 17th, 2021)
         --> TVB sends and receives from rank 0 on transformer side.
             --> nest_elephant_tvb/translation/test_file/test_receive_nest_to_tvb.py
             --> line 32 ff (as of Feb 17th, 2021)
-            --> Here: Rank 1-x are doing analysis/science and sending to TVB
+            --> Here: Rank 1-x are doing analysis/science, rank 1 is sending to TVB
             --> For now, hardcoded solution. All places with 'rank 0' are replaced with 'rank 1'
-            --> But as soon as we use more than two MPI ranks, this fails again!!!
+    
+    MPI parallelism of the reception: the ranks 0-(R-1) receive from NEST (R = param['nb_receiver'], default 1),
+    each of them from the NEST ranks s with s % R equal to its rank, in its own segment of the shared buffer.
+    R > 1 is only for a sender with this routing (param['modulo_routing']), not the MPI recording backend of NEST.
+    MPI parallelism of the science: the events of each simulation step are split between
+    the ranks R-x (intra communicator without the receiving ranks). Each rank computes the histogram of its
+    part, the histograms are summed with a MPI reduction on rank R, which computes the rates
+    and sends them to TVB (rank 1 with the default R=1).
+    Multiplex mode (param['multiplex']): all the spike detectors send on the same connection, the events are
+    split by spike detector (param['hist_ids']) and the rates of all the regions are sent together to TVB.
     
     TODO: Renaming! Translator -> transformer, etc.
     TODO: This is only the Nest to TVB direction. For other direction some generalizing changes will be needed.
     TODO: Use RichEndPoints for communication encapsulation
     TODO: Seperate 1)Receive 2)Analysis/Science and 3)Send. See also the many Todos in the code
-    TODO: Make use of / enable MPI parallelism! Solve hardcoded communication protocol first
     '''
     
     # destructure logger list to indivual variables
@@ -37,22 +45,36 @@ def init(path, param, comm, comm_receiver, comm_sender, loggers):
     analyse = analyse_data(path+'/log/',param)
     
     ############ NEW Code: 
-    # TODO: future work: mpi parallel, use rank 1-x for science and sending
-    # TODO: use this MPI intracommunicator, without receiving rank 0
-    # intracomm = comm.Create(comm.Get_group().Excl([0]))
-    # create the shared memory block / databuffer
-    databuffer = _shared_mem_buffer(comm)
+    # number of receiving ranks (not more than the number of NEST ranks)
+    nb_receiver = param['nb_receiver'] if 'nb_receiver' in param.keys() else 1
+    # the MPI recording backend of NEST sends all its ranks to the rank 0 : more receiving ranks need a sender
+    # which sends from its rank s to the rank s % nb_receiver
+    modulo_routing = param['modulo_routing'] if 'modulo_routing' in param.keys() else False
+    if nb_receiver > 1 and not modulo_routing:
+        raise Exception("more than one receiving rank (nb_receiver=" + str(nb_receiver) + ") needs a sender "
+                        "with the routing of its rank s to the rank s % nb_receiver (param 'modulo_routing')")
+    nb_receiver = min(nb_receiver, comm_receiver.Get_remote_size())
+    if comm.Get_size() <= nb_receiver:
+        raise Exception("the translator needs at least one rank for the analysis : "
+                        + str(comm.Get_size()) + " ranks for " + str(nb_receiver) + " receiving ranks")
+    # MPI intracommunicator for the science, without the receiving ranks
+    intracomm = comm.Create(comm.Get_group().Excl(list(range(nb_receiver))))
+    # create the ring of shared memory blocks / databuffer
+    nb_slot = param['nb_slot'] if 'nb_slot' in param.keys() else 2
+    databuffer = SharedRing(comm, nb_slot, nb_receiver)
     ############# NEW Code end
     
     ############ NEW Code: Receive/analyse/send
-    if comm.Get_rank() == 0: # Receiver from NEST, rank 0
-        # TODO: The choice of rank 0 here stems from the current communication with NEST. 
-        # All MPI communication is done with rank 0 from NESt side.
-        # Make this (and the TVB side as well) scalable. 
+    if comm.Get_rank() < nb_receiver: # Receiver from NEST, rank 0-(nb_receiver-1)
+        # NOTE: the sender rank s sends to and receives from the rank s % nb_receiver (modulo_routing).
+        # With the default (nb_receiver=1), it's rank 0 for all NEST ranks,
+        # which is the rank hardcoded in the MPI recording backend of NEST.
         _receive(comm_receiver, databuffer, logger_receive)
-    else: #  Science/analyse and sender to TVB, rank 1-x
-        _send(comm_sender, databuffer, logger_send, store, analyse)
+    else: #  Science/analyse and sender to TVB, rank nb_receiver-x
+        _send(comm_sender, intracomm, databuffer, logger_send, store, analyse)
+        intracomm.Free()
     ############ NEW Code end
+    databuffer.free()
     
     ############ NEW Code: disconnect
     # TODO: should this be done here?
@@ -62,112 +84,324 @@ def init(path, param, comm, comm_receiver, comm_sender, loggers):
     ############ NEW Code end
 
 
-def _shared_mem_buffer(comm):
+# status of a slot of the ring
+SLOT_FREE = 0   # the slot can receive the next simulation step from NEST
+SLOT_READY = 1  # the slot contains one simulation step, ready for the analysis
+SLOT_GROW = 2   # the simulation step doesn't fit in the slot, all ranks need to reallocate it
+# columns of the header
+HEADER_STATUS = 0    # status of the segment
+HEADER_SIZE = 1      # number of doubles of the simulation step in the segment
+HEADER_CAPACITY = 2  # number of doubles which fit in the segment
+
+INIT_SLOT_SIZE = 10000 * 3 # initial number of doubles by segment (10000 events)
+# tags of the notifications between the ranks of the translator (intra communicator)
+TAG_SLOT = 100 # receiving ranks -> science ranks : new status of a slot (ready or grow)
+TAG_FREE = 101 # science ranks -> receiving ranks : the slot is analysed, it can be reused
+
+
+class SharedRing:
     '''
-    Create shared memory buffer. MPI One-sided-Communication.
-    :param comm: MPI intra communicator to create the buffer.
-    :return buffer: 1D shared memory buffer array 
-    
-    TODO: Buffersize/max. expected number of events hardcoded
-    -> free param, handle properly!
+    Ring of shared memory buffers. MPI One-sided-Communication.
+    The receiving ranks 0-(R-1) (writers) fill the slots one after the other with the simulation steps of NEST,
+    the ranks R-x analyse them in the same order. With more than one slot, receiving
+    step n+1 from NEST overlaps with the analysis of step n.
+
+    Each slot has one segment by writer: a writer receives the packages of its NEST ranks
+    in its own segment, independently of the other writers.
+    The control information is in a separate header (shared int64 array, one row by slot and by writer),
+    the segments contain only the events.
+    The handoff of a slot is notified with small MPI messages on the intra communicator
+    (no polling of the header): see publish/wait_published and release/wait_free.
+    Each slot is a separate shared window, so that a slot can be reallocated when a package
+    from NEST is bigger than its capacity. The new capacity is the largest package received so far.
     Explanation:
     -> each package from NEST contains a continuous list of the events of the current simulation step
     -> the number of events in each package is unknown and not constant
     -> each event is three doubles: Id_recording_device, neuronID, spiketimes
-    
-    TODO: reshaping of the buffer content is done in the science part
-    -> 1D array to shape (x,3) where x is the number of events.
-    -> this is decided by the nest I/O part, i.e. nest sends out events in 1D array 
-    -> can/should this be more generic?
     '''
-    datasize = MPI.DOUBLE.Get_size()
-    bufsize = 1000000 * 3 # NOTE: hardcoded (max.expected events per package from nest)
-    if comm.Get_rank() == 0:
-        bufbytes = datasize * bufsize
-    else: 
-        bufbytes= 0
-    # rank 0: create the shared block
-    # rank 1-x: get a handle to it
-    win = MPI.Win.Allocate_shared(bufbytes, datasize, comm=comm)
-    buf, datasize = win.Shared_query(0)
-    assert datasize == MPI.DOUBLE.Get_size()
-    # create a numpy array (buffer) whose data points to the shared mem
-    return np.ndarray(buffer=buf, dtype='d', shape=(bufsize,))
+    def __init__(self, comm, nb_slot, nb_writer=1, init_size=INIT_SLOT_SIZE):
+        '''
+        Create the header and the slots (collective on comm)
+        :param comm: MPI intra communicator to create the buffer.
+        :param nb_slot: number of slots of the ring
+        :param nb_writer: number of receiving ranks (rank 0 to nb_writer-1)
+        :param init_size: initial number of doubles of each segment
+        '''
+        self.comm = comm
+        self.nb_slot = nb_slot
+        self.nb_writer = nb_writer
+        self.max_size = init_size # largest package received so far
+        self.writer = comm.Get_rank() < nb_writer
+        self.readers = list(range(nb_writer, comm.Get_size())) # ranks which analyse the slots
+        self.nb_release = 1 # number of ranks which release each slot (first science rank, after the reduction)
+        self._pending = np.zeros(nb_slot, dtype=int) # writers: number of releases still expected by slot
+        self._requests = [] # writers: notifications not yet completed
+        self._nb_released = 0 # releasing ranks: number of slots released
+        self._nb_freed = 0 # writers: number of notifications of release received
+        # communicator of the writers, for deciding together the reallocation of a slot
+        self.writecomm = comm.Split(0 if self.writer else MPI.UNDEFINED, comm.Get_rank())
+        # header
+        itemsize = MPI.INT64_T.Get_size()
+        nbytes = itemsize * nb_slot * nb_writer * 3 if comm.Get_rank() == 0 else 0
+        self._win_header = MPI.Win.Allocate_shared(nbytes, itemsize, comm=comm)
+        # passive target epoch for the whole life of the window, memory synchronised with Sync
+        self._win_header.Lock_all(MPI.MODE_NOCHECK)
+        buf, itemsize = self._win_header.Shared_query(0)
+        assert itemsize == MPI.INT64_T.Get_size()
+        self.header = np.ndarray(buffer=buf, dtype=np.int64, shape=(nb_slot, nb_writer, 3))
+        if comm.Get_rank() == 0:
+            self.header[:, :, HEADER_STATUS] = SLOT_FREE
+            self.header[:, :, HEADER_SIZE] = 0
+        comm.Barrier()
+        # slots
+        self._win_slots = [None] * nb_slot
+        self.slots = [None] * nb_slot
+        for index in range(nb_slot):
+            self._allocate(index, init_size)
+        self._win_header.Sync()
+        comm.Barrier()
+
+    def _allocate(self, index, size):
+        '''
+        (Re)allocate one slot (collective on comm)
+        writers: create their segment of the shared block
+        other ranks: get a handle to all the segments
+        :param index: index of the slot
+        :param size: number of doubles of the segment of this rank (ignored if not a writer)
+        '''
+        if self._win_slots[index] is not None:
+            self.slots[index] = None
+            self._win_slots[index].Unlock_all()
+            self._win_slots[index].Free()
+        datasize = MPI.DOUBLE.Get_size()
+        bufbytes = datasize * size if self.writer else 0
+        win = MPI.Win.Allocate_shared(bufbytes, datasize, comm=self.comm)
+        win.Lock_all(MPI.MODE_NOCHECK)
+        # create numpy arrays (buffers) whose data points to the shared mem
+        segments = []
+        for rank in range(self.nb_writer):
+            buf, datasize = win.Shared_query(rank)
+            assert datasize == MPI.DOUBLE.Get_size()
+            segments.append(np.ndarray(buffer=buf, dtype='d', shape=(int(len(buf)/datasize),)))
+        self._win_slots[index] = win
+        self.slots[index] = segments
+        if self.writer:
+            self.header[index, self.comm.Get_rank(), HEADER_CAPACITY] = size
+
+    def grow(self, index):
+        '''
+        Reallocate a slot with the status SLOT_GROW (collective on comm)
+        The new capacity of each segment is given by its writer in the header,
+        the events already in the segment are kept.
+        :param index: index of the slot
+        '''
+        if self.writer:
+            rank = self.comm.Get_rank()
+            capacity = int(self.header[index, rank, HEADER_CAPACITY])
+            size = min(int(self.header[index, rank, HEADER_SIZE]), self.slots[index][rank].shape[0], capacity)
+            events = np.copy(self.slots[index][rank][:size])
+            self._allocate(index, capacity)
+            self.slots[index][rank][:size] = events
+        else:
+            self._allocate(index, 0)
+
+    def events(self, index):
+        '''
+        The events of a slot
+        :param index: index of the slot
+        :return: list of the filled part of the segments (view on the shared memory)
+        '''
+        return [self.slots[index][rank][:int(self.header[index, rank, HEADER_SIZE])] for rank in range(self.nb_writer)]
+
+    def _sync(self, index):
+        '''
+        Synchronise the public and private copies of the header and of one slot
+        :param index: index of the slot
+        '''
+        self._win_slots[index].Sync()
+        self._win_header.Sync()
+
+    def publish(self, index, status):
+        '''
+        writers: set the status of its segment of a slot and notify the science ranks
+        :param index: index of the slot
+        :param status: SLOT_READY or SLOT_GROW
+        '''
+        self.header[index, self.comm.Get_rank(), HEADER_STATUS] = status
+        self._sync(index)
+        if status == SLOT_READY:
+            self._pending[index] = self.nb_release
+        # complete the previous notifications before sending new ones
+        MPI.Request.Waitall(self._requests)
+        message = np.array([index, status], dtype='i')
+        self._requests = [self.comm.Isend([message, MPI.INT], dest=rank, tag=TAG_SLOT) for rank in self.readers]
+
+    def wait_published(self, index):
+        '''
+        science ranks: wait for the notification of all the writers for a slot (blocking, no polling)
+        :param index: index of the expected slot
+        :return: the status of the slot (SLOT_GROW if one of the writers needs a reallocation)
+        '''
+        message = np.empty(2, dtype='i')
+        statuses = np.empty(self.nb_writer, dtype=int)
+        for rank in range(self.nb_writer):
+            self.comm.Recv([message, MPI.INT], source=rank, tag=TAG_SLOT)
+            if message[0] != index:
+                raise Exception("bad slot notification "+str(message[0])+" instead of "+str(index))
+            statuses[rank] = message[1]
+        self._sync(index)
+        # consistency of the header with the notifications
+        if not np.array_equal(self.header[index, :, HEADER_STATUS], statuses):
+            raise Exception("bad status of the slot "+str(index)+" : "+str(self.header[index, :, HEADER_STATUS])
+                            +" instead of "+str(statuses))
+        return max(SLOT_READY, int(np.max(statuses)))
+
+    def release(self, index):
+        '''
+        science ranks: the analysis of the slot is done, give it back to the writers
+        :param index: index of the slot
+        '''
+        self.header[index, :, HEADER_STATUS] = SLOT_FREE
+        self._sync(index)
+        self._nb_released += 1
+        for rank in range(self.nb_writer):
+            self.comm.Send([np.array([index], dtype='i'), MPI.INT], dest=rank, tag=TAG_FREE)
+
+    def wait_free(self, index):
+        '''
+        writers: wait until a slot is released by the science ranks (blocking, no polling)
+        :param index: index of the slot
+        '''
+        while self._pending[index] > 0:
+            self._receive_free()
+        self._sync(index)
+        if self.header[index, self.comm.Get_rank(), HEADER_STATUS] != SLOT_FREE:
+            raise Exception("bad status of the free slot "+str(index)+" : "
+                            +str(self.header[index, self.comm.Get_rank(), HEADER_STATUS]))
+
+    def _receive_free(self):
+        '''
+        writers: receive one notification of release
+        '''
+        message = np.empty(1, dtype='i')
+        self.comm.Recv([message, MPI.INT], source=MPI.ANY_SOURCE, tag=TAG_FREE)
+        self._pending[message[0]] -= 1
+        self._nb_freed += 1
+
+    def free(self):
+        '''
+        Release all the shared windows (collective on comm)
+        The writers receive the notifications of release of the last slots, which were never waited for.
+        '''
+        nb_released = self.comm.allreduce(self._nb_released, op=MPI.SUM)
+        if self.writer:
+            while self._nb_freed < nb_released:
+                self._receive_free()
+        MPI.Request.Waitall(self._requests)
+        for index in range(self.nb_slot):
+            self.slots[index] = None
+            self._win_slots[index].Unlock_all()
+            self._win_slots[index].Free()
+        self.header = None
+        self._win_header.Unlock_all()
+        self._win_header.Free()
+        if self.writecomm != MPI.COMM_NULL:
+            self.writecomm.Free()
 
 
 # See todo in the beginning, encapsulate I/O, transformer, science parts
 def _receive(comm_receiver, databuffer, logger):
     '''
-    Receive data on rank 0. Put it into the shared mem buffer.
+    Receive data on the receiving ranks. Put it into the shared mem buffer.
+    Each receiving rank r handles the NEST ranks s with s % nb_receiver == r.
+    The messages of all these NEST ranks are posted together (non blocking),
+    MPI receives them in whichever order they arrive.
     Replaces the former 'receive' function.
     NOTE: First refactored version -> not pretty, not final. 
     '''
-    status_ = MPI.Status()
+    rank = databuffer.comm.Get_rank()
     num_sending = comm_receiver.Get_remote_size() # how many NEST ranks are sending?
+    sources = list(range(rank, num_sending, databuffer.nb_writer)) # the NEST ranks of this receiving rank
+    statuses = [MPI.Status() for source in sources]
     # TODO: It seems the 'check' variable is used to receive tags from NEST, i.e. ready for send...
     # change this in the future, also mentioned in the FatEndPoint solution from Wouter.
-    check = np.empty(1,dtype='b')
-    shape = np.empty(1, dtype='i')    
+    check = np.empty((len(sources), 1), dtype='b')
+    shape = np.empty((len(sources), 1), dtype='i')
+    ready = np.array(True, dtype='b')
     count = 0
-    # TODO: the last two buffer entries are used for shared information
-    # --> they replace the status_data variable from previous version
-    # --> find more elegant solution?
-    databuffer[-1] = 1 # set buffer to 'ready to receive from nest'
-    databuffer[-2] = 0 # marks the 'head' of the buffer
+    # the control information is in the header of the ring
+    # --> it replaces the status_data variable from previous version
+    index_slot = 0 # slot of the ring for the next simulation step
     
     while(True):
         logger.info(" Nest to TVB : wait all")
-        head_ = 0 # head of the buffer, reset after each iteration
-         
         # TODO: This is still not correct. We only check for the Tag of the last rank.
         # TODO: IF all ranks send always the same tag in one iteration (simulation step)
         # TODO: then this works. But it should be handled differently!!!!
-        for i in range(num_sending):
-            # new: We do not care which source sends first, give MPI the freedom to send in whichever order.
-            comm_receiver.Recv([check, 1, MPI.CXX_BOOL], source=MPI.ANY_SOURCE, tag=MPI.ANY_TAG, status=status_)
+        requests = [comm_receiver.Irecv([check[i], 1, MPI.CXX_BOOL], source=source, tag=MPI.ANY_TAG)
+                    for i, source in enumerate(sources)]
+        MPI.Request.Waitall(requests, statuses)
+        tag = statuses[-1].Get_tag()
         # TODO: handle properly, all ranks send tag 0?
-        if status_.Get_tag() == 0:
-            # wait until ready to receive new data (i.e. the sender has cleared the buffer)
-            while databuffer[-1] != 1: # TODO: use MPI, remove the sleep
-                time.sleep(0.001)
-                pass
-            for source in range(num_sending):
-                # send 'ready' to the nest rank
-                comm_receiver.Send([np.array(True,dtype='b'),MPI.BOOL],dest=source,tag=0)
-                # receive package size info
-                comm_receiver.Recv([shape, 1, MPI.INT], source=source, tag=0, status=status_)
+        if tag == 0:
+            # wait until the slot is ready to receive new data (i.e. the sender has analysed it)
+            databuffer.wait_free(index_slot)
+            slot = databuffer.slots[index_slot][rank]
+            # send 'ready' to the nest ranks and receive the package size info
+            requests = [comm_receiver.Isend([ready, MPI.BOOL], dest=source, tag=0) for source in sources]
+            requests += [comm_receiver.Irecv([shape[i], 1, MPI.INT], source=source, tag=0)
+                         for i, source in enumerate(sources)]
+            MPI.Request.Waitall(requests)
+            # place of each package in the segment of this rank
+            offsets = np.concatenate(([0], np.cumsum(shape[:, 0])))
+            head_ = int(offsets[-1]) # important: head_ is first buffer index WITHOUT data.
+            if head_ <= slot.shape[0]:
                 # NEW: receive directly into the buffer
-                comm_receiver.Recv([databuffer[head_:], MPI.DOUBLE], source=source, tag=0, status=status_)
-                head_ += shape[0] # move head 
-                # TODO: revisit and check for proper encapsulation
-                # Here, storing and adding the spikes to the histogram was done
-                # Old code: store.add_spikes(count,data)
-                # This increased the workload of this MPI rank.
-                # All science and analysis stuff is moved to the 'sender' part. Because future parallel.
+                buffer = slot
+            else:
+                # the slot is too small: keep the packages aside until the slot is reallocated
+                buffer = np.empty(head_, dtype='d')
+            requests = [comm_receiver.Irecv([buffer[offsets[i]:offsets[i+1]], MPI.DOUBLE], source=source, tag=0)
+                        for i, source in enumerate(sources)]
+            MPI.Request.Waitall(requests)
+            # TODO: revisit and check for proper encapsulation
+            # Here, storing and adding the spikes to the histogram was done
+            # Old code: store.add_spikes(count,data)
+            # This increased the workload of this MPI rank.
+            # All science and analysis stuff is moved to the 'sender' part. Because future parallel.
+            databuffer.header[index_slot, rank, HEADER_SIZE] = head_
+            databuffer.max_size = max(databuffer.max_size, head_)
+            # the slot is reallocated by all the ranks when one of the receiving ranks needs it
+            if databuffer.writecomm.allreduce(buffer is not slot, op=MPI.LOR):
+                if buffer is not slot:
+                    logger.info("Nest to TVB : grow slot "+str(index_slot)+" to "+str(databuffer.max_size))
+                    databuffer.header[index_slot, rank, HEADER_CAPACITY] = databuffer.max_size
+                databuffer.publish(index_slot, SLOT_GROW)
+                databuffer.grow(index_slot)
+                if buffer is not slot:
+                    databuffer.slots[index_slot][rank][:head_] = buffer
             # Mark as 'ready to do analysis'
-            databuffer[-1] = 0
-            # important: head_ is first buffer index WITHOUT data.
-            databuffer[-2] = head_
+            databuffer.publish(index_slot, SLOT_READY)
+            index_slot = (index_slot + 1) % databuffer.nb_slot
         # TODO: handle properly, all ranks send tag 1?
-        elif status_.Get_tag() == 1:
+        elif tag == 1:
             count += 1
             logger.info("Nest to TVB : receive end " + str(count))
         # TODO: handle properly, all ranks send tag 2?
-        elif status_.Get_tag() == 2:
+        elif tag == 2:
             logger.info("end simulation")
             break
         else:
-            raise Exception("bad mpi tag"+str(status_.Get_tag()))
+            raise Exception("bad mpi tag"+str(tag))
     
     logger.info('NEST_to_TVB: End of receive function')
 
 
 # See todo in the beginning, encapsulate I/O, transformer, science parts
-def _send(comm_sender, databuffer, logger, store, analyse):
+def _send(comm_sender, intracomm, databuffer, logger, store, analyse):
     '''
     Analysis/Science on INTRAcommunicator (multiple MPI ranks possible).
-    TODO: not yet used, see also analysis function below
-    Send data to TVB on INTERcommunicator comm_sender (multiple MPI ranks possible).
+    Send data to TVB on INTERcommunicator comm_sender (rank 0 of intracomm, i.e. rank 1).
     Replaces the former 'send' function.
     NOTE: First refactored version -> not pretty, not final. 
     
@@ -176,67 +410,83 @@ def _send(comm_sender, databuffer, logger, store, analyse):
     '''
 
     count=0
+    index_slot = 0 # slot of the ring with the next simulation step
     status_ = MPI.Status()
+    root = intracomm.Get_rank() == 0 # the rank which communicates with TVB
     while True: # FAT END POINT
         # TODO: this communication has the 'rank 0' problem described in the beginning
-        accept = False
-        logger.info("Nest to TVB : wait to send " )
-        while not accept:
-            req = comm_sender.irecv(source=MPI.ANY_SOURCE,tag=MPI.ANY_TAG)
-            accept = req.wait(status_)
-        logger.info(" Nest to TVB : send data status : " +str(status_.Get_tag()))
-        if status_.Get_tag() == 0:
-            # wait until the receiver has cleared the buffer, i.e. filled with new data
-            while databuffer[-1] != 0: # TODO: use MPI, remove the sleep
-                time.sleep(0.001)
-                pass
+        tag = None
+        if root:
+            accept = False
+            logger.info("Nest to TVB : wait to send " )
+            while not accept:
+                req = comm_sender.irecv(source=MPI.ANY_SOURCE,tag=MPI.ANY_TAG)
+                accept = req.wait(status_)
+            tag = status_.Get_tag()
+        # all the science ranks follow the request of TVB
+        tag = intracomm.bcast(tag, root=0)
+        logger.info(" Nest to TVB : send data status : " +str(tag))
+        if tag == 0:
+            # wait until the receiver has filled the slot with new data
+            if databuffer.wait_published(index_slot) == SLOT_GROW:
+                # the receiver needs a bigger slot
+                databuffer.grow(index_slot)
+                databuffer.wait_published(index_slot)
             # TODO: All science/analysis here. Move to a proper place.
-            times,data = _analyse(count, databuffer, store, analyse)
+            result = _analyse(count, databuffer.events(index_slot), store, analyse, intracomm)
             
-            # Mark as 'ready to receive next simulation step'
-            databuffer[-1] = 1
-            
-            ############ OLD Code
-            # TODO: this communication has the 'rank 0' problem described in the beginning
-            logger.info("Nest to TVB : send data :"+str(np.sum(data)) )
-            # time of stating and ending step
-            comm_sender.Send([times, MPI.DOUBLE], dest=status_.Get_source(), tag=0)
-            # send the size of the rate
-            size = np.array(int(data.shape[0]),dtype='i')
-            comm_sender.Send([size,MPI.INT], dest=status_.Get_source(), tag=0)
-            # send the rates
-            comm_sender.Send([data,MPI.DOUBLE], dest=status_.Get_source(), tag=0)
-            ############ OLD Code end
-        elif status_.Get_tag() == 1:
+            if root:
+                # Mark as 'ready to receive next simulation step' (all ranks are done after the reduction)
+                databuffer.release(index_slot)
+                times,data = result
+                ############ OLD Code
+                # TODO: this communication has the 'rank 0' problem described in the beginning
+                logger.info("Nest to TVB : send data :"+str(np.sum(data)) )
+                # time of stating and ending step
+                comm_sender.Send([times, MPI.DOUBLE], dest=status_.Get_source(), tag=0)
+                # send the size of the rate (in multiplex mode, the rates of all the regions : (nb_bin,nb_region))
+                data = np.ascontiguousarray(data)
+                size = np.array(int(data.size),dtype='i')
+                comm_sender.Send([size,MPI.INT], dest=status_.Get_source(), tag=0)
+                # send the rates
+                comm_sender.Send([data,MPI.DOUBLE], dest=status_.Get_source(), tag=0)
+                ############ OLD Code end
+            index_slot = (index_slot + 1) % databuffer.nb_slot
+        elif tag == 1:
             # disconnect when everything is ending
             break
         else:
-            raise Exception("bad mpi tag"+str(status_.Get_tag()))
+            raise Exception("bad mpi tag"+str(tag))
         count+=1
     logger.info('NEST_to_TVB: End of send function')
 
 
 # See todo in the beginning, encapsulate I/O, transformer, science parts
-def _analyse(count, databuffer, store, analyse):
+def _analyse(count, databuffer, store, analyse, intracomm):
     '''
     All analysis and science stuff in one place.
     Done in three steps, that were previously disconnected.
     Step 1 and 2 were done in the receiving thread, step 3 in the sending thread.
     NOTE: All science and analysis is the same as before.
     :param count: Simulation iteration/step
-    :param databuffer: The buffer contains the spikes of the current step
+    :param databuffer: The events of the current step (views on the segments of the slot of the ring)
     :param store: Python object, create the histogram 
     :param analyse: Python object, calculate rates
-    :return times, data: simulation times and the calculated rates
-    
-    TODO: Step 1 and 2 can be merged into one step. Buffer is no longer filled rank by rank.
-    TODO: Make this parallel with the INTRA communicator (should be embarrassingly parallel).
+    :param intracomm: MPI intra communicator of the science ranks
+    :return times, data: simulation times and the calculated rates (None except on rank 0 of intracomm)
     '''
-    # Step 1) take all data from buffer and create histogram
-    # second to last index in databuffer denotes how much data there is
-    store.add_spikes(count,databuffer[:int(databuffer[-2])])
-    # Step 2) take the resulting histogram
-    data_to_analyse = store.return_data()
+    # Step 1) take the part of the events of this rank in each segment and create its histogram
+    for events in databuffer:
+        nb_event = int(events.shape[0]/3)
+        begin = int(nb_event * intracomm.Get_rank() / intracomm.Get_size())
+        end = int(nb_event * (intracomm.Get_rank()+1) / intracomm.Get_size())
+        store.add_spikes(count,events[begin*3:end*3])
+    # Step 2) take the resulting histogram and sum the histograms of all ranks
+    hist = store.return_data()
+    data_to_analyse = np.empty_like(hist) if intracomm.Get_rank() == 0 else None
+    intracomm.Reduce(hist, data_to_analyse, op=MPI.SUM, root=0)
+    if intracomm.Get_rank() != 0:
+        return None
     # Step 3) Analyse this data, i.e. calculate rates?
     times,data = analyse.analyse(count,data_to_analyse)
     
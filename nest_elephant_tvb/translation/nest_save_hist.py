@@ -3,49 +3,174 @@
 
 import numpy as np
 import json
+import time
 from mpi4py import MPI
 from threading import Thread
+from queue import Queue, Full
+import os
 import pathlib
-import time
-from nest_elephant_tvb.translation.nest_to_tvb import receive,store_data,lock_status,create_logger
+from nest_elephant_tvb.translation.nest_to_tvb import create_logger
+from nest_elephant_tvb.translation.spike_store import SpikeStore
+from nest_elephant_tvb.translation.spike_codec import load_populations
+from nest_elephant_tvb.translation.science_nest_to_tvb import online_statistics
+
+WAIT_WRITER = 1.0 # time in s between two checks of the writer when the queue is full
+
+def check_writer(writer,errors):
+    '''
+    raise the error of the writer if it stopped before the end of the recording
+    :param writer : the thread of the writer
+    :param errors : the errors of the writer (SHARED between thread)
+    '''
+    if not writer.is_alive():
+        if len(errors) > 0:
+            raise errors[0]
+        raise Exception('the writer stopped before the end of the recording')
+
+def put_block(queue,item,writer,errors):
+    '''
+    wait for a place in the queue while the writer is running
+    :param queue : the bounded queue of the blocks of spikes (SHARED between thread)
+    :param item : the block of spikes or None for the end of the recording
+    :param writer : the thread of the writer
+    :param errors : the errors of the writer (SHARED between thread)
+    '''
+    while True:
+        try:
+            queue.put(item, timeout=WAIT_WRITER)
+            return
+        except Full:
+            # without the writer, the queue is never emptied
+            check_writer(writer,errors)
 
-def save(path,logger,nb_step,step_save,status_data,buffer):
+def receive(logger,queue,policy,comm,writer,errors):
     '''
-    WARNING never ending
-    :param path:  folder which will contain the configuration file
+    receive the spikes of Nest and give the block of each step to the writer
+    The writing on the disk is done by the writer thread : a slow disk doesn't stop Nest until the queue is full.
     :param logger : the logger fro the thread
-    :param nb_step : number of time for saving data
-    :param step_save : number of integration step to save in same time
-    :param status_data: the status of the buffer (SHARED between thread)
-    :param buffer: the buffer which contains the data (SHARED between thread)
-    :return:
+    :param queue : the bounded queue of the blocks of spikes of each step for the writer (SHARED between thread)
+    :param policy : 'block' : wait for a place in the queue, 'drop' : lose the block if the queue is full
+    :param comm : the MPI communicator with Nest
+    :param writer : the thread of the writer, its error is raised if it stops before the end of the recording
+    :param errors : the errors of the writer (SHARED between thread)
+    :return: the metrics of the queue
     '''
     # initialisation variable
-    buffer_save = None
-    count=0
-    while count<nb_step: # FAT END POINT
-        logger.info("Nest save : save "+str(count))
-        # send the rate when there ready
-        while status_data[0] != 0 and status_data[0] != 2: # FAT END POINT
-            time.sleep(0.1)
-            pass
-        if buffer_save is None:
-            logger.info("buffer initialise buffer : "+str(count))
-            buffer_save = buffer[0]
-        elif count % step_save == 0:
-            logger.info("buffer save buffer : "+str(count))
-            buffer_save = np.concatenate((buffer_save,buffer[0]))
-            np.save(path+"_"+str(count)+".npy",buffer_save)
-            buffer_save = None
+    sources = list(range(comm.Get_remote_size())) # all the Nest ranks
+    statuses = [MPI.Status() for source in sources]
+    check = np.empty((len(sources), 1), dtype='b')
+    shape = np.empty((len(sources), 1), dtype='i')
+    ready = np.array(True, dtype='b')
+    count = 0
+    # metrics of the backpressure of the writer
+    metrics = {'nb_block':0,'nb_block_drop':0,'nb_event_drop':0,'time_wait':0.0,'max_queue':0}
+    while True: # FAT END POINT
+        logger.info("Nest save : wait all")
+        requests = [comm.Irecv([check[i], 1, MPI.CXX_BOOL], source=source, tag=MPI.ANY_TAG)
+                    for i, source in enumerate(sources)]
+        MPI.Request.Waitall(requests, statuses)
+        tag = statuses[-1].Get_tag()
+        if tag == 0:
+            # send 'ready' to the nest ranks and receive the size of the packages
+            requests = [comm.Isend([ready, MPI.BOOL], dest=source, tag=0) for source in sources]
+            requests += [comm.Irecv([shape[i], 1, MPI.INT], source=source, tag=0)
+                         for i, source in enumerate(sources)]
+            MPI.Request.Waitall(requests)
+            offsets = np.concatenate(([0], np.cumsum(shape[:, 0])))
+            data = np.empty(offsets[-1], dtype='d')
+            requests = [comm.Irecv([data[offsets[i]:offsets[i+1]], MPI.DOUBLE], source=source, tag=0)
+                        for i, source in enumerate(sources)]
+            MPI.Request.Waitall(requests)
+            # the events are triplets : id of spike detector, id of neuron, time
+            events = np.reshape(data, (-1, 3))
+            metrics['nb_block'] += 1
+            metrics['max_queue'] = max(metrics['max_queue'], queue.qsize())
+            check_writer(writer,errors)
+            if policy == 'drop':
+                try:
+                    queue.put_nowait((count, events))
+                except Full:
+                    metrics['nb_block_drop'] += 1
+                    metrics['nb_event_drop'] += events.shape[0]
+                    logger.warning("Nest save : queue full, drop "+str(events.shape[0])+" events")
+            else:
+                start = time.time()
+                put_block(queue, (count, events), writer, errors) # FAT END POINT
+                metrics['time_wait'] += time.time() - start
+            logger.info("Nest save : receive "+str(events.shape[0])+" events")
+        elif tag == 1:
+            count += 1
+            logger.info("Nest save : end step " + str(count))
+        elif tag == 2:
+            logger.info("Nest save : end simulation")
+            break
         else:
-            logger.info("fill the buffer : "+str(count))
-            buffer_save = np.concatenate((buffer_save,buffer[0]))
-        with lock_status:
-            status_data[0]=1
-        count+=1
-    logger.info('Save : ending');sys.stdout.flush()
-    if buffer_save is not None:
-        np.save(path + "_" + str(count) + ".npy", buffer_save)
+            raise Exception("bad mpi tag"+str(tag))
+    put_block(queue, None, writer, errors) # end of the recording
+    logger.info('Nest save : metrics '+str(metrics))
+    return metrics
+
+
+def write(logger,store,save_step,queue,errors):
+    '''
+    write the blocks of spikes in the store until the end of the recording
+    :param logger : the logger fro the thread
+    :param store : the store of the spikes
+    :param save_step : number of simulation steps between two flush of the store on the disk (0 : only at the end of chunks)
+    :param queue : the bounded queue of the blocks of spikes (SHARED between thread)
+    :param errors : the errors of the writer for the receiving thread (SHARED between thread)
+    :return:
+    '''
+    try:
+        count = 0
+        while True:
+            item = queue.get() # FAT END POINT
+            if item is None:
+                break
+            step, events = item
+            store.append(events[:, 0], events[:, 1], events[:, 2])
+            count += 1
+            logger.info("Nest save : store "+str(events.shape[0])+" events")
+            if save_step != 0 and count % save_step == 0:
+                store.flush()
+        store.close()
+    except Exception as error:
+        logger.error('Save : error of the writer : '+repr(error))
+        errors.append(error)
+        return
+    logger.info('Save : ending')
+    return
+
+
+def write_statistics(logger,statistics,path,save_step,queue,errors):
+    '''
+    compute the statistics of the blocks of spikes until the end of the recording, only the statistics are saved
+    :param logger : the logger fro the thread
+    :param statistics : the online statistics of the spikes
+    :param path : the file for the statistics
+    :param save_step : number of simulation steps between two saving of the statistics (0 : only at the end)
+    :param queue : the bounded queue of the blocks of spikes (SHARED between thread)
+    :param errors : the errors of the writer for the receiving thread (SHARED between thread)
+    :return:
+    '''
+    try:
+        count = 0
+        while True:
+            item = queue.get() # FAT END POINT
+            if item is None:
+                break
+            step, events = item
+            statistics.add_spikes(step, np.ravel(events))
+            count += 1
+            logger.info("Nest save : statistics of "+str(events.shape[0])+" events")
+            if save_step != 0 and count % save_step == 0:
+                np.savez(path, **statistics.summary())
+        np.savez(path, **statistics.summary())
+    except Exception as error:
+        logger.error('Save : error of the writer : '+repr(error))
+        errors.append(error)
+        return
+    logger.info('Save : ending')
     return
 
 
@@ -62,18 +187,40 @@ if __name__ == "__main__":
         with open(path_folder_config+'/parameter.json') as f:
             parameters = json.load(f)
         param = parameters['param_record_MPI']
-        time_synch = param['synch']
-        nb_step = np.ceil(end/time_synch)
         step_save = param['save_step']
         level_log = param['level_log']
-        logger_master = create_logger(path_folder_config, 'nest_to_tvb_master', level_log)
+        chunk_size = param['chunk_size'] if 'chunk_size' in param.keys() else 1048576
+        queue_size = param['queue_size'] if 'queue_size' in param.keys() else 8
+        policy = param['policy'] if 'policy' in param.keys() else 'block'
+        if policy != 'block' and policy != 'drop':
+            raise Exception('unknown policy of the queue : '+str(policy))
+        logger_master = create_logger(path_folder_config, 'nest_save_master', level_log)
 
-        # variable for communication between thread
-        status_data=[1] # status of the buffer
-        buffer=[np.array([])]
+        # encoding of the chunks : the neurons are encoded by their position in the populations of Nest
+        codec_level = param['codec_level'] if 'codec_level' in param.keys() else None
+        path_populations = path_folder_config+'/nest/population_GIDs.dat'
+        populations = load_populations(path_populations) if os.path.exists(path_populations) else None
 
-        # object for analysing data
-        store=store_data(path_folder_config,param)
+        # mode of recording : 'spikes' all the spikes, 'statistics' only the statistics of each population
+        mode = param['mode'] if 'mode' in param.keys() else 'spikes'
+        if mode != 'spikes' and mode != 'statistics':
+            raise Exception('unknown mode of recording : '+str(mode))
+        if mode == 'statistics':
+            param_statistics = {'synch':param['synch'], 'resolution':param['resolution']}
+            if 'stat_bin' in param.keys():
+                param_statistics['stat_bin'] = param['stat_bin']
+            if populations is not None:
+                param_statistics['hist_ids'] = populations[:, 0]
+                param_statistics['hist_column'] = 1
+                param_statistics['nb_neurons_group'] = populations[:, 1] - populations[:, 0] + 1
+            statistics = online_statistics(param_statistics)
+            pathlib.Path(path_folder_save).mkdir(parents=True, exist_ok=True)
+        else:
+            # object for storing data
+            store = SpikeStore(path_folder_save, param['resolution'], chunk_size, codec_level, populations)
+        # variable for communication between thread
+        queue = Queue(maxsize=queue_size)
+        errors = [] # error of the writer
 
         ############
         # Open the MPI port connection for receiver
@@ -94,25 +241,31 @@ if __name__ == "__main__":
         # Wait until connection
         logger_master.info('Waiting communication')
         comm_receiver = MPI.COMM_WORLD.Accept(port_receive, info, root)
-        logger_master.info('get communication and start thread')
+        logger_master.info('get communication and start to save')
         #########################
 
-        # create the thread for receive and save data
-        logger_receive = create_logger(path_folder_config, 'nest_to_tvb_receive', level_log)
-        logger_save = create_logger(path_folder_config, 'nest_to_tvb_send', level_log)
-        th_receive = Thread(target=receive,
-                            args=(logger_receive, store, status_data, buffer, comm_receiver))
-        th_save = Thread(target=save, args=(path_folder_save,logger_save,nb_step,step_save,status_data,buffer))
-
-        # start the threads
-        # FAT END POINT
-        logger_master.info('start thread')
-        th_receive.start()
-        th_save.start()
-        th_receive.join()
-        th_save.join()
-        logger_master.info('join thread')
+        # create the thread for writing data
+        logger_receive = create_logger(path_folder_config, 'nest_save_receive', level_log)
+        logger_write = create_logger(path_folder_config, 'nest_save_write', level_log)
+        if mode == 'statistics':
+            th_write = Thread(target=write_statistics, args=(logger_write, statistics, path_folder_save+'/statistics.npz',
+                                                             step_save, queue, errors))
+        else:
+            th_write = Thread(target=write, args=(logger_write, store, step_save, queue, errors))
+        th_write.start()
+        try:
+            metrics = receive(logger_receive, queue, policy, comm_receiver, th_write, errors)
+        except Exception as error:
+            logger_master.error('error of the recording : '+repr(error))
+            raise
+        th_write.join()
+        if len(errors) > 0:
+            # error of the writer at the end of the recording
+            logger_master.error('error of the recording : '+repr(errors[0]))
+            raise errors[0]
+        logger_master.info('end of the recording : '+str(metrics))
+        comm_receiver.Disconnect()
         MPI.Close_port(port_receive)
         MPI.Finalize()
     else:
-        print('missing argument')
\ No newline at end of file
+        print('missing argument')
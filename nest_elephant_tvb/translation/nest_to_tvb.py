@@ -4,6 +4,7 @@
 import os
 import json
 import logging
+import numpy as np
 
 import nest_elephant_tvb.translation.RichEndPoint as REP
 import nest_elephant_tvb.translation.mpi_translator as mt
@@ -37,23 +38,34 @@ def create_logger(path,name, log_level):
 if __name__ == "__main__":
     import sys
 
-    if len(sys.argv)!=4:
+    if len(sys.argv)<4:
         print('incorrect number of arguments')
         exit(1)
     
     path = sys.argv[1]
-    file_spike_detector = sys.argv[2]
+    # the files of the other spike detectors are after the file for TVB (multiplex mode)
+    files_spike_detector = [sys.argv[2]] + sys.argv[4:]
     TVB_recev_file = sys.argv[3]
     
     # take the parameters and instantiate objects for analysing data
     with open(path+'/parameter.json') as f:
         parameters = json.load(f)
     param = parameters['param_TR_nest_to_tvb']
+    ids_spike_detector = [os.path.splitext(os.path.basename(path+file))[0] for file in files_spike_detector]
+    if len(files_spike_detector) > 1:
+        # multiplex mode : one histogram by spike detector, in the order of the regions for TVB
+        hist_ids = [int(id_spike_detector) for id_spike_detector in ids_spike_detector]
+        if np.any(np.diff(hist_ids) <= 0):
+            print('the spike detectors need to be in increasing order')
+            exit(1)
+        param['multiplex'] = True
+        param['hist_ids'] = hist_ids
+        param['hist_column'] = 0
     
     
     ############ NEW Code: old logging code copied here for better overview
     level_log = param['level_log']
-    id_spike_detector = os.path.splitext(os.path.basename(path+file_spike_detector))[0]
+    id_spike_detector = ids_spike_detector[0]
     logger_master = create_logger(path, 'nest_to_tvb_master'+str(id_spike_detector), level_log)
     logger_receive = create_logger(path, 'nest_to_tvb_receive'+str(id_spike_detector), level_log)
     logger_send = create_logger(path, 'nest_to_tvb_send'+str(id_spike_detector), level_log)
@@ -63,7 +75,7 @@ if __name__ == "__main__":
     ############ NEW Code: FAT END POINT for MPI and new connections
     ### contains all MPI connection stuff for proper encapsulation
     ### TODO: make this a proper interface
-    path_to_files_receive = path + file_spike_detector # TODO: use proper path operations
+    path_to_files_receive = [path + file for file in files_spike_detector] # TODO: use proper path operations
     path_to_files_send = path + TVB_recev_file
     comm, comm_receiver, port_receive, comm_sender, port_send = REP.make_connections(path_to_files_receive, path_to_files_send, logger_master)
     ############# NEW Code end
@@ -86,7 +98,8 @@ if __name__ == "__main__":
     logger_master.info('clean file')
     # TODO: ugly solution, all MPI ranks want to delete, only the first one can.
     try:
-        os.remove(path_to_files_receive)
+        for path_file in path_to_files_receive:
+            os.remove(path_file)
         os.remove(path_to_files_send)
     except FileNotFoundError:
         pass 
@@ -44,6 +44,44 @@ def rates_to_spikes( rates, t_start, t_stop, variation=False):
                 result.append(homogeneous_poisson_process(rate=rate, t_start=t_start, t_stop=t_stop, as_array=True))
         return np.array(result)
 
+def round_times(times, resolution):
+    """
+    Round the spike times to the resolution of the simulation
+    (division by the inverse : same values as np.around(times, decimals=1) for a resolution of 0.1)
+    :param times: the spike times in ms
+    :param resolution: the resolution in ms
+    :return: the rounded times
+    """
+    inverse = 1.0/resolution
+    return np.around(times*inverse)/inverse
+
+def rates_to_spikes_batch(rates, t_start, t_stop, nb_train, resolution=None, random=np.random):
+    """
+    Generate spike trains with the same inhomogeneous Poisson process in a few vectorized operations
+    (no neo or quantities : rates in Hz and times in ms)
+    The rate is piecewise constant (one value by bin, like the AnalogSignal of rates_to_spikes).
+    The number of spikes of each train follows a Poisson law of the integral of the rate,
+    the times of the spikes are drawn with the inverse of the cumulative intensity.
+    :param rates: the rate of each bin in Hz (nb_bin,)
+    :param t_start: time to start spike train in ms
+    :param t_stop: time where the spike train stop in ms
+    :param nb_train: number of spike trains
+    :param resolution: (optional) the times are rounded to the resolution in ms
+    :param random: the random generator (numpy.random, a RandomState or a Generator)
+    :return: times of the spikes and index of the train of each spike, sorted by train and by time
+    """
+    rates = np.ravel(rates)
+    edges = np.linspace(t_start, t_stop, rates.shape[0]+1)
+    # cumulative intensity : expected number of spikes until each edge
+    intensity = np.concatenate(([0.0], np.cumsum(rates*np.diff(edges)*1e-3)))
+    nb_spikes = random.poisson(intensity[-1], size=nb_train)
+    index = np.repeat(np.arange(nb_train), nb_spikes)
+    times = np.interp(random.uniform(0.0, intensity[-1], size=index.shape[0]), intensity, edges)
+    if resolution is not None:
+        times = round_times(times, resolution)
+    order = np.lexsort((times, index))
+    return times[order], index[order]
+
 def spikes_to_rate( spikes,t_start,t_stop, windows=0.0):
     """
     #WARNING function unused but keep it for idea
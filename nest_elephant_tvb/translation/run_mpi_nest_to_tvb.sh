@@ -3,4 +3,8 @@
 # "Licensed to the Apache Software Foundation (ASF) under one or more contributor license agreements; and to You under the Apache License, Version 2.0. "
 
 BASEDIR=$(dirname "$0")
-$1 -n 1 python3 $BASEDIR/nest_to_tvb.py $2 $3 $4
\ No newline at end of file
+MPIRUN=$1
+NB_MPI=$2
+shift 2
+# path, spike detector file, TVB file and in multiplex mode, the files of the other spike detectors
+$MPIRUN -n $NB_MPI python3 $BASEDIR/nest_to_tvb.py "$@"
@@ -3,4 +3,7 @@
 # "Licensed to the Apache Software Foundation (ASF) under one or more contributor license agreements; and to You under the Apache License, Version 2.0. "
 
 BASEDIR=$(dirname "$0")
-$1 -n 1 python3 $BASEDIR/tvb_to_nest.py $2 $3 $4 $5
+MPIRUN=$1
+shift 1
+# path, first spike generator, number of spike generators, TVB file and in multiplex mode, the first spike generator of the other regions
+$MPIRUN -n 1 python3 $BASEDIR/tvb_to_nest.py "$@"
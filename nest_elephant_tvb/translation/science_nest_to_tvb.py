@@ -12,9 +12,76 @@ def slidding_window(data,width):
     :param width: windows or times average of the mean field
     :return: state variable of the mean field
     """
-    res = np.zeros((data.shape[0]-width,width))
-    res [:,:] = np.squeeze(data[np.array([[ i+j for i in range(width) ] for j in range(data.shape[0]-width)])])
-    return res.mean(axis=1)
+    data = np.squeeze(data)
+    window = streaming_window(data[:width])
+    return window.update(data[width:])
+
+class streaming_window:
+    def __init__(self,init):
+        """
+        moving average with a running sum
+        The last samples are kept in a ring for the next call, so each call costs only the number of new samples.
+        :param init: the initial samples of the window (width,) or (width, nb_signal)
+        """
+        self.width = init.shape[0]                     # the width of the window
+        self.tail = np.array(init,dtype='d')           # ring with the last samples of the signal
+        self.head = 0                                  # index of the oldest sample in the ring
+        self.sum = np.sum(self.tail,axis=0)            # sum of the samples in the window
+
+    def update(self,data):
+        """
+        add new samples and compute the average of the windows
+        :param data: the new samples (n,) or (n,nb_signal)
+        :return: the average of the n windows which start at the n oldest samples
+        """
+        nb_new = data.shape[0]
+        if nb_new == 0:
+            return np.zeros_like(self.tail[:0])
+        # the samples which leave the windows : the oldest samples of the ring followed by the new samples
+        nb_ring = min(nb_new,self.width)
+        leaving = self.tail[(self.head+np.arange(nb_ring)) % self.width]
+        if nb_new > self.width:
+            leaving = np.concatenate((leaving,data[:nb_new-self.width]))
+        cumsum_in = np.cumsum(data,axis=0)
+        cumsum_out = np.cumsum(leaving,axis=0)
+        result = self.sum + (cumsum_in - data) - (cumsum_out - leaving)
+        self.sum = self.sum + cumsum_in[-1] - cumsum_out[-1]
+        # update the ring with the new samples
+        if nb_new >= self.width:
+            self.tail[:] = data[-self.width:]
+            self.head = 0
+        else:
+            self.tail[(self.head+np.arange(nb_new)) % self.width] = data
+            self.head = (self.head+nb_new) % self.width
+        return result/self.width
+
+def bin_spikes(datas,t_start,dt,nb_bin,ids=None,column=0):
+    """
+    compute the histogram of a block of events in one pass
+    The buffer of events is not modified.
+    :param datas: the events in a flat buffer : (id_detector, id_neuron, time) for each event
+    :param t_start: the time of the beginning of the histogram
+    :param dt: the width of one bin
+    :param nb_bin: the number of bins of the histogram
+    :param ids: (optional) sorted array of the first ids of each group (detectors or populations)
+    :param column: the column of the event used for the group : 0 id of the detector, 1 id of the neuron
+    :return: histogram of all events (nb_bin,) and if ids is given, histogram by group (nb_bin,len(ids))
+            (events outside of all groups are only counted in the first histogram),
+            number of events outside of the bins (not counted)
+    """
+    events = np.reshape(datas,(int(datas.shape[0]/3),3))
+    # same operation than the previous loop : (time - dt - t_start)/dt
+    index = ((events[:,2]-dt-t_start)/dt).astype(int)
+    valid = np.logical_and(index >= 0, index < nb_bin)
+    nb_drop = int(events.shape[0]-np.count_nonzero(valid))
+    if ids is None:
+        return np.bincount(index[valid],minlength=nb_bin)[:nb_bin], None, nb_drop
+    # index 0 is for the events outside of the groups
+    group = np.searchsorted(ids,events[:,column],side='right')
+    nb_group = len(ids)+1
+    hist = np.bincount(index[valid]*nb_group+group[valid],minlength=nb_bin*nb_group)
+    hist = np.reshape(hist,(nb_bin,nb_group))
+    return hist.sum(axis=1), hist[:,1:], nb_drop
 
 class store_data:
     def __init__(self,path,param):
@@ -27,6 +94,18 @@ class store_data:
         self.dt=param['resolution']              # the resolution of the integrator
         self.shape = (int(self.synch/self.dt),1) # the shape of the buffer/histogram
         self.hist = np.zeros(self.shape)         # the initialisation of the histogram
+        self.nb_drop = 0                         # number of spikes outside of the histogram
+        # (optional) one histogram by detector or by population in the same pass
+        if 'hist_ids' in param.keys():
+            self.ids = np.array(param['hist_ids'])                          # first id of each group
+            self.column = param['hist_column'] if 'hist_column' in param.keys() else 0 # 0 : detector, 1 : neuron
+            self.shape_ids = (self.shape[0],self.ids.shape[0])
+            self.hist_ids = np.zeros(self.shape_ids)
+        else:
+            self.ids = None
+            self.column = 0
+        # (optional) all the regions in the same translator : one histogram by spike detector of hist_ids
+        self.multiplex = param['multiplex'] if 'multiplex' in param.keys() else False
 
         # configuration of the logger
         level_log = param['level_log']
@@ -57,20 +136,172 @@ class store_data:
         :param count: the number of synchronization times
         :param datas: the spike :(id,time)
         """
-        for data in np.reshape(datas,(int(datas.shape[0]/3),3)):
-            data[2]-=self.dt
-            self.hist[int((data[2]-count*self.synch)/self.dt)]+=1
+        hist, hist_ids, nb_drop = bin_spikes(datas,count*self.synch,self.dt,self.shape[0],self.ids,self.column)
+        self.hist[:,0] += hist
+        if hist_ids is not None:
+            self.hist_ids += hist_ids
         self.logger.info(int(datas.shape[0]/3))
+        if nb_drop != 0:
+            self.nb_drop += nb_drop
+            self.logger.warning('drop '+str(nb_drop)+' spikes outside of the step '+str(count)
+                                +' (total '+str(self.nb_drop)+')')
 
     def return_data(self):
         """
         return the histogram and reinitialise the histogram
-        :return: histogram
+        :return: histogram (nb_bin,1) or in multiplex mode, histogram by spike detector (nb_bin,nb_detector)
         """
+        if self.multiplex:
+            self.hist = np.zeros(self.shape)
+            return self.return_data_ids()
         hist_copy = copy.copy(self.hist)
         self.hist = np.zeros(self.shape) # initialise histogram histogram of one region
         return hist_copy
 
+    def return_data_ids(self):
+        """
+        return the histogram of each group and reinitialise it
+        :return: histogram by group (nb_bin,nb_group)
+        """
+        hist_copy = self.hist_ids
+        self.hist_ids = np.zeros(self.shape_ids)
+        return hist_copy
+
+class online_statistics:
+    def __init__(self,param):
+        """
+        statistics of the spikes computed block by block, without keeping the spikes
+        For each group (spike detector or population) : the population rate of each step, the mean coefficient of
+        variation of the inter-spike intervals, the mean Fano factor of the spike counts by step and the
+        synchrony (chi square of Golomb) of the spike counts by bin.
+        The memory is proportional to the number of neurons and to the number of steps for the rates.
+        :param param : parameters for the object
+        """
+        self.synch = param['synch']                                             # time of one step
+        self.dt = param['stat_bin'] if 'stat_bin' in param.keys() else param['resolution'] # width of the bins
+        self.nb_bin = int(np.rint(self.synch/self.dt))                          # number of bins by step
+        self.ids = np.array(param['hist_ids']) if 'hist_ids' in param.keys() else np.array([0]) # first id of each group
+        self.column = param['hist_column'] if 'hist_column' in param.keys() else 1 # 0 : detector, 1 : neuron
+        # (optional) number of neurons of each group, otherwise the number of neurons which spike
+        self.nb_neurons = np.array(param['nb_neurons_group']) if 'nb_neurons_group' in param.keys() else None
+        nb_group = self.ids.shape[0]
+        self.count = 0                       # number of steps
+        self.rates = []                      # number of spikes of each group by step
+        self.steps = []                      # number of each step (some steps can be dropped)
+        self.pop_sum = np.zeros(nb_group)    # sum of the spikes by bin of each group
+        self.pop_sumsq = np.zeros(nb_group)  # sum of the square of the spikes by bin of each group
+        # statistics of each neuron (index : id of the neuron)
+        self.group = np.full(0,-1)           # group of the neuron (-1 : no spike)
+        self.last_spike = np.full(0,np.nan)  # time of the last spike
+        self.isi = np.zeros((3,0))           # number, sum and sum of the square of the inter-spike intervals
+        self.counts = np.zeros((2,0))        # sum and sum of the square of the number of spikes by step
+        self.bins = np.zeros((2,0))          # sum and sum of the square of the number of spikes by bin
+
+    def _grow(self,max_id):
+        """
+        extend the statistics of the neurons until the neuron max_id
+        :param max_id: the biggest id of neuron
+        """
+        size = self.group.shape[0]
+        if max_id >= size:
+            new_size = max(max_id+1,2*size)
+            self.group = np.concatenate((self.group,np.full(new_size-size,-1)))
+            self.last_spike = np.concatenate((self.last_spike,np.full(new_size-size,np.nan)))
+            self.isi = np.concatenate((self.isi,np.zeros((3,new_size-size))),axis=1)
+            self.counts = np.concatenate((self.counts,np.zeros((2,new_size-size))),axis=1)
+            self.bins = np.concatenate((self.bins,np.zeros((2,new_size-size))),axis=1)
+
+    def add_spikes(self,count,datas):
+        """
+        add the spikes of one step in the statistics
+        :param count: the number of synchronization times
+        :param datas: the spikes : (id_detector, id_neuron, time) for each event
+        """
+        t_start = count*self.synch
+        # population activity by bin of each group (same binning than store_data)
+        hist, hist_ids, nb_drop = bin_spikes(datas,t_start,self.dt,self.nb_bin,self.ids,self.column)
+        self.pop_sum += np.sum(hist_ids,axis=0)
+        self.pop_sumsq += np.sum(np.square(hist_ids,dtype='d'),axis=0)
+        self.rates.append(np.sum(hist_ids,axis=0))
+        self.steps.append(count)
+        self.count += 1
+        # the spikes of the neurons of the groups, sorted by neuron and by time
+        events = np.reshape(datas,(int(datas.shape[0]/3),3))
+        group = np.searchsorted(self.ids,events[:,self.column],side='right')-1
+        events = events[group >= 0]
+        if events.shape[0] == 0:
+            return
+        neurons = events[:,1].astype(int)
+        order = np.lexsort((events[:,2],neurons))
+        neurons, times, group = neurons[order], events[order,2], group[group >= 0][order]
+        self._grow(int(np.max(neurons)))
+        self.group[neurons] = group
+        size = self.group.shape[0]
+        # inter-spike intervals : with the previous spike of the block or the last spike of the previous blocks
+        first = np.ones(neurons.shape[0],dtype=bool)
+        first[1:] = neurons[1:] != neurons[:-1]
+        previous = np.empty_like(times)
+        previous[1:] = times[:-1]
+        previous[first] = self.last_spike[neurons[first]]
+        isi = times - previous
+        valid = np.logical_not(np.isnan(isi))
+        self.isi[0] += np.bincount(neurons[valid],minlength=size)
+        self.isi[1] += np.bincount(neurons[valid],weights=isi[valid],minlength=size)
+        self.isi[2] += np.bincount(neurons[valid],weights=np.square(isi[valid]),minlength=size)
+        last = np.ones(neurons.shape[0],dtype=bool)
+        last[:-1] = first[1:]
+        self.last_spike[neurons[last]] = times[last]
+        # spike count of the step (Fano factor)
+        nb_spike = np.bincount(neurons,minlength=size)
+        self.counts[0] += nb_spike
+        self.counts[1] += np.square(nb_spike)
+        # spike count by bin (synchrony)
+        index = ((times-self.dt-t_start)/self.dt).astype(int)
+        valid = np.logical_and(index >= 0, index < self.nb_bin)
+        pairs, nb_spike_bin = np.unique(neurons[valid]*self.nb_bin+index[valid],return_counts=True)
+        self.bins[0] += np.bincount(pairs//self.nb_bin,weights=nb_spike_bin,minlength=size)
+        self.bins[1] += np.bincount(pairs//self.nb_bin,weights=np.square(nb_spike_bin),minlength=size)
+
+    def summary(self):
+        """
+        the statistics of each group
+        :return: dictionary : times of the steps received, rates in Hz (nb_step,nb_group), cv of the inter-spike intervals,
+                 Fano factor, synchrony and number of neurons of each group (nb_group,)
+        """
+        nb_group = self.ids.shape[0]
+        nb_bin = max(self.count*self.nb_bin,1)
+        nb_step = max(self.count,1)
+        cv = np.full(nb_group,np.nan)
+        fano = np.full(nb_group,np.nan)
+        synchrony = np.full(nb_group,np.nan)
+        nb_active = np.array([np.sum(self.group == group) for group in range(nb_group)])
+        nb_neurons = self.nb_neurons if self.nb_neurons is not None else nb_active
+        with np.errstate(divide='ignore',invalid='ignore'):
+            for group in range(nb_group):
+                select = self.group == group
+                if np.sum(select) == 0:
+                    continue
+                # coefficient of variation of the neurons with at least two intervals
+                isi = self.isi[:,select]
+                enough = isi[0] >= 2
+                mean = isi[1,enough]/isi[0,enough]
+                cv[group] = np.mean(np.sqrt(np.maximum(isi[2,enough]/isi[0,enough]-np.square(mean),0.0))/mean)
+                # Fano factor of the spike counts of each step
+                mean = self.counts[0,select]/nb_step
+                fano[group] = np.mean((self.counts[1,select]/nb_step-np.square(mean))/mean)
+                # chi square : variance of the mean activity / mean of the variance of each neuron (silent neurons are 0)
+                mean_pop = self.pop_sum[group]/nb_bin/nb_neurons[group]
+                var_pop = self.pop_sumsq[group]/nb_bin/np.square(nb_neurons[group]) - np.square(mean_pop)
+                var_neuron = np.sum(self.bins[1,select]/nb_bin - np.square(self.bins[0,select]/nb_bin))/nb_neurons[group]
+                synchrony[group] = var_pop/var_neuron
+        rates = np.array(self.rates).reshape((-1,nb_group))
+        return {'times':np.array(self.steps,dtype=float)*self.synch,
+                'rates':rates/(self.synch*1e-3)/np.maximum(nb_neurons,1),
+                'cv_isi':cv,
+                'fano':fano,
+                'synchrony':synchrony,
+                'nb_neurons':nb_neurons}
+
 class analyse_data:
     def __init__(self,path,param):
         """
@@ -81,7 +312,11 @@ class analyse_data:
 
         self.width = int(param['width']/param['resolution']) # the window of the average in time
         self.synch = param['synch']                          # synchronize time between simulator
-        self.buffer = np.zeros((self.width,))                  #initialisation/ previous result for a good result
+        self.multiplex = param['multiplex'] if 'multiplex' in param.keys() else False # all the regions in the same translator
+        if self.multiplex:
+            self.window = streaming_window(np.zeros((self.width,len(param['hist_ids'])))) # one window by region
+        else:
+            self.window = streaming_window(np.zeros((self.width,))) #initialisation/ previous result for a good result
         self.coeff = 1 / ( param['nb_neurons'] * param['resolution'] ) # for the mean firing rate in in KHZ
 
         level_log = param['level_log']
@@ -110,12 +345,10 @@ class analyse_data:
         """
         analyse the histogram to generate state variable and the time
         :param count: the number of step of synchronization
-        :param hist: the data
+        :param hist: the data (nb_bin,1) or (nb_bin,nb_region) in multiplex mode
         :return:
         """
-        hist_slide = np.concatenate((self.buffer,np.squeeze(hist,1)))
-        data = slidding_window(hist_slide,self.width)
-        self.buffer = np.squeeze(hist_slide[-self.width:])
+        data = self.window.update(hist if self.multiplex else np.squeeze(hist,1))
         times = np.array([count*self.synch,(count+1)*self.synch], dtype='d')
         self.logger.info(np.mean(data*self.coeff))
         return times,data*self.coeff
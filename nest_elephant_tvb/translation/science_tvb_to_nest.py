@@ -2,8 +2,7 @@
 # "Licensed to the Apache Software Foundation (ASF) under one or more contributor license agreements; and to You under the Apache License, Version 2.0. "
 
 import numpy as np
-from nest_elephant_tvb.translation.rate_spike import rates_to_spikes
-from quantities import ms,Hz
+from nest_elephant_tvb.translation.rate_spike import rates_to_spikes_batch,round_times
 import logging
 
 # Can be changed to the function we had with elephant, this is just a toy function
@@ -19,10 +18,107 @@ def toy_rates_to_spikes(rates,t_start,t_stop):
     times = np.around(np.sort(np.array(times)), decimals=1)
     return times
 
+def _bernoulli_positions(nb_trial,p,random):
+    '''
+    positions of the successes of nb_trial Bernoulli trials with the probability p, by geometric skipping :
+    the gaps between two successes follow a geometric law (the memory is proportional to the number of successes)
+    :param nb_trial: the number of trials
+    :param p: the probability of success
+    :param random: the random generator
+    :return: the sorted positions of the successes
+    '''
+    positions = []
+    last = -1
+    while last < nb_trial:
+        # draw the gaps by chunk of the expected number of remaining successes
+        nb_gap = int((nb_trial-last)*p + 5*np.sqrt((nb_trial-last)*p) + 1)
+        gaps = last + np.cumsum(random.geometric(p,size=nb_gap))
+        positions.append(gaps[gaps < nb_trial])
+        last = gaps[-1]
+    return np.concatenate(positions)
+
+class spike_trains:
+    def __init__(self,times,offsets):
+        """
+        spike trains of all the spike generators in a compact layout (CSR) :
+        the spikes of the spike generator i are times[offsets[i]:offsets[i+1]]
+        The object is not modified after its creation, so it can be shared between threads without copy.
+        :param times: the times of all the spikes, sorted by spike generator
+        :param offsets: the index of the first spike of each spike generator and the total number of spikes (nb_train+1,)
+        """
+        self.times = np.ascontiguousarray(times,dtype='d')
+        self.offsets = np.ascontiguousarray(offsets,dtype=int)
+
+    @staticmethod
+    def from_index(times,index,nb_train):
+        """
+        create the spike trains from the index of the spike generator of each spike
+        :param times: the times of the spikes, sorted by spike generator
+        :param index: index of the spike generator of each spike (sorted)
+        :param nb_train: the number of spike generators
+        :return: spike trains
+        """
+        offsets = np.concatenate(([0],np.cumsum(np.bincount(index,minlength=nb_train))))
+        return spike_trains(times,offsets)
+
+    @staticmethod
+    def from_list(trains):
+        """
+        create the spike trains from a list of spike trains
+        :param trains: list of spike trains
+        :return: spike trains
+        """
+        offsets = np.concatenate(([0],np.cumsum([len(train) for train in trains])))
+        times = np.concatenate([np.ravel(train) for train in trains]) if len(trains) > 0 else np.empty(0)
+        return spike_trains(times,offsets)
+
+    @staticmethod
+    def concatenate(list_trains):
+        """
+        concatenate the spike trains of different groups of spike generators (regions)
+        :param list_trains: list of spike trains
+        :return: spike trains
+        """
+        starts = np.cumsum([0]+[trains.times.shape[0] for trains in list_trains[:-1]])
+        offsets = np.concatenate([[0]]+[trains.offsets[1:]+start for trains,start in zip(list_trains,starts)])
+        return spike_trains(np.concatenate([trains.times for trains in list_trains]),offsets)
+
+    def __len__(self):
+        return self.offsets.shape[0]-1
+
+    def __getitem__(self,index):
+        """
+        the spike train of one spike generator (view)
+        """
+        if index < 0 or index >= len(self):
+            raise IndexError('spike generator out of range')
+        return self.times[self.offsets[index]:self.offsets[index+1]]
+
+    def select(self,indexes,consecutive=None):
+        """
+        select the spike trains of a group of spike generators
+        :param indexes: the index of the spike generators
+        :param consecutive: (optional) if the index are consecutive (computed if not given)
+        :return: the number of spikes of each spike generator and their spikes in one array
+                (view without copy if the spike generators are consecutive)
+        """
+        indexes = np.asarray(indexes)
+        starts = self.offsets[indexes]
+        counts = self.offsets[indexes+1]-starts
+        if consecutive is None:
+            consecutive = bool(np.all(np.diff(indexes) == 1))
+        if consecutive:
+            return counts, self.times[starts[0]:starts[0]+np.sum(counts)]
+        # gather : position of each spike = start of its spike train + its rank in the spike train
+        shift = np.repeat(starts-np.concatenate(([0],np.cumsum(counts)[:-1])),counts)
+        return counts, self.times[shift+np.arange(shift.shape[0])]
+
 class generate_data:
     def __init__(self,path,nb_spike_generator,param):
         """
         generate spike train for each neurons
+        The random numbers come from independent streams for each (seed, region, step, block of spike generators),
+        so the spike trains are the same for any split of the spike generators between workers.
         :param path : path for the logger files
         :param nb_spike_generator: number of spike generator/neurons in each regions
         """
@@ -30,8 +126,12 @@ class generate_data:
         self.nb_spike_generator = nb_spike_generator         # number of spike generator
         self.nb_synapse = param['nb_synapses']               # number of synapses by neurons
         self.function_translation = param['function_select'] # choose the function for the translation
-
-        np.random.seed(param['seed'])
+        self.resolution = param['resolution'] if 'resolution' in param.keys() else 0.1 # resolution of the spike times
+        self.seed = param['seed']                            # seed of all the random streams
+        self.block_size = param['block_size'] if 'block_size' in param.keys() else 64 # spike generators by random stream
+        if self.function_translation == 3:
+            # charge of one external spike in pA.ms : weight (nS) * tau_syn (ms) * (E_rev - E_L) (mV)
+            self.charge = param['weight'] * param['tau_syn'] * (param['E_rev'] - param['E_L'])
 
         # configure the logger
         level_log = param['level_log']
@@ -56,40 +156,102 @@ class generate_data:
             fh.setLevel(logging.CRITICAL)
             self.logger.setLevel(logging.CRITICAL)
 
-    def generate_spike(self,count,time_step,rate):
+    def split(self,nb_part):
+        """
+        split the spike generators in parts for the workers, the parts are aligned on the blocks of the random streams
+        :param nb_part: the number of parts
+        :return: list of (start,stop) of each part
+        """
+        nb_block = -(-self.nb_spike_generator // self.block_size)
+        bounds = np.unique(np.linspace(0,nb_block,min(nb_part,nb_block)+1).astype(int)) * self.block_size
+        bounds[-1] = self.nb_spike_generator
+        return list(zip(bounds[:-1],bounds[1:]))
+
+    def _random(self,id_region,count,block):
+        """
+        the random stream of a block of spike generators
+        :param id_region: the identifier of the region (id of its first spike generator)
+        :param count: the number of step of synchronization between simulators
+        :param block: the index of the block + 1 (0 for the shared spike train of the region)
+        :return: random generator
+        """
+        return np.random.default_rng(np.random.SeedSequence(self.seed,spawn_key=(id_region,count,block)))
+
+    def generate_spike(self,count,time_step,rate,id_region=0,start=0,stop=None):
         """
         generate spike
         This function are based on the paper : Kuhn, Alexandre, Ad Aertsen, and Stefan Rotter. “Higher-Order Statistics of Input Ensembles and the Response of Simple Model Neurons.” Neural Computation 15, no. 1 (January 2003): 67–101. https://doi.org/10.1162/089976603321043702.
         DOI: 10.1162/089976603321043702
         function 1 : Single Interaction Process Model
         function 2 : Multiple Interaction Process Model
+        function 3 : mean current of the external input for step current generators (no spikes)
         :param count: the number of step of synchronization between simulators
         :param time_step: the time of synchronization
-        :param rate: the input rate of the mean field
-        :return:
+        :param rate: the input rate of the mean field (not modified)
+        :param id_region: (optional) the identifier of the region (id of its first spike generator)
+        :param start: (optional) the first spike generator to generate (aligned on the blocks)
+        :param stop: (optional) the end of the spike generators to generate (default all)
+        :return: spike trains of the spike generators from start to stop (spike_trains)
+                 (function 3 : the pairs (time, amplitude) of the step current generators in place of the spikes)
         """
+        if stop is None:
+            stop = self.nb_spike_generator
+        if start % self.block_size != 0:
+            raise Exception('the first spike generator is not aligned on the blocks')
+        nb_train = stop - start
+        blocks = [(begin,min(begin+self.block_size,stop)) for begin in range(start,stop,self.block_size)]
         if self.function_translation == 1:
             # Single Interaction Process Model
             # Compute the rate to spike trains
-            rate *= self.nb_synapse # rate of poisson generator ( due property of poisson process)
+            rate = rate * self.nb_synapse # rate of poisson generator ( due property of poisson process)
             rate += 1e-12 # avoid rate equals to zeros
-            spike_shared = \
-                rates_to_spikes(rate * self.percentage_shared * Hz,
-                                time_step[0] * ms, time_step[1] * ms, variation=True)[0]
-            spike_generate = rates_to_spikes(np.repeat([rate],self.nb_spike_generator,axis=0) * (1 - self.percentage_shared) * Hz, time_step[0] * ms, time_step[1] * ms,
-                                    variation=True)
-            for i in range(self.nb_spike_generator):
-                spike_generate[i] = np.around(np.sort(np.concatenate((spike_generate, spike_shared))), decimals=1)
-            self.logger.info('rate :'+str(rate)+' spikes :'+str(np.concatenate(spike_generate).shape))
+            # one shared spike train and one independent spike train by spike generator
+            spike_shared = rates_to_spikes_batch(rate * self.percentage_shared, time_step[0], time_step[1], 1,
+                                                 random=self._random(id_region,count,0))[0]
+            list_times = []
+            list_index = []
+            for begin,end in blocks:
+                times, index = rates_to_spikes_batch(rate * (1 - self.percentage_shared), time_step[0], time_step[1],
+                                                     end-begin,
+                                                     random=self._random(id_region,count,begin//self.block_size+1))
+                list_times.append(times)
+                list_index.append(index + begin - start)
+            # add the shared spikes to each spike generator
+            times = np.concatenate(list_times + [np.tile(spike_shared, nb_train)])
+            index = np.concatenate(list_index + [np.repeat(np.arange(nb_train), spike_shared.shape[0])])
+            times = round_times(times, self.resolution)
+            order = np.lexsort((times, index))
+            spike_generate = spike_trains.from_index(times[order], index[order], nb_train)
+            self.logger.info('rate :'+str(rate)+' spikes :'+str(times.shape))
             return spike_generate
         elif self.function_translation == 2:
             # Multiple Interaction Process Model
-            rate *= self.nb_synapse / self.percentage_shared # rate of poisson generator ( due property of poisson process)
+            rate = rate * (self.nb_synapse / self.percentage_shared) # rate of poisson generator ( due property of poisson process)
             rate += 1e-12  # avoid rate equals to zeros
-            spike_shared = np.round(rates_to_spikes(rate * Hz, time_step[0] * ms, time_step[1] * ms, variation=True)[0],1)
-            select = np.random.binomial(n=1,p=self.percentage_shared,size=(self.nb_spike_generator,spike_shared.shape[0]))
-            result = []
-            for i in np.repeat([spike_shared],self.nb_spike_generator,axis=0)*select :
-                result.append(i[np.where(i!=0)])
+            spike_shared = rates_to_spikes_batch(rate, time_step[0], time_step[1], 1, resolution=self.resolution,
+                                                 random=self._random(id_region,count,0))[0]
+            # each spike generator keeps each shared spike with the probability percentage_shared :
+            # the kept spikes are the successes of the Bernoulli trials (spike generator, shared spike) in the order
+            # of the spike generators and of the shared spikes, so directly in the order of the spike trains
+            nb_shared = spike_shared.shape[0]
+            list_positions = []
+            for begin,end in blocks:
+                random = self._random(id_region,count,begin//self.block_size+1)
+                list_positions.append(_bernoulli_positions((end-begin)*nb_shared,self.percentage_shared,random)
+                                      + (begin-start)*nb_shared)
+            positions = np.concatenate(list_positions)
+            nb_shared = max(nb_shared,1) # no trial without shared spike
+            result = spike_trains.from_index(spike_shared[positions % nb_shared], positions // nb_shared, nb_train)
             self.logger.info('rate :'+str(rate)+' spikes :'+str(spike_shared))
             return result
+        elif self.function_translation == 3:
+            # Mean current of the Poisson input of the external synapses (Campbell's theorem), one amplitude by bin of rate
+            # The generators receive the pairs (time, amplitude) : the size doesn't depend on the number of neurons and of spikes
+            rate = np.ravel(rate)
+            current = rate * (self.nb_synapse * self.charge * 1e-3) # rate in Hz and time in ms
+            times = round_times(np.linspace(time_step[0], time_step[1], rate.shape[0]+1)[:-1], self.resolution)
+            keep = times > 0.0 # Nest refuses the change of amplitude at the time 0
+            amplitudes = np.ravel(np.column_stack((times[keep], current[keep])))
+            result = spike_trains(np.tile(amplitudes, nb_train), np.arange(nb_train+1)*amplitudes.shape[0])
+            self.logger.info('rate :'+str(rate)+' current :'+str(current))
+            return result
@@ -0,0 +1,125 @@
+#  Copyright 2020 Forschungszentrum Jülich GmbH and Aix-Marseille Université
+# "Licensed to the Apache Software Foundation (ASF) under one or more contributor license agreements; and to You under the Apache License, Version 2.0. "
+
+import numpy as np
+import json
+import zlib
+
+MAGIC = b'SPK1' # identifier of the format
+
+def load_populations(path):
+    """
+    load the first and the last id of each population of Nest
+    :param path: the file population_GIDs.dat of Nest
+    :return: array (nb_population,2) of the first and the last id
+    """
+    populations = []
+    with open(path) as f:
+        for line in f:
+            values = line.split()
+            if len(values) >= 2:
+                populations.append([int(values[0]),int(values[1])])
+    return np.array(populations,dtype=np.int64).reshape((-1,2))
+
+def _smallest_uint(values):
+    """
+    convert positive integers in the smallest unsigned type
+    :param values: the positive integers
+    :return: the values in uint8, uint16, uint32 or uint64
+    """
+    maximum = int(np.max(values)) if values.shape[0] > 0 else 0
+    for dtype in (np.uint8,np.uint16,np.uint32):
+        if maximum <= np.iinfo(dtype).max:
+            return values.astype(dtype)
+    return values.astype(np.uint64)
+
+def encode_spikes(detectors,neurons,times,resolution,populations=None,level=1):
+    """
+    encode spike events in a compact block of bytes
+    The events are sorted by time, the steps of time are encoded by difference with the previous spike,
+    the neurons by their population and their position in it and the spike detectors by their index,
+    each column in the smallest unsigned integer type. The block can be compressed with zlib.
+    :param detectors: id of the spike detector of each event
+    :param neurons: id of the neuron of each event
+    :param times: time of each event in ms
+    :param resolution: the resolution of the time in ms
+    :param populations: (optional) the first and the last id of each population (see load_populations)
+    :param level: (optional) level of compression of zlib, 0 without compression (default 1 : the fastest)
+    :return: the block of bytes
+    """
+    detectors = np.asarray(detectors,dtype=np.int64)
+    neurons = np.asarray(neurons,dtype=np.int64)
+    steps = np.rint(np.asarray(times)/resolution).astype(np.int64)
+    order = np.lexsort((neurons,detectors,steps))
+    detectors, neurons, steps = detectors[order], neurons[order], steps[order]
+    first_step = int(steps[0]) if steps.shape[0] > 0 else 0
+    delta = np.diff(steps,prepend=first_step)
+    detector_ids, detector_index = np.unique(detectors,return_inverse=True)
+    if populations is None:
+        # one population from the smallest id
+        first_ids = np.array([int(np.min(neurons)) if neurons.shape[0] > 0 else 0])
+        population = np.zeros(neurons.shape[0],dtype=np.int64)
+    else:
+        first_ids = np.asarray(populations)[:,0]
+        population = np.searchsorted(first_ids,neurons,side='right')-1
+        if np.any(population < 0) or np.any(neurons > np.asarray(populations)[population,1]):
+            raise Exception('neuron outside of the populations')
+    columns = [('delta',_smallest_uint(delta)),
+               ('detector',_smallest_uint(detector_index)),
+               ('population',_smallest_uint(population)),
+               ('position',_smallest_uint(neurons-first_ids[population]))]
+    header = {'nb_events':int(steps.shape[0]),
+              'resolution':resolution,
+              'first_step':first_step,
+              'detector_ids':[int(i) for i in detector_ids],
+              'first_ids':[int(i) for i in first_ids],
+              'columns':[[name,column.dtype.str] for name,column in columns],
+              'level':level}
+    payload = b''.join([column.tobytes() for name,column in columns])
+    if level > 0:
+        payload = zlib.compress(payload,level)
+    header = json.dumps(header).encode()
+    return MAGIC + np.array([len(header)],dtype='<u4').tobytes() + header + payload
+
+def decode_spikes(data):
+    """
+    decode a block of bytes of encode_spikes
+    :param data: the block of bytes
+    :return: id of the spike detector, id of the neuron and time of the spike of each event, sorted by time
+    """
+    if data[:4] != MAGIC:
+        raise Exception('bad format of spikes')
+    size = int(np.frombuffer(data[4:8],dtype='<u4')[0])
+    header = json.loads(data[8:8+size].decode())
+    payload = data[8+size:]
+    if header['level'] > 0:
+        payload = zlib.decompress(payload)
+    nb_events = header['nb_events']
+    columns = {}
+    position = 0
+    for name,dtype in header['columns']:
+        dtype = np.dtype(dtype)
+        columns[name] = np.frombuffer(payload,dtype=dtype,count=nb_events,offset=position).astype(np.int64)
+        position += nb_events*dtype.itemsize
+    steps = header['first_step'] + np.cumsum(columns['delta'])
+    detectors = np.array(header['detector_ids'],dtype=np.int64)[columns['detector']] if nb_events > 0 else np.empty(0,dtype=np.int64)
+    neurons = np.array(header['first_ids'],dtype=np.int64)[columns['population']] + columns['position']
+    return detectors, neurons, steps*header['resolution']
+
+def save_spikes(path,detectors,neurons,times,resolution,populations=None,level=1):
+    """
+    save spike events in a file with encode_spikes
+    :param path: the file
+    other parameters : see encode_spikes
+    """
+    with open(path,'wb') as f:
+        f.write(encode_spikes(detectors,neurons,times,resolution,populations,level))
+
+def load_spikes(path):
+    """
+    load spike events from a file of save_spikes
+    :param path: the file
+    :return: see decode_spikes
+    """
+    with open(path,'rb') as f:
+        return decode_spikes(f.read())
@@ -0,0 +1,172 @@
+#  Copyright 2020 Forschungszentrum Jülich GmbH and Aix-Marseille Université
+# "Licensed to the Apache Software Foundation (ASF) under one or more contributor license agreements; and to You under the Apache License, Version 2.0. "
+
+import numpy as np
+import json
+import os
+from nest_elephant_tvb.translation.spike_codec import save_spikes, load_spikes
+
+# columns of the store : name and type
+COLUMNS = [('detector', np.int32),  # id of the spike detector
+           ('neuron', np.int32),    # id of the neuron
+           ('step', np.int32)]      # time of the spike in step of resolution
+INDEX_FILE = 'index.json'
+
+
+class SpikeStore:
+    def __init__(self,path,resolution,chunk_size=1048576,codec_level=None,populations=None):
+        """
+        append-only columnar store of spike events on disk
+        The events are written in chunks of chunk_size events, one memory-mapped file by column and by chunk :
+        the memory used doesn't grow with the length of the recording.
+        The index of the store contains the number of events and the range of time steps of each chunk,
+        for reading back only a part of the recording (see read_spikes).
+        :param path: the folder of the store
+        :param resolution: the resolution of the time of the spikes in ms
+        :param chunk_size: the number of events by chunk
+        :param codec_level: (optional) the full chunks are encoded with spike_codec and this level of compression
+        :param populations: (optional) the first and the last id of each population for spike_codec
+        """
+        self.path = path
+        self.resolution = resolution
+        self.chunk_size = int(chunk_size)
+        self.codec_level = codec_level
+        self.populations = populations
+        self.chunks = []     # index : number of events, first and last step of each chunk
+        self.columns = None  # memory-mapped columns of the last chunk
+        os.makedirs(path, exist_ok=True)
+
+    def _open_chunk(self):
+        """
+        create the files of a new chunk
+        """
+        index = len(self.chunks)
+        self.columns = [np.lib.format.open_memmap(chunk_file(self.path,index,name), mode='w+', dtype=dtype,
+                                                  shape=(self.chunk_size,))
+                        for name,dtype in COLUMNS]
+        self.chunks.append({'nb_events':0,'step_min':None,'step_max':None})
+
+    def append(self,detectors,neurons,times):
+        """
+        add spike events at the end of the store
+        :param detectors: id of the spike detector of each event
+        :param neurons: id of the neuron of each event
+        :param times: time of each event in ms
+        """
+        steps = np.rint(np.asarray(times)/self.resolution)
+        values = [np.asarray(detectors),np.asarray(neurons),steps]
+        nb_events = steps.shape[0]
+        position = 0
+        while position < nb_events:
+            if self.columns is None or self.chunks[-1]['nb_events'] == self.chunk_size:
+                self._close_chunk()
+                self._open_chunk()
+            chunk = self.chunks[-1]
+            begin = chunk['nb_events']
+            size = min(self.chunk_size-begin, nb_events-position)
+            for column,value in zip(self.columns,values):
+                column[begin:begin+size] = value[position:position+size]
+            step = steps[position:position+size]
+            step_min, step_max = int(np.min(step)), int(np.max(step))
+            chunk['step_min'] = step_min if chunk['step_min'] is None else min(chunk['step_min'],step_min)
+            chunk['step_max'] = step_max if chunk['step_max'] is None else max(chunk['step_max'],step_max)
+            chunk['nb_events'] = begin + size
+            position += size
+
+    def _close_chunk(self):
+        """
+        write the last chunk on the disk and release its memory
+        """
+        if self.columns is not None:
+            for column in self.columns:
+                column.flush()
+            if self.codec_level is not None:
+                # replace the columns of the chunk by one encoded file
+                index = len(self.chunks)-1
+                nb_events = self.chunks[-1]['nb_events']
+                save_spikes(codec_file(self.path,index),self.columns[0][:nb_events],self.columns[1][:nb_events],
+                            self.columns[2][:nb_events]*self.resolution,self.resolution,self.populations,self.codec_level)
+                self.chunks[-1]['codec'] = True
+                self.columns = None
+                self.flush()
+                for name,dtype in COLUMNS:
+                    os.remove(chunk_file(self.path,index,name))
+            else:
+                self.columns = None
+                self.flush()
+
+    def flush(self):
+        """
+        write the events and the index on the disk (the store can be read during the recording)
+        """
+        if self.columns is not None:
+            for column in self.columns:
+                column.flush()
+        index = {'resolution':self.resolution,
+                 'chunk_size':self.chunk_size,
+                 'columns':[name for name,dtype in COLUMNS],
+                 'chunks':self.chunks}
+        # replace the index in one operation : never a partial index
+        path_index = os.path.join(self.path,INDEX_FILE)
+        with open(path_index+'.tmp','w') as f:
+            json.dump(index,f)
+        os.replace(path_index+'.tmp',path_index)
+
+    def close(self):
+        """
+        end of the recording
+        """
+        self._close_chunk()
+        self.flush()
+
+
+def chunk_file(path,index,name):
+    """
+    the file of a column of a chunk
+    :param path: the folder of the store
+    :param index: the index of the chunk
+    :param name: the name of the column
+    :return: the path of the file
+    """
+    return os.path.join(path,'chunk_'+str(index)+'_'+name+'.npy')
+
+
+def codec_file(path,index):
+    """
+    the file of an encoded chunk
+    :param path: the folder of the store
+    :param index: the index of the chunk
+    :return: the path of the file
+    """
+    return os.path.join(path,'chunk_'+str(index)+'.spk')
+
+
+def read_spikes(path,t_start=None,t_stop=None):
+    """
+    read the spike events of a store between t_start and t_stop
+    only the chunks which contain this time are opened (memory-mapped)
+    :param path: the folder of the store
+    :param t_start: (optional) the beginning of the time in ms (default the beginning of the recording)
+    :param t_stop: (optional) the end of the time in ms, excluded (default the end of the recording)
+    :return: id of the spike detector, id of the neuron and time of the spike of each event
+    """
+    with open(os.path.join(path,INDEX_FILE)) as f:
+        index = json.load(f)
+    resolution = index['resolution']
+    step_start = -np.inf if t_start is None else np.rint(t_start/resolution)
+    step_stop = np.inf if t_stop is None else np.rint(t_stop/resolution)
+    result = [[] for name,dtype in COLUMNS]
+    for number,chunk in enumerate(index['chunks']):
+        if chunk['nb_events'] == 0 or chunk['step_max'] < step_start or chunk['step_min'] >= step_stop:
+            continue
+        if 'codec' in chunk.keys() and chunk['codec']:
+            detectors, neurons, times = load_spikes(codec_file(path,number))
+            columns = [detectors, neurons, np.rint(times/resolution)]
+        else:
+            columns = [np.load(chunk_file(path,number,name),mmap_mode='r')[:chunk['nb_events']] for name,dtype in COLUMNS]
+        select = np.logical_and(columns[2] >= step_start, columns[2] < step_stop)
+        for values,column,(name,dtype) in zip(result,columns,COLUMNS):
+            values.append(np.array(column[select],dtype=dtype))
+    detectors, neurons, steps = [np.concatenate(values) if len(values) > 0 else np.empty(0,dtype=dtype)
+                                 for values,(name,dtype) in zip(result,COLUMNS)]
+    return detectors, neurons, steps*resolution
@@ -7,11 +7,12 @@ from mpi4py import MPI
 import os
 import time
 
-def simulate_spike_detector(path,min_delay):
+def simulate_spike_detector(path,min_delay,nb_receiver=1):
     '''
     simulate spike detector output for testing the nest to tvb translator input
     :param path: the path to the file for the connections
     :param min_delay: the time of one simulation
+    :param nb_receiver: number of receiving ranks of the translator
     :return:
     '''
     # Init connection from file connection
@@ -33,9 +34,10 @@ def simulate_spike_detector(path,min_delay):
     starting = 0.0 # the begging of each time of synchronization
     check = np.empty(1,dtype='b')
     status_ = MPI.Status() # status of the different message
+    dest = MPI.COMM_WORLD.Get_rank() % nb_receiver # receiving rank of the translator for this rank
     while True:
         # wait until the translator accept the connections
-        comm.Send([np.array([True],dtype='b'), 1, MPI.CXX_BOOL], dest=0, tag=0)
+        comm.Send([np.array([True],dtype='b'), 1, MPI.CXX_BOOL], dest=dest, tag=0)
         comm.Recv([check, 1, MPI.CXX_BOOL], source=MPI.ANY_SOURCE, tag=0,status=status_)
         # create random data
         size= np.random.randint(0,1000)
@@ -48,7 +50,7 @@ def simulate_spike_detector(path,min_delay):
         comm.Send([np.array([size*3],dtype='i'),1, MPI.INT], dest=status_.Get_source(), tag=0)
         comm.Send([data,size*3, MPI.DOUBLE], dest=status_.Get_source(), tag=0)
         # ending the actual run
-        comm.Send([np.array([True],dtype='b'), 1, MPI.CXX_BOOL], dest=0, tag=1)
+        comm.Send([np.array([True],dtype='b'), 1, MPI.CXX_BOOL], dest=dest, tag=1)
         #print result and go to the next run
         print("Nest Output : ",comm.Get_rank(),size);sys.stdout.flush()
         starting+=min_delay
@@ -57,7 +59,7 @@ def simulate_spike_detector(path,min_delay):
     # closing the connection at this end
     print("Nest Output : ending" );sys.stdout.flush()
     # send the signal for end the translation
-    comm.Send([np.array([True], dtype='b'), 1, MPI.CXX_BOOL], dest=0, tag=2)
+    comm.Send([np.array([True], dtype='b'), 1, MPI.CXX_BOOL], dest=dest, tag=2)
     print("Nest Output : ending" );sys.stdout.flush()
     comm.Disconnect()
     MPI.Close_port(port)
@@ -68,6 +70,8 @@ if __name__ == "__main__":
     import sys
     if len(sys.argv)==3:
         simulate_spike_detector(sys.argv[1],float(sys.argv[2]))
+    elif len(sys.argv)==4:
+        simulate_spike_detector(sys.argv[1],float(sys.argv[2]),int(sys.argv[3]))
     else:
         print('missing argument')
 
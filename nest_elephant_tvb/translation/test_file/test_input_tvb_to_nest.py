@@ -7,11 +7,12 @@ import os
 import time
 import sys
 
-def simulate_TVB_output(path,min_delay):
+def simulate_TVB_output(path,min_delay,nb_region=1):
     '''
     simulate the input of the translator tvb_to_nest
     :param path: the path to the file for the connections
     :param min_delay: the time of one simulation
+    :param nb_region: the number of regions of the translator (multiplex mode)
     :return:
     '''
     max_mpi_connection_attempts = 50
@@ -49,9 +50,9 @@ def simulate_TVB_output(path,min_delay):
         source = status_.Get_source() # the id of the excepted source
         # create random data
         size= int(min_delay/0.1 )
-        rate = np.random.rand(size)*400
+        rate = np.random.rand(size,nb_region)*400
         data = np.ascontiguousarray(rate,dtype='d') # format the rate for sending
-        shape = np.array(data.shape[0],dtype='i') # size of data
+        shape = np.array(data.size,dtype='i') # size of data
         times = np.array([starting,starting+min_delay],dtype='d') # time of stating and ending step
         print("TVB_OUTPUT :send time : " +str(times));sys.stdout.flush()
         comm.Send([times,MPI.DOUBLE],dest=source,tag=0)
@@ -80,6 +81,8 @@ if __name__ == "__main__":
     import sys
     if len(sys.argv)==3:
         simulate_TVB_output(sys.argv[1],float(sys.argv[2]))
+    elif len(sys.argv)==4:
+        simulate_TVB_output(sys.argv[1],float(sys.argv[2]),int(sys.argv[3]))
     else:
         print('missing argument')
 
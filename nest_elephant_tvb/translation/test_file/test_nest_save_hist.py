@@ -0,0 +1,72 @@
+#  Copyright 2020 Forschungszentrum Jülich GmbH and Aix-Marseille Université
+# "Licensed to the Apache Software Foundation (ASF) under one or more contributor license agreements; and to You under the Apache License, Version 2.0. "
+
+import logging
+import numpy as np
+from threading import Thread
+from queue import Queue
+from nest_elephant_tvb.translation import nest_save_hist
+
+class FailingStore:
+    '''
+    store of spikes which fails at the block number nb_block (ex : disk full)
+    '''
+    def __init__(self,nb_block):
+        self.nb_block = nb_block
+        self.count = 0
+
+    def append(self,detectors,neurons,times):
+        self.count += 1
+        if self.count == self.nb_block:
+            raise OSError('disk full')
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+def check_writer_error(nb_block):
+    '''
+    check that the error of the writer is raised when the queue is full instead of waiting forever
+    :param nb_block: the block where the writer fails
+    :return:
+    '''
+    nest_save_hist.WAIT_WRITER = 0.01
+    logger = logging.getLogger('test_nest_save_hist')
+    queue = Queue(maxsize=2)
+    errors = []
+    writer = Thread(target=nest_save_hist.write, args=(logger, FailingStore(nb_block), 0, queue, errors))
+    writer.start()
+    events = np.zeros((10,3))
+    try:
+        for count in range(nb_block+10):
+            nest_save_hist.put_block(queue, (count, events), writer, errors)
+        raise Exception('the error of the writer is not raised')
+    except OSError as error:
+        print("writer error : block",nb_block,":",repr(error))
+        assert errors == [error]
+    writer.join()
+
+def check_writer_end():
+    '''
+    check the end of the recording without error
+    :return:
+    '''
+    logger = logging.getLogger('test_nest_save_hist')
+    queue = Queue(maxsize=2)
+    errors = []
+    store = FailingStore(-1)
+    writer = Thread(target=nest_save_hist.write, args=(logger, store, 0, queue, errors))
+    writer.start()
+    for count in range(20):
+        nest_save_hist.put_block(queue, (count, np.zeros((10,3))), writer, errors)
+    nest_save_hist.put_block(queue, None, writer, errors)
+    writer.join()
+    assert errors == [] and store.count == 20
+
+if __name__ == "__main__":
+    check_writer_error(1)
+    check_writer_error(5)
+    check_writer_end()
+    print("test nest save hist : OK")
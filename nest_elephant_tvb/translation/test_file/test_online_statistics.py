@@ -0,0 +1,79 @@
+#  Copyright 2020 Forschungszentrum Jülich GmbH and Aix-Marseille Université
+# "Licensed to the Apache Software Foundation (ASF) under one or more contributor license agreements; and to You under the Apache License, Version 2.0. "
+
+import numpy as np
+from nest_elephant_tvb.translation.science_nest_to_tvb import online_statistics
+
+def generate_step(count,synch,first_ids,nb_neurons,rates,synchronous):
+    '''
+    spikes of one step : independent Poisson neurons or the same Poisson spike train for all the neurons of a group
+    :param count: the number of the step
+    :param synch: the time of one step in ms
+    :param first_ids: the first id of each group
+    :param nb_neurons: number of neurons by group
+    :param rates: rate of each group in Hz
+    :param synchronous: if the neurons of each group spike at the same time
+    :return: the spikes : (id_detector, id_neuron, time) for each event
+    '''
+    events = []
+    for first,rate in zip(first_ids,rates):
+        if synchronous:
+            nb_spike = np.repeat(np.random.poisson(rate*synch*1e-3),nb_neurons)
+            times = np.tile(np.sort(np.random.rand(nb_spike[0])),nb_neurons)
+        else:
+            nb_spike = np.random.poisson(rate*synch*1e-3,nb_neurons)
+            times = np.random.rand(np.sum(nb_spike))
+        neurons = np.repeat(np.arange(first,first+nb_neurons),nb_spike)
+        times = count*synch+1.0+times*(synch-1.1)
+        events.append(np.column_stack((np.zeros(neurons.shape[0]),neurons,times)))
+    events = np.concatenate(events)
+    return np.ravel(events[np.random.permutation(events.shape[0])])
+
+def check_statistics(synchronous):
+    '''
+    check the statistics of Poisson neurons
+    :param synchronous: if the neurons of each group spike at the same time
+    :return:
+    '''
+    first_ids, nb_neurons, rates, synch = [1,501], 500, [10.0,20.0], 100.0
+    statistics = online_statistics({'synch':synch,'resolution':0.1,'stat_bin':1.0,'hist_ids':first_ids,'hist_column':1,
+                                    'nb_neurons_group':[nb_neurons,nb_neurons]})
+    for count in range(50):
+        statistics.add_spikes(count,generate_step(count,synch,first_ids,nb_neurons,rates,synchronous))
+    summary = statistics.summary()
+    print("synchronous",synchronous,": rates",np.mean(summary['rates'],axis=0),"cv",summary['cv_isi'],
+          "fano",summary['fano'],"synchrony",summary['synchrony'])
+    assert summary['rates'].shape == (50,2)
+    if synchronous:
+        # one spike train by group : the same activity for all the neurons
+        assert np.allclose(np.mean(summary['rates'],axis=0),rates,rtol=0.3)
+        assert np.allclose(summary['synchrony'],1.0)
+    else:
+        # the spikes of the neurons are Poisson processes : cv and Fano factor close to 1
+        assert np.allclose(np.mean(summary['rates'],axis=0),rates,rtol=0.1)
+        assert np.allclose(summary['cv_isi'],1.0,atol=0.1)
+        assert np.allclose(summary['fano'],1.0,atol=0.1)
+        # chi square of independent neurons : 1/nb_neurons
+        assert np.all(summary['synchrony'] < 10.0/nb_neurons)
+
+def check_dropped_steps():
+    '''
+    check the times of the statistics when some steps are not received
+    :return:
+    '''
+    first_ids, nb_neurons, rates, synch = [1], 100, [10.0], 2.0
+    statistics = online_statistics({'synch':synch,'resolution':0.1,'hist_ids':first_ids,'hist_column':1})
+    steps = [0,1,4,5,9]
+    for count in steps:
+        statistics.add_spikes(count,generate_step(count,synch,first_ids,nb_neurons,rates,False))
+    summary = statistics.summary()
+    print("dropped steps : times",summary['times'])
+    assert np.array_equal(summary['times'],np.array(steps)*synch)
+    assert summary['rates'].shape == (len(steps),1)
+
+if __name__ == "__main__":
+    np.random.seed(42)
+    check_statistics(False)
+    check_statistics(True)
+    check_dropped_steps()
+    print("test online statistics : OK")
@@ -0,0 +1,143 @@
+#  Copyright 2020 Forschungszentrum Jülich GmbH and Aix-Marseille Université
+# "Licensed to the Apache Software Foundation (ASF) under one or more contributor license agreements; and to You under the Apache License, Version 2.0. "
+
+import numpy as np
+from scipy import stats
+from quantities import ms,Hz
+from neo import AnalogSignal
+from elephant.spike_train_generation import inhomogeneous_poisson_process
+from nest_elephant_tvb.translation.rate_spike import rates_to_spikes_batch
+from nest_elephant_tvb.translation.science_tvb_to_nest import generate_data,spike_trains
+
+def compare_elephant(nb_train,t_start,t_stop,nb_bin):
+    '''
+    compare the statistics of the batched generator with the generator of elephant
+    :param nb_train: number of spike trains
+    :param t_start: time to start spike train in ms
+    :param t_stop: time where the spike train stop in ms
+    :param nb_bin: number of bins of the rate
+    :return:
+    '''
+    rate = 50.0 + 40.0 * np.sin(np.linspace(0.0, 2*np.pi, nb_bin)) # rate in Hz
+    signal = AnalogSignal(rate*Hz, t_start=t_start*ms, sampling_period=(t_stop-t_start)/nb_bin*ms)
+    spikes_elephant = [inhomogeneous_poisson_process(signal,as_array=True) for i in range(nb_train)]
+    times, index = rates_to_spikes_batch(rate, t_start, t_stop, nb_train)
+    count_elephant = np.array([spikes.shape[0] for spikes in spikes_elephant])
+    count_batch = np.bincount(index, minlength=nb_train)
+    expected = np.sum(rate) * (t_stop-t_start) / nb_bin * 1e-3
+    print("number of spikes : expected", expected, "elephant", np.mean(count_elephant), "batch", np.mean(count_batch))
+    print("fano factor : elephant", np.var(count_elephant)/np.mean(count_elephant),
+          "batch", np.var(count_batch)/np.mean(count_batch))
+    # same distribution of the number of spikes and of the spike times
+    p_count = stats.mannwhitneyu(count_elephant, count_batch).pvalue
+    p_times = stats.ks_2samp(np.concatenate(spikes_elephant), times).pvalue
+    print("p-value : number of spikes", p_count, "times", p_times)
+    assert abs(np.mean(count_batch)-expected) < 5 * np.sqrt(expected/nb_train)
+    assert p_count > 1e-3 and p_times > 1e-3
+    # the spikes are sorted by train and by time inside the window
+    assert np.all(np.diff(index) >= 0)
+    assert np.all(np.diff(times)[np.diff(index) == 0] >= 0)
+    assert np.all(times >= t_start) and np.all(times <= t_stop)
+
+def mother_train(spike_generate,resolution,shared):
+    '''
+    number of spikes of the mother spike train, reconstructed from the spike trains
+    :param spike_generate: the spike trains
+    :param resolution: the resolution of the spike times in ms
+    :param shared: True : the spikes of all the spike trains (SIP), False : the spikes of at least one spike train (MIP)
+    :return: number of spikes
+    '''
+    index = np.repeat(np.arange(len(spike_generate)), np.diff(spike_generate.offsets))
+    steps = np.rint(spike_generate.times/resolution).astype(int)
+    # number of spikes of each spike train at each time step
+    multiplicity = np.zeros((np.max(steps)+1, len(spike_generate)), dtype=int)
+    np.add.at(multiplicity, (steps, index), 1)
+    if shared:
+        return int(np.sum(np.min(multiplicity, axis=1)))
+    return int(np.sum(np.max(multiplicity, axis=1)))
+
+def check_models(path,nb_spike_generator,t_start,t_stop,nb_bin):
+    '''
+    check the rate and the shared spikes of the spike trains of the Single and Multiple Interaction Process Models
+    :param path: the folder for the logger file
+    :param nb_spike_generator: number of spike generators
+    :param t_start: time to start spike train in ms
+    :param t_stop: time where the spike train stop in ms
+    :param nb_bin: number of bins of the rate
+    :return:
+    '''
+    param = {'percentage_shared': 0.5, 'seed': 42, 'nb_synapses': 10, 'level_log': 4, 'resolution': 0.1}
+    rate = np.random.rand(nb_bin) * 20.0
+    expected = np.mean(rate) * param['nb_synapses'] * (t_stop-t_start) * 1e-3
+    for function in [1,2]:
+        param['function_select'] = function
+        generator = generate_data(path, nb_spike_generator, param)
+        spike_generate = generator.generate_spike(0, np.array([t_start,t_stop]), rate)
+        count = np.array([spikes.shape[0] for spikes in spike_generate])
+        assert len(spike_generate) == nb_spike_generator
+        shared = param['percentage_shared']
+        if function == 1:
+            # SIP : each spike train is the mother spike train (shared rate) and an independent spike train
+            nb_mother = mother_train(spike_generate, param['resolution'], True)
+            independent = count - nb_mother
+            print("function", function, ": number of spikes : expected", expected, "generated", np.mean(count),
+                  "shared", nb_mother, "independent", np.mean(independent))
+            assert abs(nb_mother - shared*expected) < 5 * np.sqrt(shared*expected)
+            assert abs(np.mean(independent) - (1-shared)*expected) < 5 * np.sqrt((1-shared)*expected/nb_spike_generator)
+        else:
+            # MIP : each spike train keeps each spike of the mother spike train with the probability percentage_shared
+            nb_mother = mother_train(spike_generate, param['resolution'], False)
+            fraction = count / nb_mother
+            print("function", function, ": number of spikes : expected", expected, "generated", np.mean(count),
+                  "mother", nb_mother, "fraction of the mother", np.mean(fraction))
+            assert abs(nb_mother - expected/shared) < 5 * np.sqrt(expected/shared)
+            assert abs(np.mean(fraction) - shared) < 5 * np.sqrt(shared*(1-shared)/(nb_mother*nb_spike_generator))
+        for spikes in spike_generate:
+            assert np.all(np.diff(spikes) >= 0)
+            # the times are on the grid of the resolution
+            assert np.allclose(spikes, np.around(spikes, decimals=1))
+        # the same spike trains for any split of the spike generators between workers
+        for nb_part in [2,3,7]:
+            spike_parts = spike_trains.concatenate([generator.generate_spike(0, np.array([t_start,t_stop]), rate, 0, start, stop)
+                                                    for start,stop in generator.split(nb_part)])
+            assert np.array_equal(spike_parts.offsets, spike_generate.offsets)
+            assert np.array_equal(spike_parts.times, spike_generate.times)
+        # the rates are not modified and the streams are different for each step and each region
+        for count,id_region in [(1,0),(0,1)]:
+            spike_other = generator.generate_spike(count, np.array([t_start,t_stop]), rate, id_region)
+            assert not np.array_equal(spike_other.times, spike_generate.times)
+
+def check_current(path,nb_generator,t_start,t_stop,nb_bin):
+    '''
+    check the amplitudes of the step current generators of the translation in current
+    :param path: the folder for the logger file
+    :param nb_generator: number of step current generators
+    :param t_start: time to start the current in ms
+    :param t_stop: time where the current stop in ms
+    :param nb_bin: number of bins of the rate
+    :return:
+    '''
+    param = {'percentage_shared': 0.5, 'seed': 42, 'nb_synapses': 10, 'level_log': 4, 'resolution': 0.1,
+             'function_select': 3, 'weight': 1.0, 'tau_syn': 5.0, 'E_rev': 0.0, 'E_L': -65.0}
+    rate = np.random.rand(nb_bin) * 20.0
+    generator = generate_data(path, nb_generator, param)
+    current = generator.generate_spike(0, np.array([t_start,t_stop]), rate)
+    assert len(current) == nb_generator
+    for amplitudes in current:
+        # pairs of (time, amplitude) : one change by bin of rate
+        assert amplitudes.shape[0] == 2*nb_bin
+        times = amplitudes[0::2]
+        assert np.all(np.diff(times) > 0) and times[0] == t_start and times[-1] < t_stop
+        assert np.allclose(amplitudes[1::2], rate * 10 * 5.0 * 65.0 * 1e-3)
+    print("current : size of the data", current.times.shape[0], "for", nb_generator, "generators")
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv)==2:
+        np.random.seed(42)
+        compare_elephant(2000, 100.0, 200.0, 1000)
+        check_models(sys.argv[1], 1000, 100.0, 200.0, 1000)
+        check_current(sys.argv[1], 2, 100.0, 200.0, 1000)
+        print("test rate spike : OK")
+    else:
+        print('missing argument')
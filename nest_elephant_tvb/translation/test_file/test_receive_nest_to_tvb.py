@@ -7,10 +7,11 @@ import os
 import time
 
 
-def simulate_TVB_reception(path):
+def simulate_TVB_reception(path,rank=1):
     '''
     simulate the receptor of the translator for nest to TVB
     :param path: the path to the file for the connections
+    :param rank: the rank of the translator which sends to TVB (first rank after the receiving ranks)
     :return:
     '''
     # Init connection from file connection
@@ -31,17 +32,17 @@ def simulate_TVB_reception(path):
     status_ = MPI.Status()
     while(True):
         # send to the translator, I want the next part
-        req = comm.isend(True, dest=1, tag=0)
+        req = comm.isend(True, dest=rank, tag=0)
         req.wait()
 
         times=np.empty(2,dtype='d')
-        comm.Recv([times, MPI.FLOAT], source=1, tag=0)
+        comm.Recv([times, MPI.FLOAT], source=rank, tag=0)
         # get the size of the rate
         size=np.empty(1,dtype='i')
-        comm.Recv([size, MPI.INT], source=1, tag=0)
+        comm.Recv([size, MPI.INT], source=rank, tag=0)
         # get the rate
         rates = np.empty(size, dtype='d')
-        comm.Recv([rates,size, MPI.DOUBLE],source=1,tag=MPI.ANY_TAG,status=status_)
+        comm.Recv([rates,size, MPI.DOUBLE],source=rank,tag=MPI.ANY_TAG,status=status_)
         # print the summary of the data
         if status_.Get_tag() == 0:
             print("TVB INPUT :",comm.Get_rank(),times,np.sum(rates));sys.stdout.flush()
@@ -50,7 +51,7 @@ def simulate_TVB_reception(path):
         if times[1] >9900:
             break
     # closing the connection at this end
-    req = comm.isend(True, dest=1, tag=1)
+    req = comm.isend(True, dest=rank, tag=1)
     req.wait()
     print('TVB INPUT :end');sys.stdout.flush()
     comm.Disconnect()
@@ -62,6 +63,8 @@ if __name__ == "__main__":
     import sys
     if len(sys.argv)==2:
         simulate_TVB_reception(sys.argv[1])
+    elif len(sys.argv)==3:
+        simulate_TVB_reception(sys.argv[1],int(sys.argv[2]))
     else:
         print('missing argument')
 
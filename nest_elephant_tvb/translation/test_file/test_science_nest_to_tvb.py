@@ -0,0 +1,111 @@
+#  Copyright 2020 Forschungszentrum Jülich GmbH and Aix-Marseille Université
+# "Licensed to the Apache Software Foundation (ASF) under one or more contributor license agreements; and to You under the Apache License, Version 2.0. "
+
+import numpy as np
+from nest_elephant_tvb.translation.science_nest_to_tvb import bin_spikes, slidding_window, streaming_window
+
+def random_events(nb_spike,ids,t_start,synch):
+    '''
+    random spike events of a step, some of them outside of the step
+    :param nb_spike: number of spikes
+    :param ids: the first id of each group
+    :param t_start: the beginning of the step in ms
+    :param synch: the time of one step in ms
+    :return: the spikes in a flat buffer : (id_detector, id_neuron, time) for each event
+    '''
+    detectors = np.random.randint(0,len(ids)+1,nb_spike)
+    neurons = np.random.randint(0,ids[-1]+100,nb_spike)
+    times = t_start+np.random.uniform(-0.1*synch,1.2*synch,nb_spike)
+    return np.ravel(np.column_stack((detectors,neurons,times)))
+
+def reference_bin_spikes(datas,t_start,dt,nb_bin,ids,column):
+    '''
+    histogram of the events with the loop of store_data before the vectorization
+    (the events outside of the bins are counted instead of an error or of a negative index)
+    :param datas: the events in a flat buffer : (id_detector, id_neuron, time) for each event
+    :param t_start: the time of the beginning of the histogram
+    :param dt: the width of one bin
+    :param nb_bin: the number of bins of the histogram
+    :param ids: sorted array of the first ids of each group
+    :param column: the column of the event used for the group
+    :return: histogram of all events, histogram by group and number of events outside of the bins
+    '''
+    hist = np.zeros(nb_bin)
+    hist_ids = np.zeros((nb_bin,len(ids)))
+    nb_drop = 0
+    for data in np.reshape(datas,(int(datas.shape[0]/3),3)):
+        index = int((data[2]-dt-t_start)/dt)
+        if index < 0 or index >= nb_bin:
+            nb_drop += 1
+            continue
+        hist[index] += 1
+        group = np.searchsorted(ids,data[column],side='right')-1
+        if group >= 0:
+            hist_ids[index,group] += 1
+    return hist, hist_ids, nb_drop
+
+def check_bin_spikes(column):
+    '''
+    compare the histograms of bin_spikes with the loop on the events
+    :param column: the column of the event used for the group : 0 id of the detector, 1 id of the neuron
+    :return:
+    '''
+    synch, dt = 20.0, 0.1
+    ids = np.array([1,2,3]) if column == 0 else np.array([10,500,1000])
+    for count in range(5):
+        datas = random_events(5000,ids,count*synch,synch)
+        reference = reference_bin_spikes(datas,count*synch,dt,int(synch/dt),ids,column)
+        copy_datas = np.copy(datas)
+        hist, hist_ids, nb_drop = bin_spikes(datas,count*synch,dt,int(synch/dt),ids,column)
+        assert np.array_equal(datas,copy_datas)
+        assert np.array_equal(hist,reference[0]) and np.array_equal(hist_ids,reference[1])
+        assert nb_drop == reference[2] and nb_drop > 0
+        hist, hist_ids, nb_drop = bin_spikes(datas,count*synch,dt,int(synch/dt))
+        assert np.array_equal(hist,reference[0]) and hist_ids is None and nb_drop == reference[2]
+    print("bin spikes column",column,": OK")
+
+def reference_slidding_window(data,width):
+    '''
+    moving average with the matrix of the index of the windows (slidding_window before the running sum)
+    :param data: instantaneous firing rate
+    :param width: windows or times average of the mean field
+    :return: state variable of the mean field
+    '''
+    res = np.zeros((data.shape[0]-width,width))
+    res [:,:] = np.squeeze(data[np.array([[ i+j for i in range(width) ] for j in range(data.shape[0]-width)])])
+    return res.mean(axis=1)
+
+def check_streaming_window(width,nb_signal):
+    '''
+    compare the moving average of streaming_window on chunks of random sizes with slidding_window
+    :param width: the width of the window
+    :param nb_signal: number of signals (0 : one signal without dimension)
+    :return:
+    '''
+    shape = (2000,) if nb_signal == 0 else (2000,nb_signal)
+    data = np.random.rand(*shape)
+    window = streaming_window(data[:width])
+    result = []
+    position = width
+    while position < shape[0]:
+        # chunks shorter and longer than the window and empty chunks
+        size = np.random.randint(0,3*width)
+        result.append(window.update(data[position:position+size]))
+        position += size
+    result = np.concatenate(result)
+    if nb_signal == 0:
+        assert np.allclose(result,slidding_window(data,width),rtol=0.0,atol=1e-12)
+        assert np.allclose(result,reference_slidding_window(data,width),rtol=0.0,atol=1e-12)
+    else:
+        for signal in range(nb_signal):
+            assert np.allclose(result[:,signal],reference_slidding_window(data[:,signal],width),rtol=0.0,atol=1e-12)
+    print("streaming window width",width,"signals",nb_signal,": OK")
+
+if __name__ == "__main__":
+    np.random.seed(42)
+    check_bin_spikes(0)
+    check_bin_spikes(1)
+    check_streaming_window(2,0)
+    check_streaming_window(10,0)
+    check_streaming_window(37,3)
+    print("test science nest to tvb : OK")
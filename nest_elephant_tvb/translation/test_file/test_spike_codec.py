@@ -0,0 +1,78 @@
+#  Copyright 2020 Forschungszentrum Jülich GmbH and Aix-Marseille Université
+# "Licensed to the Apache Software Foundation (ASF) under one or more contributor license agreements; and to You under the Apache License, Version 2.0. "
+
+import numpy as np
+from nest_elephant_tvb.translation.spike_codec import encode_spikes, decode_spikes
+from nest_elephant_tvb.translation.spike_store import SpikeStore, read_spikes
+
+def random_spikes(nb_spike,populations,time_stop,resolution):
+    '''
+    random spikes of the neurons of the populations
+    :param nb_spike: number of spikes
+    :param populations: the first and the last id of each population
+    :param time_stop: the end of the recording in ms
+    :param resolution: resolution of the times in ms
+    :return: id of the spike detector, id of the neuron and time of the spike of each event
+    '''
+    population = np.random.randint(0,populations.shape[0],nb_spike)
+    neurons = populations[population,0] + np.random.randint(0,np.min(populations[:,1]-populations[:,0])+1,nb_spike)
+    times = np.around(np.random.rand(nb_spike)*time_stop/resolution)*resolution
+    return population+populations[-1,1]+1, neurons, times
+
+def check_codec(nb_spike,populations,resolution):
+    '''
+    check the decoding of the encoded spikes and the size of the encoding
+    :param nb_spike: number of spikes
+    :param populations: the first and the last id of each population
+    :param resolution: resolution of the times in ms
+    :return:
+    '''
+    detectors, neurons, times = random_spikes(nb_spike,populations,1000.0,resolution)
+    order = np.lexsort((neurons,detectors,times))
+    for level in [0,1]:
+        for population in [None,populations]:
+            data = encode_spikes(detectors,neurons,times,resolution,population,level)
+            decode = decode_spikes(data)
+            assert np.array_equal(decode[0],detectors[order]) and np.array_equal(decode[1],neurons[order])
+            assert np.allclose(decode[2],times[order])
+            print("level",level,"populations",population is not None,": bytes by spike",len(data)/max(nb_spike,1),
+                  "ratio with float64 triplets",24*nb_spike/len(data))
+    # the spikes of recording are dense in time : at least 5 times smaller than the float64 triplets
+    if nb_spike > 10000:
+        assert 24*nb_spike/len(encode_spikes(detectors,neurons,times,resolution,populations,1)) > 5
+
+def check_store(path,populations,resolution):
+    '''
+    check the store of spikes with the encoding of the chunks
+    :param path: the folder of the store
+    :param populations: the first and the last id of each population
+    :param resolution: resolution of the times in ms
+    :return:
+    '''
+    store = SpikeStore(path,resolution,10000,1,populations)
+    reference = []
+    for step in range(20):
+        detectors, neurons, times = random_spikes(np.random.randint(0,2000),populations,100.0,resolution)
+        store.append(detectors,neurons,times+step*100.0)
+        reference.append(np.array([detectors,neurons,times+step*100.0]))
+    store.close()
+    reference = np.concatenate(reference,axis=1)
+    detectors, neurons, times = read_spikes(path)
+    order_reference = np.lexsort(np.around(reference/resolution))
+    order = np.lexsort((detectors,neurons,np.around(times/resolution)))
+    assert np.array_equal(detectors[order],reference[0][order_reference])
+    assert np.array_equal(neurons[order],reference[1][order_reference])
+    assert np.allclose(times[order],reference[2][order_reference])
+    print("store with encoding : OK")
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv)==2:
+        np.random.seed(42)
+        populations = np.array([[1,8000],[8001,10000],[10001,18000],[18001,20000]])
+        check_codec(0,populations,0.1)
+        check_codec(100000,populations,0.1)
+        check_store(sys.argv[1],populations,0.1)
+        print("test spike codec : OK")
+    else:
+        print('missing argument')
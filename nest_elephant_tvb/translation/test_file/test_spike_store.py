@@ -0,0 +1,36 @@
+#  Copyright 2020 Forschungszentrum Jülich GmbH and Aix-Marseille Université
+# "Licensed to the Apache Software Foundation (ASF) under one or more contributor license agreements; and to You under the Apache License, Version 2.0. "
+
+import numpy as np
+import json
+import os
+from nest_elephant_tvb.translation.spike_store import read_spikes
+
+def check_store(path,time_split):
+    '''
+    check the reading of a part of the store of spikes
+    :param path: the folder of the store
+    :param time_split: the time for splitting the reading in two parts
+    :return:
+    '''
+    with open(os.path.join(path,'index.json')) as f:
+        index = json.load(f)
+    print("number of chunks", len(index['chunks']), "number of events", sum([chunk['nb_events'] for chunk in index['chunks']]))
+    detectors, neurons, times = read_spikes(path)
+    assert detectors.shape[0] == sum([chunk['nb_events'] for chunk in index['chunks']])
+    # the times are on the grid of the resolution
+    assert np.allclose(times, np.around(times/index['resolution'])*index['resolution'])
+    # reading two parts gives the same events
+    before = read_spikes(path, t_stop=time_split)
+    after = read_spikes(path, t_start=time_split)
+    assert np.all(before[2] < time_split) and np.all(after[2] >= time_split)
+    for all_values, values_before, values_after in zip((detectors, neurons, times), before, after):
+        assert np.array_equal(np.concatenate((values_before, values_after)), all_values)
+    print("test spike store : OK")
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv)==3:
+        check_store(sys.argv[1],float(sys.argv[2]))
+    else:
+        print('missing argument')
@@ -4,29 +4,87 @@
 import numpy as np
 import os
 from mpi4py import MPI
-from threading import Thread, Lock
-from nest_elephant_tvb.translation.science_tvb_to_nest import generate_data
+from threading import Thread, Condition
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from nest_elephant_tvb.translation.science_tvb_to_nest import generate_data,spike_trains
 import logging
 import json
-import time
 import pathlib
-import copy
 
-lock_status=Lock() # locker for manage the transfer of data from thread
+class StepQueue:
+    def __init__(self,nb_slot):
+        """
+        bounded queue of the steps between the receiving and the sending threads, with an end of stream
+        The receiver can be nb_slot steps in advance of the sender, the threads wait on a condition (no polling).
+        :param nb_slot: the maximum number of steps in the queue
+        """
+        self.nb_slot = nb_slot
+        self.items = deque()
+        self.closed = False
+        self.condition = Condition()
 
-def send(logger,id_first_spike_detector,status_data,buffer_spike, comm):
+    def wait_slot(self):
+        """
+        wait for a free slot in the queue (the sender is late of all the slots)
+        :return: False if the queue is closed
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: len(self.items) < self.nb_slot or self.closed) # FAT END POINT
+            return not self.closed
+
+    def put(self,item):
+        """
+        add a step at the end of the queue, wait if the queue is full
+        :param item: the step
+        :return: False if the queue is closed (the step is dropped)
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: len(self.items) < self.nb_slot or self.closed) # FAT END POINT
+            if self.closed:
+                return False
+            self.items.append(item)
+            self.condition.notify_all()
+            return True
+
+    def get(self):
+        """
+        take the first step of the queue, wait if the queue is empty
+        :return: the step or None at the end of the stream (closed and empty)
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: len(self.items) > 0 or self.closed) # FAT END POINT
+            if len(self.items) == 0:
+                return None
+            item = self.items.popleft()
+            self.condition.notify_all()
+            return item
+
+    def close(self):
+        """
+        end of the stream : no more steps, the steps in the queue can still be taken
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+def send(logger,ids_spike_generator,queue_spike, comm):
     '''
     the sending part of the translator
     :param logger : logger
-    :param nb_spike_generator: the number of spike generator
-    :param status_data: the status of the buffer (SHARED between thread)
-    :param buffer_spike: the buffer which contains the data (SHARED between thread)
+    :param ids_spike_generator: the sorted ids of all the spike generators, in the order of the buffer
+    :param queue_spike: the queue of the steps, each step is the future spike trains of its parts (SHARED between thread)
+                        the spike trains are never modified after the generation : no copy
     :return:
     '''
     # initialisation variable before the loop
     status_ = MPI.Status()
     source_sending = np.arange(0,comm.Get_remote_size(),1) # list of all the process for the communication
     check = np.empty(1,dtype='b')
+    # routing table by NEST rank : ids of its spike generators, their index in the spike trains and the header
+    # (the spike generators of a rank don't change during the simulation)
+    routes = {}
+    spikes_times = None
     while True: # FAT END POINT
         for source in source_sending:
             comm.Recv([check, 1, MPI.CXX_BOOL], source=source, tag=MPI.ANY_TAG, status=status_)
@@ -34,35 +92,37 @@ def send(logger,id_first_spike_detector,status_data,buffer_spike, comm):
         if status_.Get_tag() == 0:
             logger.info(" TVB to Nest: start to send ")
             # wait until the data are ready to use
-            while status_data[0] != 0 and status_data[0] != 2: # FAT END POINT
-                time.sleep(0.001)
-                pass
-            spikes_times = copy.deepcopy(buffer_spike[0])
+            # at the end of TVB, the last spike trains are sent again
+            futures = queue_spike.get() # FAT END POINT
+            if futures is not None:
+                # wait the end of the generation of all the parts in the worker pool
+                if len(futures) == 1:
+                    spikes_times = futures[0].result()
+                else:
+                    spikes_times = spike_trains.concatenate([future.result() for future in futures])
             logger.info(" TVB to Nest: spike time")
-            with lock_status:
-                if status_data[0] != 2:
-                    status_data[0] = 1
             # Waiting for some processus ask for receive the spikes
             for source in source_sending:
                 # receive list ids
                 size_list = np.empty(1, dtype='i')
                 comm.Recv([size_list, 1, MPI.INT], source=source, tag=0, status=status_)
                 if size_list[0] != 0:
-                    list_id = np.empty(size_list, dtype='i')
-                    comm.Recv([list_id, size_list, MPI.INT], source=status_.Get_source(), tag=0, status=status_)
+                    list_id = np.empty(size_list[0], dtype='i')
+                    comm.Recv([list_id, size_list[0], MPI.INT], source=status_.Get_source(), tag=0, status=status_)
                     # Select the good spike train and send it
                     # logger.info(" TVB to Nest:"+str(data))
-                    logger.info("rank "+str(source)+" list_id "+str(list_id))
-                    data = []
-                    shape = []
-                    for i in list_id:
-                        shape += [spikes_times[i-id_first_spike_detector].shape[0]]
-                        data += [spikes_times[i-id_first_spike_detector]]
-                    send_shape = np.array(np.concatenate(([np.sum(shape)],shape)), dtype='i')
+                    if source not in routes or not np.array_equal(routes[source][0], list_id):
+                        # first request of this rank : compute the route
+                        # (the next steps only check that the list of ids is the same)
+                        logger.info("rank "+str(source)+" list_id "+str(list_id))
+                        routes[source] = _route(ids_spike_generator,list_id)
+                    list_id, indexes, consecutive, send_shape = routes[source]
+                    shape, data = spikes_times.select(indexes,consecutive)
+                    send_shape[0] = np.sum(shape)
+                    send_shape[1:] = shape
                     # firstly send the size of the spikes train
                     comm.Send([send_shape, MPI.INT], dest=status_.Get_source(), tag=list_id[0])
                     # secondly send the spikes train
-                    data = np.concatenate(data).astype('d')
                     comm.Send([data, MPI.DOUBLE], dest=source, tag=list_id[0])
             logger.info(" end sending:")
         elif  status_.Get_tag() == 1:
@@ -70,8 +130,7 @@ def send(logger,id_first_spike_detector,status_data,buffer_spike, comm):
             logger.info(" TVB to Nest end sending ")
         elif status_.Get_tag() == 2:
             logger.info(" TVB to Nest end simulation ")
-            with lock_status:
-                status_data[0] = 2
+            queue_spike.close()
             break
         else:
             raise Exception("bad mpi tag : "+str(status_.Get_tag()))
@@ -81,18 +140,56 @@ def send(logger,id_first_spike_detector,status_data,buffer_spike, comm):
     return
 
 
-def receive(logger,generator,status_data,buffer_spike, comm):
+def _route(ids_spike_generator,list_id):
+    '''
+    the route of the spike trains to one NEST rank
+    :param ids_spike_generator: the sorted ids of all the spike generators, in the order of the buffer
+    :param list_id: the ids of the spike generators of the NEST rank
+    :return: the ids, their index in the spike trains, if the index are consecutive and the buffer of the header
+    '''
+    indexes = np.searchsorted(ids_spike_generator,list_id)
+    if np.any(indexes >= ids_spike_generator.shape[0]) or np.any(ids_spike_generator[indexes] != list_id):
+        raise Exception("unknown spike generator : "+str(list_id))
+    consecutive = bool(np.all(np.diff(indexes) == 1))
+    send_shape = np.empty(list_id.shape[0]+1, dtype='i')
+    return list_id, indexes, consecutive, send_shape
+
+
+def _generate(generator,ids_region,parts,pool,count,time_step,rate):
+    '''
+    start the generation of the spike trains of one step in the worker pool
+    The spike generators of each region are split in parts, the result doesn't depend on the split.
+    :param generator : the function to generate rate to spikes
+    :param ids_region : the id of the first spike generator of each region (one region except in multiplex mode)
+    :param parts : the (start,stop) of the spike generators of each part
+    :param pool : the pool of workers
+    :param count: the number of the step
+    :param time_step: the time of the step
+    :param rate: the rates of TVB
+    :return: the future spike trains of each part, in the order of the spike generators
+    '''
+    # the rates of all the regions (nb_step,nb_region)
+    rate = np.reshape(rate,(-1,len(ids_region)))
+    return [pool.submit(generator.generate_spike,count,time_step,rate[:,region],id_region,start,stop)
+            for region,id_region in enumerate(ids_region) for start,stop in parts]
+
+
+def receive(logger,generator,ids_region,parts,pool,queue_spike, comm):
     '''
     the receiving part of the translator
+    The generation of the spike trains is done in the worker pool : the next rates are received during the generation.
     :param logger : logger
     :param generator : the function to generate rate to spikes
-    :param status_data: the status of the buffer (SHARED between thread)
-    :param buffer_spike: the buffer which contains the data (SHARED between thread)
+    :param ids_region : the id of the first spike generator of each region (one region except in multiplex mode)
+    :param parts : the (start,stop) of the spike generators of each part generated by one worker
+    :param pool : the pool of workers for the generation of the spike trains
+    :param queue_spike: the queue of the steps, each step is the future spike trains of its parts (SHARED between thread)
     :return:
     '''
     # Open the MPI port connection
     status_ = MPI.Status()
     source_sending = np.arange(0,comm.Get_remote_size(),1)# list of all the process for the commmunication
+    count = 0
     while True: # FAT END POINT
         # Send to all the confirmation of the processus can send data
         requests=[]
@@ -112,20 +209,15 @@ def receive(logger,generator,status_data,buffer_spike, comm):
             #  Get the rate
             rate = np.empty(size[0], dtype='d')
             comm.Recv([rate, size[0], MPI.DOUBLE], source=status_.Get_source(), tag=0, status=status_)
-            spike_generate = generator.generate_spike(0,time_step,rate)
             logger.info(" TVB to Nest: wait status")
-            # Wait for lock to be set to False
-            while status_data[0] != 1 and status_data[0] != 2:
-                time.sleep(0.001)
-                pass
-            # Set lock to true and put the data in the shared buffer
-            buffer_spike[0] = spike_generate
-            logger.info(" TVB to Nest: update buffer")
-            with lock_status:
-                status_data[0] = 0
+            # the generation starts only when the step has a slot in the queue (no generation after the end of Nest)
+            if queue_spike.wait_slot():
+                # put the future spike trains in the queue
+                queue_spike.put(_generate(generator,ids_region,parts,pool,count,time_step,rate))
+                logger.info(" TVB to Nest: update buffer")
+            count += 1
         elif status_.Get_tag() == 1:
-            with lock_status:
-                status_data[0] = 2
+            queue_spike.close()
             break
         else:
             raise Exception("bad mpi tag"+str(status_.Get_tag()))
@@ -163,7 +255,7 @@ def create_logger(path,name, log_level):
 if __name__ == "__main__":
     import sys
 
-    if len(sys.argv)!=5:
+    if len(sys.argv)<5:
         print('missing argument')
         exit (1)
 
@@ -172,6 +264,13 @@ if __name__ == "__main__":
     id_first_spike_detector = int(sys.argv[2])
     nb_spike_generator = int(sys.argv[3])
     TVB_config = sys.argv[4]
+    # multiplex mode : the first id of the spike generators of the other regions (same number of spike generators)
+    ids_first_spike_generator = [id_first_spike_detector] + [int(id_first) for id_first in sys.argv[5:]]
+    if np.any(np.diff(ids_first_spike_generator) < nb_spike_generator):
+        print('the regions need to be in increasing order of spike generators')
+        exit (1)
+    nb_region = len(ids_first_spike_generator)
+    ids_spike_generator = np.concatenate([np.arange(id_first,id_first+nb_spike_generator) for id_first in ids_first_spike_generator])
 
 
     # object for analysing data
@@ -183,9 +282,13 @@ if __name__ == "__main__":
     logger_master = create_logger(path_config, 'tvb_to_nest_master'+str(id_first_spike_detector), log_level)
 
     # variable for communication between thread
-    status_data=[0]
+    nb_slot = param['nb_slot'] if 'nb_slot' in param.keys() else 2 # number of steps generated in advance
+    nb_worker = param['nb_worker'] if 'nb_worker' in param.keys() else 1 # number of threads for the generation
+    pool = ThreadPoolExecutor(max_workers=nb_worker)
+    queue_spike = StepQueue(nb_slot)
     initialisation =np.load(param['init'])
-    buffer_spike=[initialisation]
+    # the first step is the same initialisation for each region
+    queue_spike.put([pool.submit(spike_trains.from_list,list(initialisation)*nb_region)])
 
     ### Create Com objects for communications
     info = MPI.INFO_NULL
@@ -198,14 +301,14 @@ if __name__ == "__main__":
     logger_master.info('Translate SEND: after open_port : '+port_send)
     path_to_files_sends = []
     path_to_files_sends_unlock = []
-    for i in range(nb_spike_generator):
+    for id_spike_generator in ids_spike_generator:
         # write file with port and unlock
-        path_to_files_send = os.path.join(path_config, str(id_first_spike_detector+i) + ".txt")
+        path_to_files_send = os.path.join(path_config, str(id_spike_generator) + ".txt")
         fport_send = open(path_to_files_send, "w+")
         fport_send.write(port_send)
         fport_send.close()
 
-        path_to_files_send_unlock = os.path.join(path_config, str(id_first_spike_detector+i) + ".txt.unlock")
+        path_to_files_send_unlock = os.path.join(path_config, str(id_spike_generator) + ".txt.unlock")
         pathlib.Path(path_to_files_send_unlock).touch()
         path_to_files_sends.append(path_to_files_send)
         path_to_files_sends_unlock.append(path_to_files_send_unlock)
@@ -239,8 +342,8 @@ if __name__ == "__main__":
     logger_send = create_logger(path_config, 'tvb_to_nest_send'+str(id_first_spike_detector), log_level)
     logger_receive = create_logger(path_config, 'tvb_to_nest_receive'+str(id_first_spike_detector), log_level)
     # create the thread for receive and send data
-    th_send = Thread(target=send, args=(logger_send,id_first_spike_detector,status_data,buffer_spike, comm_send))
-    th_receive = Thread(target=receive, args=(logger_receive,generator,status_data,buffer_spike, comm_receive ))
+    th_send = Thread(target=send, args=(logger_send,ids_spike_generator,queue_spike, comm_send))
+    th_receive = Thread(target=receive, args=(logger_receive,generator,ids_first_spike_generator,generator.split(nb_worker),pool,queue_spike, comm_receive ))
 
     # start the threads
     # FAT END POINT
@@ -249,6 +352,7 @@ if __name__ == "__main__":
     th_send.start()
     th_receive.join()
     th_send.join()
+    pool.shutdown()
     logger_master.info('thread join')
     MPI.Close_port(port_send)
     MPI.Close_port(port_receive)
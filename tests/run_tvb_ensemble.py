@@ -0,0 +1,58 @@
+#  Copyright 2020 Forschungszentrum Jülich GmbH and Aix-Marseille Université
+# "Licensed to the Apache Software Foundation (ASF) under one or more contributor license agreements; and to You under the Apache License, Version 2.0. "
+
+from nest_elephant_tvb.orchestrator.run_exploration import run_exploration_2D
+import numpy as np
+import os
+from example.parameter import test_nest as parameter_test
+
+# File for exploring a simulation with only tvb simulation, the simulations are integrated together in one simulator
+# The exploration changes parameters of TVB : the adaptation of the excitatory population ('b' for b_e) and
+# the global scaling of the coupling ('weight_global' for a)
+
+def run_exploration(path,begin,end):
+    parameter_test.param_co_simulation['nb_MPI_nest']=0
+    run_exploration_2D(path, parameter_test, {'b':[0.0,60.0], 'weight_global': [1.0,2.0]}, begin, end, ensemble=4)
+
+def check_ensemble(path,begin,end):
+    '''
+    compare one simulation of the ensemble with the same simulation alone (run_normal)
+    Without noise and with a fixed initial condition, the results are the same.
+    :param path: the folder of the simulations
+    :param begin: the beginning of the simulations
+    :param end: the end of the simulations
+    '''
+    parameter_test.param_tvb_integrator['nsig']=[0.0,0.0,0.0,0.0,0.0,0.0,0.0]
+    parameter_test.param_tvb_model['initial_condition']={"E": [0.01, 0.01], "I": [0.01, 0.01],
+                                                         "C_ii": [0.0, 0.0], "W_e": [0.0, 0.0], "C_ee": [0.0, 0.0],
+                                                         "C_ei": [0.0, 0.0], "W_i": [0.0, 0.0]}
+    run_exploration(path+'/ensemble/',begin,end)
+    parameter_test.param_co_simulation['nb_MPI_nest']=0
+    run_exploration_2D(path+'/single/', parameter_test, {'b':[60.0], 'weight_global': [2.0]}, begin, end)
+    folder = '_b_60.0_weight_global_2.0/tvb/'
+    # the initial condition
+    assert np.array_equal(np.load(path+'/single/'+folder+'step_init.npy'),
+                          np.load(path+'/ensemble/'+folder+'step_init.npy'))
+    # the results of the monitors
+    files = sorted([name for name in os.listdir(path+'/single/'+folder)
+                    if name.startswith('step_') and name != 'step_init.npy'])
+    assert len(files) > 0
+    for name in files:
+        single = np.load(path+'/single/'+folder+name,allow_pickle=True)
+        ensemble = np.load(path+'/ensemble/'+folder+name,allow_pickle=True)
+        for monitor_single,monitor_ensemble in zip(single,ensemble):
+            for (time_single,data_single),(time_ensemble,data_ensemble) in zip(monitor_single,monitor_ensemble):
+                assert time_single == time_ensemble
+                assert np.allclose(data_single,data_ensemble,rtol=1e-10,atol=0.0)
+    print('ensemble of simulations : the result is the result of run_normal')
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv)==4:
+        run_exploration(sys.argv[1],float(sys.argv[2]),float(sys.argv[3]))
+    elif len(sys.argv)==2 and sys.argv[1]=='check':
+        check_ensemble('./test_file/tvb_ensemble_check/', 0.0, 200.0)
+    elif len(sys.argv)==1:
+        run_exploration( './test_file/tvb_ensemble/', 0.0, 1000.0)
+    else:
+        print('missing argument')
@@ -22,7 +22,7 @@ mkdir ./test_nest_to_save/log/
 DELAY=100.0
 
 # shellcheck disable=SC2089
-parameter='{"param_record_MPI" :{"save_step": 10, "resolution": 0.1, "synch": '"${DELAY}"', "level_log": 0}}'
+parameter='{"param_record_MPI" :{"save_step": 10, "chunk_size": 10000, "resolution": 0.1, "synch": '"${DELAY}"', "level_log": 0}}'
 echo "${parameter}" >./test_nest_to_save/parameter.json
 
 $RUN -n 1 python3 ../nest_elephant_tvb/translation/nest_save_hist.py ./test_nest_to_save/ input/0.txt ./test_nest_to_save/save/test 10000 &
@@ -31,6 +31,9 @@ $RUN -n 1 python3 ../nest_elephant_tvb/translation/test_file/test_input_nest_to_
 
 wait
 
+# read back the store of the spikes
+python3 ../nest_elephant_tvb/translation/test_file/test_spike_store.py ./test_nest_to_save/save/test 5000.0
+
 rm  -rd test_nest_to_save
 
 # return to the calling repertory
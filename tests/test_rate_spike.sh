@@ -0,0 +1,23 @@
+#!/bin/bash
+#  Copyright 2020 Forschungszentrum Jülich GmbH and Aix-Marseille Université
+# "Licensed to the Apache Software Foundation (ASF) under one or more contributor license agreements; and to You under the Apache License, Version 2.0. "
+
+# Test the batched generator of spike trains against elephant
+
+# Script needs to be started from the directory it is located in
+CURRENT_REPERTORY=$(pwd)
+DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
+cd "$DIR" || exit
+
+# configuration variable
+. ./init.sh
+
+mkdir ./test_rate_spike
+mkdir ./test_rate_spike/log/
+
+python3 ../nest_elephant_tvb/translation/test_file/test_rate_spike.py ./test_rate_spike/log/
+
+rm  -rd test_rate_spike
+
+# return to the calling repertory
+cd "${CURRENT_REPERTORY}" || exit
@@ -0,0 +1,18 @@
+#!/bin/bash
+#  Copyright 2020 Forschungszentrum Jülich GmbH and Aix-Marseille Université
+# "Licensed to the Apache Software Foundation (ASF) under one or more contributor license agreements; and to You under the Apache License, Version 2.0. "
+
+# Test the histogram and the moving average of the translation nest to tvb
+
+# Script needs to be started from the directory it is located in
+CURRENT_REPERTORY=$(pwd)
+DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
+cd "$DIR" || exit
+
+# configuration variable
+. ./init.sh
+
+python3 ../nest_elephant_tvb/translation/test_file/test_science_nest_to_tvb.py
+
+# return to the calling repertory
+cd "${CURRENT_REPERTORY}" || exit
@@ -0,0 +1,22 @@
+#!/bin/bash
+#  Copyright 2020 Forschungszentrum Jülich GmbH and Aix-Marseille Université
+# "Licensed to the Apache Software Foundation (ASF) under one or more contributor license agreements; and to You under the Apache License, Version 2.0. "
+
+# Test the encoding of the spikes for the recording
+
+# Script needs to be started from the directory it is located in
+CURRENT_REPERTORY=$(pwd)
+DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
+cd "$DIR" || exit
+
+# configuration variable
+. ./init.sh
+
+mkdir ./test_spike_codec
+
+python3 ../nest_elephant_tvb/translation/test_file/test_spike_codec.py ./test_spike_codec/store/
+
+rm  -rd test_spike_codec
+
+# return to the calling repertory
+cd "${CURRENT_REPERTORY}" || exit
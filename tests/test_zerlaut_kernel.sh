@@ -0,0 +1,18 @@
+#!/bin/bash
+#  Copyright 2020 Forschungszentrum Jülich GmbH and Aix-Marseille Université
+# "Licensed to the Apache Software Foundation (ASF) under one or more contributor license agreements; and to You under the Apache License, Version 2.0. "
+
+# Test the compiled kernels of the Zerlaut model against the reference of numpy
+
+# Script needs to be started from the directory it is located in
+CURRENT_REPERTORY=$(pwd)
+DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
+cd "$DIR" || exit
+
+# configuration variable
+. ./init.sh
+
+python3 ../nest_elephant_tvb/Tvb/test_file/test_zerlaut_kernel.py
+
+# return to the calling repertory
+cd "${CURRENT_REPERTORY}" || exit